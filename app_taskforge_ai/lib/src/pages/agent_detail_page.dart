@@ -1,4 +1,3 @@
-import 'dart:async';
 import 'dart:convert';
 
 import 'package:flutter/material.dart';
@@ -20,12 +19,14 @@ class _AgentDetailPageState extends State<AgentDetailPage> {
   bool _running = false;
   String _status = '';
   String? _result;
-  Timer? _pollTimer;
+  // bumped by every _startPolling and by dispose: only the loop holding the
+  // current generation keeps polling
+  int _pollGeneration = 0;
   int? _executionId;
 
   @override
   void dispose() {
-    _pollTimer?.cancel();
+    _pollGeneration++;
     _inputController.dispose();
     super.dispose();
   }
@@ -93,34 +94,40 @@ class _AgentDetailPageState extends State<AgentDetailPage> {
     }
   }
 
-  void _startPolling(int executionId) {
-    _pollTimer?.cancel();
-    _pollTimer = Timer.periodic(const Duration(seconds: 1), (t) async {
-      final auth = Provider.of<AuthService>(context, listen: false);
-      final api = auth.client;
+  Future<void> _startPolling(int executionId) async {
+    final auth = Provider.of<AuthService>(context, listen: false);
+    final api = auth.client;
+    final generation = ++_pollGeneration;
+    bool isCurrent() => generation == _pollGeneration && mounted;
+    int version = 0;
+    while (isCurrent()) {
       try {
-        final res = await api.get('/executions/$executionId');
+        // long-poll: the server holds the request until the execution changes (or 25 s)
+        final res = await api.get('/executions/$executionId?wait=25&since_version=$version');
+        if (!isCurrent()) return;
         if (res.statusCode == 200) {
           final map = res.body.isNotEmpty ? jsonDecode(res.body) : {};
           final status = map['status'] ?? '';
           final result = map['result'];
+          version = map['version'] ?? version;
           setState(() {
             _status = status;
             if (result != null) _result = result is String ? result : jsonEncode(result);
           });
           if (status == 'completed' || status == 'failed') {
-            _pollTimer?.cancel();
             setState(() {
               _running = false;
             });
+            return;
           }
         } else {
-          // ignore for now
+          await Future.delayed(const Duration(seconds: 1));
         }
       } catch (e) {
-        // ignore polling errors
+        // ignore polling errors, back off a little before retrying
+        await Future.delayed(const Duration(seconds: 1));
       }
-    });
+    }
   }
 
   @override
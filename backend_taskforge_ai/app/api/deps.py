@@ -0,0 +1,154 @@
+"""Shared request dependencies: bearer-token authentication with caching.
+
+Verifying the JWT and loading the user on every request would add a
+signature check plus a DB round-trip to each call, so both steps are
+cached in-process:
+
+- `token_cache`: LRU of verified tokens -> (user id, exp). A hit skips the
+  signature check; an entry is dropped once the token's `exp` passes.
+- `user_cache`: user id -> read-only snapshot of the user, kept for
+  `auth_user_cache_ttl_seconds`. ORM updates/deletes of a `User` invalidate
+  it in this process (`invalidate_user` for bulk UPDATE statements); other
+  processes see the change once their TTL expires.
+
+`get_current_user` requires a token. `get_current_user_id` is for routes
+that used to hard-code user 1: without a token it still falls back to that
+user unless `auth_required` is set.
+"""
+
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import jwt
+from sqlalchemy import event
+
+from ..core.config import settings
+from ..db import models
+from ..db.session import AsyncSessionLocal
+
+bearer = HTTPBearer(auto_error=False)
+
+# usuário usado pelas rotas quando não há token e AUTH_REQUIRED=0 (o antigo `user_id = 1`)
+ANONYMOUS_USER_ID = 1
+
+
+class CurrentUser:
+    """Detached, read-only view of a `User` row (safe to share between requests)."""
+
+    __slots__ = ("id", "email", "display_name", "created_at")
+
+    def __init__(self, user: models.User):
+        self.id = user.id
+        self.email = user.email
+        self.display_name = user.display_name
+        self.created_at = user.created_at
+
+
+class _LRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key, now: float):
+        item = self.entries.get(key)
+        if item is None:
+            self.stats["misses"] += 1
+            return None
+        value, expires_at = item
+        if expires_at <= now:
+            del self.entries[key]
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return value
+
+    def set(self, key, value, expires_at: float):
+        self.entries[key] = (value, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, key):
+        if self.entries.pop(key, None) is not None:
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "entries": len(self.entries), "max_entries": self.max_entries,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0}
+
+
+token_cache = _LRU(settings.auth_token_cache_size)
+user_cache = _LRU(settings.auth_user_cache_size)
+
+
+def verify_token(token: str) -> int:
+    """User id of a valid token; raises 401. Cached until the token's `exp`."""
+    now = time.time()
+    user_id = token_cache.get(token, now)
+    if user_id is not None:
+        return user_id
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=["HS256"])
+        user_id = int(payload.get("sub"))
+    except Exception:
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+    # sem `exp` o token não expira; o LRU ainda limita quanto tempo ele fica aqui
+    token_cache.set(token, user_id, float(payload.get("exp") or "inf"))
+    return user_id
+
+
+async def load_user(user_id: int) -> CurrentUser | None:
+    """User snapshot from the TTL cache, or one primary-key SELECT on a miss."""
+    now = time.monotonic()
+    user = user_cache.get(user_id, now)
+    if user is not None:
+        return user
+    async with AsyncSessionLocal() as db:
+        row = await db.get(models.User, user_id)
+    if row is None:
+        return None
+    user = CurrentUser(row)
+    user_cache.set(user_id, user, now + settings.auth_user_cache_ttl_seconds)
+    return user
+
+
+def invalidate_user(user_id: int):
+    """Drop a cached user after changing its row outside the ORM unit of work."""
+    user_cache.invalidate(user_id)
+
+
+# atualizações/remoções via ORM invalidam sozinhas; UPDATE em massa precisa de invalidate_user()
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _user_changed(mapper, connection, target):
+    invalidate_user(target.id)
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials | None = Depends(bearer)) -> CurrentUser:
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    user = await load_user(verify_token(credentials.credentials))
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found", headers={"WWW-Authenticate": "Bearer"})
+    return user
+
+
+async def get_current_user_id(credentials: HTTPAuthorizationCredentials | None = Depends(bearer)) -> int:
+    """Id of the authenticated user; the anonymous user when no token is sent and auth is optional."""
+    if credentials is None and not settings.auth_required:
+        return ANONYMOUS_USER_ID
+    return (await get_current_user(credentials)).id
+
+
+def snapshot() -> dict:
+    return {"token_cache": token_cache.snapshot(), "user_cache": user_cache.snapshot()}
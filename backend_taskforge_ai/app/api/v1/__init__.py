@@ -1 +1 @@
-from . import auth, users, agents, executions
+from . import auth, users, agents, executions, system, ws
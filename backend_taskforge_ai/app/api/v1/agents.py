@@ -1,41 +1,129 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+import datetime
+from pathlib import Path
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...db import session as db_session
 from ...db import models
-from ...schemas.agent import AgentCreate, AgentOut
+from ...schemas.agent import AgentCreate, AgentOut, ArtifactOut
 from ...services import storage
+from ..deps import get_current_user_id
+from . import pagination
 
 router = APIRouter()
 
+# Starlette >= 0.39 serve Range no FileResponse
+_FILE_RESPONSE_RANGES = hasattr(FileResponse, "_handle_single_range")
+
+
+AGENT_FIELDS = ("id", "name", "description", "owner_id", "created_at")
+
 
 @router.get("/", response_model=list[AgentOut])
-def list_agents(db: Session = Depends(db_session.get_db)):
-    agents = db.query(models.Agent).all()
-    return agents
+async def list_agents(
+    request: Request,
+    owner_id: int | None = None,
+    created_after: datetime.datetime | None = None,
+    created_before: datetime.datetime | None = None,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = None,
+    db: AsyncSession = Depends(db_session.get_async_db),
+):
+    """Newest first, keyset-paginated: follow `X-Next-Cursor` / `Link` for the next page."""
+    selected = pagination.parse_fields(fields, AGENT_FIELDS)
+    stmt = select(models.Agent)
+    if owner_id is not None:
+        stmt = stmt.where(models.Agent.owner_id == owner_id)
+    if created_after is not None:
+        stmt = stmt.where(models.Agent.created_at >= created_after)
+    if created_before is not None:
+        stmt = stmt.where(models.Agent.created_at < created_before)
+    stmt = pagination.keyset_page(stmt, models.Agent, cursor, limit, selected)
+    rows = (await db.execute(stmt)).scalars().all()
+    return pagination.page_response(rows, limit, selected, str(request.url.remove_query_params("cursor")))
 
 
 @router.post("/", response_model=AgentOut)
-def create_agent(agent_in: AgentCreate, db: Session = Depends(db_session.get_db)):
-    # For scaffold, owner_id is fixed to 1 or should be extracted from auth
-    owner_id = 1
+async def create_agent(
+    agent_in: AgentCreate,
+    db: AsyncSession = Depends(db_session.get_async_db),
+    owner_id: int = Depends(get_current_user_id),
+):
     agent = models.Agent(name=agent_in.name, description=agent_in.description, owner_id=owner_id)
     db.add(agent)
-    db.commit()
-    db.refresh(agent)
+    await db.commit()
+    await db.refresh(agent)
     return agent
 
 
-@router.post("/upload")
-def upload_file(file: UploadFile = File(...)):
-    data = file.file.read()
-    filename, url = storage.save_file(file.filename, data)
-    return {"filename": filename, "url": url}
+@router.post("/upload", response_model=ArtifactOut)
+async def upload_file(
+    file: UploadFile = File(...),
+    agent_id: int | None = Form(None),
+    db: AsyncSession = Depends(db_session.get_async_db),
+):
+    """Stream the upload to content-addressed storage and record an `Artifact`."""
+    sha256, size = await storage.save_upload(file)
+    artifact = models.Artifact(
+        agent_id=agent_id,
+        # só para exibição; o caminho no disco vem do hash
+        filename=Path(file.filename or "upload").name,
+        url="",
+        sha256=sha256,
+        size=size,
+        content_type=file.content_type,
+    )
+    db.add(artifact)
+    await db.flush()
+    artifact.url = f"/api/v1/agents/artifacts/{artifact.id}"
+    await db.commit()
+    await db.refresh(artifact)
+    return artifact
+
+
+@router.get("/artifacts/{artifact_id}")
+async def download_artifact(artifact_id: int, request: Request, db: AsyncSession = Depends(db_session.get_async_db)):
+    """Download an artifact; honours a single `Range: bytes=` request (206)."""
+    artifact = await db.get(models.Artifact, artifact_id)
+    if not artifact or not artifact.sha256:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    path = storage.blob_path(artifact.sha256)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Artifact data missing")
+    size = path.stat().st_size
+    media_type = artifact.content_type or "application/octet-stream"
+    # conteúdo endereçado por hash: o próprio hash é um ETag forte
+    headers = {"Accept-Ranges": "bytes", "ETag": f'"{artifact.sha256}"'}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    if _FILE_RESPONSE_RANGES:
+        # Range/If-Range/416 tratados pelo próprio FileResponse; corpo inteiro via sendfile/pathsend
+        # quando o servidor suporta (zero-copy)
+        return FileResponse(path, media_type=media_type, filename=artifact.filename, headers=headers)
+
+    # Starlette antigo: FileResponse ignora Range
+    try:
+        byte_range = storage.parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, filename=artifact.filename, headers=headers)
+
+    start, end = byte_range
+    headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+    return StreamingResponse(
+        storage.iter_file_range(path, start, end), status_code=206, media_type=media_type, headers=headers
+    )
 
 
 @router.get("/{agent_id}", response_model=AgentOut)
-def get_agent(agent_id: int, db: Session = Depends(db_session.get_db)):
-    agent = db.query(models.Agent).get(agent_id)
+async def get_agent(agent_id: int, db: AsyncSession = Depends(db_session.get_async_db)):
+    agent = await db.get(models.Agent, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     return agent
@@ -1,26 +1,40 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt
 import datetime
 
 from ...core.config import settings
+from ...core.security import HashingSaturated, password_hasher
 from ...db import session as db_session
 from ...db import models
-from ...schemas.user import UserCreate, UserOut
+from ...schemas.user import UserCreate
 from ...schemas.auth import Token
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+async def get_password_hash(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HashingSaturated:
+        raise _too_busy()
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
 
+async def verify_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """(valid, new_hash): new_hash when the stored hash uses outdated cost parameters."""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HashingSaturated:
+        raise _too_busy()
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+
+def _too_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many authentication requests, retry shortly",
+        headers={"Retry-After": str(settings.auth_retry_after_seconds)},
+    )
 
 
 def create_access_token(subject: str):
@@ -30,22 +44,31 @@ def create_access_token(subject: str):
 
 
 @router.post("/register", response_model=Token)
-def register(user_in: UserCreate, db: Session = Depends(db_session.get_db)):
-    existing = db.query(models.User).filter(models.User.email == user_in.email).first()
+async def register(user_in: UserCreate, db: AsyncSession = Depends(db_session.get_async_db)):
+    existing = (await db.execute(select(models.User).where(models.User.email == user_in.email))).scalars().first()
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    user = models.User(email=user_in.email, display_name=user_in.display_name or "", hashed_password=get_password_hash(user_in.password))
+    # bcrypt é CPU-bound: roda no pool de processos (429 se saturado)
+    hashed = await get_password_hash(user_in.password)
+    user = models.User(email=user_in.email, display_name=user_in.display_name or "", hashed_password=hashed)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     token = create_access_token(user.id)
     return {"access_token": token, "token_type": "bearer"}
 
 
 @router.post("/login", response_model=Token)
-def login(form_data: UserCreate, db: Session = Depends(db_session.get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.email).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: UserCreate, db: AsyncSession = Depends(db_session.get_async_db)):
+    user = (await db.execute(select(models.User).where(models.User.email == form_data.email))).scalars().first()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    valid, new_hash = await verify_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    if new_hash:
+        # custo do bcrypt mudou: regrava o hash agora que temos a senha em claro
+        await db.execute(update(models.User).where(models.User.id == user.id).values(hashed_password=new_hash))
+        await db.commit()
     token = create_access_token(user.id)
     return {"access_token": token, "token_type": "bearer"}
@@ -1,102 +1,375 @@
 # routes/executions.py
 import asyncio
+import datetime
 import json
-from datetime import datetime
-from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException, Request
-from fastapi.responses import StreamingResponse
+import math
+import time
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import insert, select
+from sqlalchemy.orm import load_only, undefer
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...db import session as db_session
 from ...db import models
-from ...schemas.execution import ExecutionCreate, ExecutionOut
-from ...services.executor_async import enqueue_execution, QUEUES, QUEUES_LOCK
+from ...core.config import settings
+from ...schemas.execution import ExecutionBatchCreate, ExecutionBatchOut, ExecutionCreate, ExecutionOut
+from ...services.broker import get_broker
+from ...services.executor_async import enqueue_execution
+from ...services.multiplex import lookup_streams, merge_streams, persisted_events
+from ...services.notify import agent_executions, execution_changes
+from ...services import search
+from ...services.rate_limit import RateLimited, rate_limiter
+from ...services.storage import load_result_blobs
+from ..deps import get_current_user_id
+from . import pagination
 
 router = APIRouter()
 
+EXECUTION_FIELDS = (
+    "id", "agent_id", "user_id", "status", "input", "result", "created_at", "started_at", "finished_at", "version",
+    "queue_wait_ms", "connect_ms", "ttft_ms", "duration_ms", "output_bytes",
+)
+
+
+async def _admit(user_id: int, cost: int = 1):
+    """Per-user token bucket at admission: 429 with Retry-After when it is empty."""
+    try:
+        await rate_limiter.admit(user_id, cost)
+    except RateLimited as e:
+        headers = {"Retry-After": str(max(1, math.ceil(e.retry_after)))} if e.retry_after > 0 else None
+        raise HTTPException(status_code=429, detail=e.detail, headers=headers)
+
+
 @router.post("/", response_model=ExecutionOut)
-def create_execution(
+async def create_execution(
     payload: ExecutionCreate,
-    background_tasks: BackgroundTasks,
-    db = Depends(db_session.get_db),
+    db: AsyncSession = Depends(db_session.get_async_db),
+    user_id: int = Depends(get_current_user_id),
 ):
-    user_id = 1  # fixo por enquanto
+    await _admit(user_id)
     exe = models.Execution(
         agent_id=payload.agent_id,
         user_id=user_id,
         input=str(payload.input),
         status="queued",
+        options=json.dumps(payload.options()),
     )
     db.add(exe)
-    db.commit()
-    db.refresh(exe)
-
-    # garante fila para streaming
-    import asyncio
-    from ..executor_async import QUEUES, QUEUES_LOCK
-    async def _ensure_queue(eid: int):
-        async with QUEUES_LOCK:
-            if eid not in QUEUES:
-                QUEUES[eid] = asyncio.Queue()
-    # nota: background_tasks aceita coroutine functions; chamar aqui para criar fila imediatamente:
-    background_tasks.add_task(_ensure_queue, exe.id)
-
-    enqueue_execution(background_tasks, exe.id)
+    await db.commit()
+    # input/result são deferred: o refresh precisa citá-los
+    await db.refresh(exe, EXECUTION_FIELDS)
+
+    # a linha `queued` é a fila durável; o scheduler reivindica e executa
+    enqueue_execution(exe.id)
+    agent_executions.publish(exe.agent_id, exe.id)
     return exe
 
+
+def _selected_fields(fields: str | None, include_result: bool) -> tuple[str, ...]:
+    """`?fields=` plus `?include_result=false` (drops `result`, the largest column)."""
+    selected = pagination.parse_fields(fields, EXECUTION_FIELDS)
+    if not include_result:
+        selected = tuple(f for f in selected if f != "result")
+    return selected
+
+
+@router.get("/", response_model=list[ExecutionOut])
+async def list_executions(
+    request: Request,
+    user_id: int | None = None,
+    agent_id: int | None = None,
+    status: str | None = None,
+    created_after: datetime.datetime | None = None,
+    created_before: datetime.datetime | None = None,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = None,
+    include_result: bool = True,
+    db: AsyncSession = Depends(db_session.get_async_db),
+):
+    """Newest first, keyset-paginated; `fields=id,status` or `include_result=false` skip loading input/result."""
+    selected = _selected_fields(fields, include_result)
+    Execution = models.Execution
+    stmt = select(Execution)
+    if user_id is not None:
+        stmt = stmt.where(Execution.user_id == user_id)
+    if agent_id is not None:
+        stmt = stmt.where(Execution.agent_id == agent_id)
+    if status is not None:
+        stmt = stmt.where(Execution.status == status)
+    if created_after is not None:
+        stmt = stmt.where(Execution.created_at >= created_after)
+    if created_before is not None:
+        stmt = stmt.where(Execution.created_at < created_before)
+    stmt = pagination.keyset_page(stmt, Execution, cursor, limit, selected)
+    rows = (await db.execute(stmt)).scalars().all()
+    await load_result_blobs(*rows)
+    return pagination.page_response(rows, limit, selected, str(request.url.remove_query_params("cursor")))
+
+
+@router.get("/search", response_model=list[ExecutionOut])
+async def search_executions(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=500),
+    user_id: int | None = None,
+    agent_id: int | None = None,
+    status: str | None = None,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = None,
+    include_result: bool = True,
+    db: AsyncSession = Depends(db_session.get_async_db),
+):
+    """Full-text search over input and result of finished executions, best match first.
+
+    Every word of `q` must match (`"a phrase"`, `prefix*`). Each item carries
+    a `score` (lower is better); paging and `fields`/`include_result` work as
+    in the listing.
+    """
+    selected = _selected_fields(fields, include_result)
+    after = pagination.decode_score_cursor(cursor) if cursor else None
+    try:
+        hits = await search.search(db, q, limit + 1, after, agent_id=agent_id, user_id=user_id, status=status)
+    except search.SearchUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="q has no searchable words")
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    Execution = models.Execution
+    rows = {}
+    if hits:
+        stmt = (
+            select(Execution)
+            .where(Execution.id.in_([id for id, _ in hits]))
+            .options(load_only(*(getattr(Execution, c) for c in {"id", *selected})))
+        )
+        rows = {exe.id: exe for exe in (await db.execute(stmt)).scalars().all()}
+        await load_result_blobs(*rows.values())
+    body = jsonable_encoder(
+        [{**{f: getattr(rows[id], f) for f in selected}, "score": score} for id, score in hits if id in rows]
+    )
+    headers = {}
+    if has_more:
+        base_url = str(request.url.remove_query_params("cursor"))
+        headers = pagination.next_page_headers(base_url, pagination.encode_score_cursor(hits[-1][1], hits[-1][0]))
+    return JSONResponse(body, headers=headers)
+
+
+@router.post("/batch", response_model=ExecutionBatchOut)
+async def create_execution_batch(
+    payload: ExecutionBatchCreate,
+    db: AsyncSession = Depends(db_session.get_async_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """Insert N executions in one transaction; the scheduler runs them with its usual caps."""
+    if not payload.items:
+        raise HTTPException(status_code=422, detail="Batch is empty")
+    if len(payload.items) > settings.batch_max_items:
+        raise HTTPException(status_code=413, detail=f"Batch larger than {settings.batch_max_items} items")
+    await _admit(user_id, len(payload.items))
+    rows = [
+        {
+            "agent_id": item.agent_id,
+            "user_id": user_id,
+            "input": str(item.input),
+            "status": "queued",
+            "options": json.dumps(item.options()),
+        }
+        for item in payload.items
+    ]
+    result = await db.execute(
+        insert(models.Execution).returning(models.Execution.id, sort_by_parameter_order=True), rows
+    )
+    ids = list(result.scalars().all())
+    await db.commit()
+
+    enqueue_execution(ids[0])
+    for row, execution_id in zip(rows, ids):
+        agent_executions.publish(row["agent_id"], execution_id)
+    return {"ids": ids, "stream_url": "/api/v1/executions/batch/stream?ids=" + ",".join(map(str, ids))}
+
+
+def _batch_frame(execution_id: int, ev, fmt: str) -> str:
+    body = {"execution_id": execution_id, "id": ev.id or None, "event": ev.event or "message", "data": ev.data}
+    if fmt == "ndjson":
+        return json.dumps(body) + "\n"
+    # SSE: `id:` carrega execução e offset para o cliente saber onde parou em cada uma
+    prefix = f"id: {execution_id}:{ev.id}\n" if ev.id else ""
+    return f"{prefix}data: {json.dumps(body)}\n\n"
+
+
+@router.get("/batch/stream")
+async def stream_execution_batch(request: Request, ids: str, format: str = "sse"):
+    """One stream multiplexing every execution of a batch, tagged by execution id.
+
+    `format=sse` (default) or `format=ndjson`. Ends after every execution sent `done`.
+    """
+    if format not in ("sse", "ndjson"):
+        raise HTTPException(status_code=422, detail="format must be sse or ndjson")
+    try:
+        execution_ids = list(dict.fromkeys(int(x) for x in ids.split(",") if x.strip()))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids must be a comma-separated list of integers")
+    if not execution_ids or len(execution_ids) > settings.batch_max_items:
+        raise HTTPException(status_code=422, detail="invalid number of ids")
+
+    finished, missing = await lookup_streams(execution_ids)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Executions not found: {sorted(missing)}")
+    live = [eid for eid in execution_ids if eid not in finished]
+
+    async def generator():
+        for eid, exe in finished.items():
+            for ev in persisted_events(exe):
+                yield _batch_frame(eid, ev, format)
+        if not live:
+            return
+        async for item in merge_streams(live):
+            if await request.is_disconnected():
+                break
+            if item is None:
+                yield ":\n\n" if format == "sse" else "\n"
+                continue
+            yield _batch_frame(item[0], item[1], format)
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+    return StreamingResponse(generator(), media_type=media_type)
+
+
+def _etag(execution_id: int, version: int) -> str:
+    return f'W/"{execution_id}-{version}"'
+
+
+def _etag_version(execution_id: int, if_none_match: str | None) -> int | None:
+    """Version carried by an If-None-Match ETag for this execution, if any."""
+    if not if_none_match:
+        return None
+    prefix = f'W/"{execution_id}-'
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith(prefix) and tag.endswith('"'):
+            try:
+                return int(tag[len(prefix):-1])
+            except ValueError:
+                return None
+    return None
+
+
+async def _execution_version(execution_id: int) -> int | None:
+    async with db_session.AsyncSessionLocal() as db:
+        return (
+            await db.execute(select(models.Execution.version).where(models.Execution.id == execution_id))
+        ).scalar()
+
+
 @router.get("/{execution_id}", response_model=ExecutionOut)
-def get_execution(execution_id: int, db = Depends(db_session.get_db)):
-    exe = db.query(models.Execution).filter(models.Execution.id == execution_id).first()
+async def get_execution(
+    request: Request,
+    response: Response,
+    execution_id: int,
+    wait: float = Query(0, ge=0),
+    since_version: int | None = Query(None),
+    fields: str | None = None,
+    include_result: bool = True,
+    if_none_match: str | None = Header(None),
+):
+    """Execution row, with `ETag: W/"<id>-<version>"`.
+
+    `fields=id,status` returns only those fields and `include_result=false`
+    leaves out `result`; input and result are only read when returned.
+
+    `If-None-Match` with the current ETag returns 304. With `?wait=<seconds>`
+    the request is parked until the version differs from `since_version`
+    (default: the If-None-Match version) or the wait runs out, so clients can
+    long-poll instead of polling every second. Sessions are opened per read,
+    never held while parked.
+    """
+    selected = _selected_fields(fields, include_result)
+    known = _etag_version(execution_id, if_none_match)
+    since = since_version if since_version is not None else known
+    version = None
+    if since is not None:
+        deadline = time.monotonic() + min(wait, settings.execution_longpoll_max_wait)
+        with execution_changes.watching(execution_id):
+            while True:
+                changed = execution_changes.changed(execution_id)
+                version = await _execution_version(execution_id)
+                remaining = deadline - time.monotonic()
+                if version is None or version != since or remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=min(remaining, settings.execution_longpoll_recheck))
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+        if version is None:
+            raise HTTPException(status_code=404, detail="Execution not found")
+        if version == known:
+            return Response(status_code=304, headers={"ETag": _etag(execution_id, version)})
+
+    Execution = models.Execution
+    columns = {"id", "version", *selected}
+    async with db_session.AsyncSessionLocal() as db:
+        exe = await db.get(Execution, execution_id, options=[load_only(*(getattr(Execution, c) for c in columns))])
     if not exe:
         raise HTTPException(status_code=404, detail="Execution not found")
+    await load_result_blobs(exe)
+    headers = {"ETag": _etag(exe.id, exe.version), "Cache-Control": "no-cache"}
+    if selected != EXECUTION_FIELDS:
+        return JSONResponse(jsonable_encoder({f: getattr(exe, f) for f in selected}), headers=headers)
+    response.headers.update(headers)
     return exe
 
+def _finished_events(exe):
+    """SSE frames for a late joiner: the persisted result, then `done`."""
+    for ev in persisted_events(exe):
+        yield ev.sse()
+
+
+def _parse_last_event_id(value: str | None) -> int:
+    try:
+        return max(0, int(value)) if value else 0
+    except ValueError:
+        return 0
+
+
 # SSE streaming endpoint
 @router.get("/{execution_id}/stream")
-async def stream_execution(request: Request, execution_id: int):
-    """Server-Sent Events endpoint. Client should connect with EventSource."""
-    # cria fila se não existir
-    async with QUEUES_LOCK:
-        q = QUEUES.get(execution_id)
-        if q is None:
-            q = asyncio.Queue()
-            QUEUES[execution_id] = q
+async def stream_execution(
+    request: Request,
+    execution_id: int,
+    last_event_id: str | None = Header(None),
+):
+    """Server-Sent Events endpoint. Client should connect with EventSource.
+
+    Frames carry `id:`; reconnecting with `Last-Event-ID` (or `?last_event_id=`)
+    replays everything published after that id that is still buffered.
+    """
+    cursor = _parse_last_event_id(last_event_id or request.query_params.get("last_event_id"))
+    broker = get_broker()
+
+    # sessão curta: não segurar uma conexão do pool durante todo o stream
+    async with db_session.AsyncSessionLocal() as db:
+        exe = await db.get(models.Execution, execution_id, options=[undefer(models.Execution.result)])
+    if not exe:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    await load_result_blobs(exe)
+    if exe.status in ("completed", "failed") and not await broker.has_events(execution_id):
+        return StreamingResponse(_finished_events(exe), media_type="text/event-stream")
 
     async def event_generator():
-        try:
-            while True:
-                # se cliente desconectar, exit
+        async for ev in broker.subscribe(execution_id, cursor):
+            if ev is None:
+                # keep-alive; o StreamingResponse já cancela o gerador quando o cliente sai,
+                # então só checamos desconexão aqui e não a cada evento
                 if await request.is_disconnected():
                     break
-                try:
-                    item = await asyncio.wait_for(q.get(), timeout=25.0)
-                except asyncio.TimeoutError:
-                    # enviar um keep-alive para evitar timeouts intermediários
-                    yield ":\n\n"
-                    continue
-
-                if item == "__DONE__":
-                    # optional: envia evento final e fecha stream
-                    yield f"event: done\ndata: {json.dumps({'finished': True})}\n\n"
-                    break
-
-                # se item for string JSON já, envia como data
-                # escape novas linhas conforme SSE
-                for chunk_line in str(item).splitlines():
-                    yield f"data: {chunk_line}\n"
-                yield "\n"
-
-            # fim
-        finally:
-            # cleanup: remove fila se vazia (não estritamente necessário)
-            async with QUEUES_LOCK:
-                q2 = QUEUES.get(execution_id)
-                if q2 is q:
-                    # se fila vazia, remove
-                    try:
-                        q2.get_nowait()
-                    except Exception:
-                        pass
-                    # não remover imediatamente, executor remove após timeout
-                    # QUEUES.pop(execution_id, None)
-                    pass
+                yield b":\n\n"
+                continue
+            # frame pré-codificado, compartilhado entre todos os assinantes
+            yield ev.sse_bytes()
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
@@ -0,0 +1,81 @@
+import base64
+import datetime
+import json
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def encode_cursor(created_at: datetime.datetime, id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.datetime.fromisoformat(created_at), int(id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_score_cursor(score: float, id: int) -> str:
+    """Cursor for result lists ordered by (score, id), e.g. search hits."""
+    return base64.urlsafe_b64encode(json.dumps([score, id]).encode()).decode().rstrip("=")
+
+
+def decode_score_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        score, id = json.loads(raw)
+        return float(score), int(id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def next_page_headers(base_url: str, next_cursor: str) -> dict[str, str]:
+    sep = "&" if "?" in base_url else "?"
+    return {"X-Next-Cursor": next_cursor, "Link": f'<{base_url}{sep}cursor={next_cursor}>; rel="next"'}
+
+
+def parse_fields(fields: str | None, allowed: tuple[str, ...]) -> tuple[str, ...]:
+    """`?fields=a,b` -> validated tuple; all `allowed` fields when omitted."""
+    if not fields:
+        return allowed
+    wanted = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in wanted if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return wanted
+
+
+def keyset_page(stmt, model, cursor: str | None, limit: int, fields: tuple[str, ...]):
+    """Newest-first keyset pagination on (created_at, id) with column pruning.
+
+    Fetches `limit + 1` rows to know whether there is a next page, and only
+    loads the requested columns (plus the cursor columns).
+    """
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        stmt = stmt.where(
+            or_(model.created_at < created_at, and_(model.created_at == created_at, model.id < id))
+        )
+    columns = {"id", "created_at", *fields}
+    stmt = stmt.options(load_only(*(getattr(model, c) for c in columns)))
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+
+def page_response(rows, limit: int, fields: tuple[str, ...], base_url: str) -> JSONResponse:
+    """JSON list body; the next page is advertised via `X-Next-Cursor` and `Link`."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    body = jsonable_encoder([{f: getattr(row, f) for f in fields} for row in rows])
+    headers = next_page_headers(base_url, encode_cursor(rows[-1].created_at, rows[-1].id)) if has_more else {}
+    return JSONResponse(body, headers=headers)
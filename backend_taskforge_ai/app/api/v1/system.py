@@ -0,0 +1,68 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel, Field
+
+from ...core.security import password_hasher
+from .. import deps
+from ...services import channels, coalesce, metrics
+from ...services.providers import provider_router
+from ...services.result_cache import result_cache
+from ...services.semantic_cache import semantic_cache
+
+# estado interno e controles de runtime: sempre com token, mesmo com AUTH_REQUIRED=0
+router = APIRouter(dependencies=[Depends(deps.get_current_user)])
+
+
+@router.get("/cache")
+async def cache_stats():
+    """Hit/miss/eviction counters of the execution result cache (semantic tier under "semantic")."""
+    return {**result_cache.snapshot(), "semantic": semantic_cache.snapshot()}
+
+
+@router.get("/streams")
+async def stream_stats():
+    """Fragment coalescing counters: fragments in, frames out, frames/s and bytes/frame."""
+    return coalesce.snapshot()
+
+
+@router.get("/channels")
+async def channel_stats():
+    """Live stream channels, buffered bytes against the memory budget, eviction counters."""
+    return channels.snapshot()
+
+
+@router.get("/providers")
+async def provider_stats():
+    """Router ranking, rolling TTFT percentiles/error rate/score per provider:model, HF batching counters."""
+    return provider_router.snapshot()
+
+
+@router.get("/auth")
+async def auth_stats():
+    """Password hashing pool (workers, pending vs capacity, rehash/429 counters) and auth cache hit rates."""
+    return {"hashing": password_hasher.snapshot(), **deps.snapshot()}
+
+
+class ProfilingUpdate(BaseModel):
+    enabled: bool
+    sample_rate: Optional[float] = Field(None, ge=0, le=1)
+
+
+@router.get("/profiling")
+async def profiling_state(limit: int = Query(50, ge=1, le=200)):
+    """Runtime profiling switch and the most recent execution profiles (newest first)."""
+    profiles = list(metrics.recent_profiles)[-limit:][::-1]
+    return {**metrics.profiling, "profiles": profiles}
+
+
+@router.put("/profiling")
+async def set_profiling(payload: ProfilingUpdate):
+    """Turn per-execution profiling on/off at runtime (sampled by `sample_rate`).
+
+    Executions created with `"profile": true` are always profiled.
+    """
+    metrics.profiling["enabled"] = payload.enabled
+    if payload.sample_rate is not None:
+        metrics.profiling["sample_rate"] = payload.sample_rate
+    return metrics.profiling
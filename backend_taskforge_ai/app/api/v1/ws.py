@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from sqlalchemy import select
+
+from ...core.config import settings
+from ...db import models
+from ...db.session import AsyncSessionLocal
+from ...services.broker import get_broker
+from ...services.multiplex import lookup_streams, persisted_events
+from ...services.notify import agent_executions
+
+logger = logging.getLogger("ws")
+
+router = APIRouter()
+
+
+def _event_message(execution_id: int, ev) -> dict:
+    return {"type": "event", "execution_id": execution_id, "id": ev.id or None,
+            "event": ev.event or "message", "data": ev.data}
+
+
+class Connection:
+    """Subscriptions of one WebSocket client.
+
+    Every subscribed execution is pumped from the broker into one bounded
+    send queue drained by a single sender task. When the client reads slowly
+    the queue fills and the pumps wait (the broker's replay buffer holds the
+    backlog), so memory per connection stays bounded.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.ws = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_send_queue)
+        self.streams: dict[int, asyncio.Task] = {}
+        self.agents: set[int] = set()
+
+    async def send(self, message: dict):
+        await self.queue.put(json.dumps(message))
+
+    async def sender(self):
+        try:
+            while True:
+                await self.ws.send_text(await self.queue.get())
+        except WebSocketDisconnect:
+            raise
+        except Exception:
+            # envio falhou: fecha o socket para o loop de recepção terminar também
+            try:
+                await self.ws.close(code=1011)
+            except Exception:
+                pass
+            raise
+
+    async def _pump(self, execution_id: int, last_event_id: int, agent_id: int | None = None):
+        try:
+            if agent_id is not None:
+                await self.send({"type": "execution_created", "agent_id": agent_id, "execution_id": execution_id})
+            async for ev in get_broker().subscribe(execution_id, last_event_id):
+                if ev is not None:
+                    await self.send(_event_message(execution_id, ev))
+        finally:
+            if self.streams.get(execution_id) is asyncio.current_task():
+                del self.streams[execution_id]
+
+    def _start(self, execution_id: int, last_event_id: int = 0, agent_id: int | None = None):
+        self.streams[execution_id] = asyncio.create_task(self._pump(execution_id, last_event_id, agent_id))
+
+    def on_new_execution(self, agent_id: int, execution_id: int):
+        # callback do FeedHub: síncrono, só agenda o pump
+        if execution_id in self.streams or len(self.streams) >= settings.ws_max_subscriptions:
+            return
+        self._start(execution_id, agent_id=agent_id)
+
+    async def subscribe(self, execution_ids: list[int], last_event_ids: dict[int, int]):
+        wanted = [eid for eid in dict.fromkeys(execution_ids) if eid not in self.streams]
+        if len(self.streams) + len(wanted) > settings.ws_max_subscriptions:
+            await self.send({"type": "error", "detail": f"more than {settings.ws_max_subscriptions} subscriptions"})
+            return
+        finished, missing = await lookup_streams(wanted) if wanted else ({}, set())
+        await self.send({"type": "subscribed", "executions": [eid for eid in wanted if eid not in missing],
+                         "missing": sorted(missing)})
+        for eid in wanted:
+            if eid in missing:
+                continue
+            if eid in finished:
+                for ev in persisted_events(finished[eid]):
+                    await self.send(_event_message(eid, ev))
+            else:
+                self._start(eid, last_event_ids.get(eid, 0))
+
+    def unsubscribe(self, execution_ids: list[int]):
+        for eid in execution_ids:
+            task = self.streams.pop(eid, None)
+            if task is not None:
+                task.cancel()
+
+    async def subscribe_agent(self, agent_id: int):
+        if agent_id in self.agents:
+            return
+        self.agents.add(agent_id)
+        agent_executions.add(agent_id, self.on_new_execution)
+        # execuções já em andamento do agente; as novas chegam pelo FeedHub
+        async with AsyncSessionLocal() as db:
+            active = (
+                await db.execute(
+                    select(models.Execution.id)
+                    .where(models.Execution.agent_id == agent_id, models.Execution.status.in_(("queued", "running")))
+                    .order_by(models.Execution.id)
+                )
+            ).scalars().all()
+        await self.send({"type": "subscribed_agent", "agent_id": agent_id})
+        await self.subscribe(list(active), {})
+
+    def unsubscribe_agent(self, agent_id: int):
+        if agent_id in self.agents:
+            self.agents.discard(agent_id)
+            agent_executions.remove(agent_id, self.on_new_execution)
+
+    async def handle(self, message: dict):
+        """Apply one client message; a malformed one raises ValueError (answered with an error frame)."""
+        op = message.get("op")
+        if op in ("subscribe", "unsubscribe"):
+            executions = message.get("executions") or []
+            if not isinstance(executions, list):
+                raise ValueError("executions must be a list of ids")
+            ids = [int(x) for x in executions]
+            agent_id = message.get("agent")
+            if op == "subscribe":
+                last_event_ids = message.get("last_event_ids") or {}
+                if not isinstance(last_event_ids, dict):
+                    raise ValueError("last_event_ids must be an object of execution id -> event id")
+                last_ids = {int(k): int(v) for k, v in last_event_ids.items()}
+                if ids:
+                    await self.subscribe(ids, last_ids)
+                if agent_id is not None:
+                    await self.subscribe_agent(int(agent_id))
+            else:
+                self.unsubscribe(ids)
+                if agent_id is not None:
+                    self.unsubscribe_agent(int(agent_id))
+        else:
+            await self.send({"type": "error", "detail": f"unknown op {op!r}"})
+
+    def close(self):
+        for agent_id in list(self.agents):
+            self.unsubscribe_agent(agent_id)
+        self.unsubscribe(list(self.streams))
+
+
+@router.websocket("/ws")
+async def websocket_streams(websocket: WebSocket):
+    """Many execution streams over one connection.
+
+    Client messages: `{"op": "subscribe", "executions": [1, 2], "last_event_ids": {"1": 5}}`,
+    `{"op": "subscribe", "agent": 3}` (running executions of the agent plus the
+    ones created later) and the matching `"op": "unsubscribe"`. Server
+    messages carry a `type`: `event` (`execution_id`, `id`, `event`, `data`,
+    as in the batch stream), `subscribed`, `subscribed_agent`,
+    `execution_created` and `error`.
+    """
+    await websocket.accept()
+    conn = Connection(websocket)
+    sender = asyncio.create_task(conn.sender())
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+                if not isinstance(message, dict):
+                    raise ValueError("message must be an object")
+                await conn.handle(message)
+            except (ValueError, TypeError) as e:
+                await conn.send({"type": "error", "detail": str(e)})
+            except Exception:
+                # uma mensagem não derruba a conexão nem as outras inscrições
+                logger.exception("[ws] failed to handle %r", text[:200])
+                await conn.send({"type": "error", "detail": "internal error"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        conn.close()
+        sender.cancel()
+        (error,) = await asyncio.gather(sender, return_exceptions=True)
+        if isinstance(error, Exception) and not isinstance(error, WebSocketDisconnect):
+            logger.warning("[ws] sender failed: %r", error)
@@ -9,15 +9,184 @@ class Settings(BaseSettings):
     secret_key: str = "change-me"
     access_token_expire_minutes: int = 60 * 24 * 7
     database_url: str = "sqlite:///./taskforge.db"
+    sqlite_busy_timeout_ms: int = 5000
     storage_path: str = "./storage"
 
+    # Password hashing (bcrypt) in a process pool, off the API threads:
+    # -1 = min(4, CPU count) processes, 0 = worker threads instead of processes.
+    # With workers + max_queue calls pending, auth endpoints answer 429.
+    # Changing the rounds rehashes each password at its next successful login.
+    auth_bcrypt_rounds: int = 12
+    auth_hash_workers: int = -1
+    auth_hash_max_queue: int = 32
+    auth_retry_after_seconds: int = 1
+    # Bearer auth (app/api/deps.py): verified tokens are cached until their
+    # `exp`, users for a short TTL. Without AUTH_REQUIRED, agent/execution
+    # creation falls back to user 1 when no token is sent.
+    auth_required: bool = False
+    auth_token_cache_size: int = 10000
+    auth_user_cache_size: int = 10000
+    auth_user_cache_ttl_seconds: float = 30.0
+
     # Hugging Face / LLM settings
     huggingfacehub_api_token: Optional[str] = None
     hf_model: Optional[str] = None
+    hf_base_url: str = "https://api-inference.huggingface.co"
+    # Micro-batching: concurrent HF calls for the same model are sent as one
+    # request with a list of `inputs`, flushed at `hf_batch_max_size` inputs
+    # or `hf_batch_max_wait_ms` after the first one (max size 1 = off)
+    hf_batch_max_size: int = 8
+    hf_batch_max_wait_ms: float = 10
 
     # Gemini / Google Generative Language settings
     gemini_api_key: Optional[str] = None
     gemini_model: str = "text-bison-001"
+    gemini_base_url: str = "https://generativelanguage.googleapis.com"
+    # (point *_BASE_URL at `python -m benchmarks.mock_provider` for offline load tests)
+
+    # Provider router: rolling TTFT/error stats per provider:model (over
+    # `router_window_seconds`) rank the configured providers. With no output
+    # after the `router_hedge_percentile` TTFT, a hedged second request goes
+    # to the next provider (never the same one, and never for HF, which does
+    # not stream); the first to stream wins.
+    # 5xx/429/connection errors/timeouts before any output fail over.
+    router_window_seconds: float = 300.0
+    router_min_samples: int = 10
+    router_hedge_enabled: bool = True
+    router_hedge_percentile: float = 0.95
+    router_hedge_min_ms: float = 250
+    router_hedge_default_ms: float = 2000  # until there are router_min_samples
+    router_ttft_timeout: float = 30.0  # no output by then = timeout
+    router_max_attempts: int = 3  # requests per execution, hedges included
+    router_eject_error_rate: float = 0.5
+
+    # Shared HTTP client pool for LLM providers (one keep-alive pool per provider)
+    provider_http2: bool = False  # needs the optional `h2` package (`httpx[http2]`)
+    provider_max_connections: int = 100
+    provider_max_keepalive: int = 20
+    provider_keepalive_expiry: float = 30.0
+    provider_connect_timeout: float = 10.0
+    provider_read_timeout: float = 120.0
+    provider_write_timeout: float = 30.0
+    provider_pool_timeout: float = 10.0
+
+    # Execution streams (per-execution broadcast channel with replay buffer)
+    stream_buffer_events: int = 2048
+    stream_retention_seconds: float = 60.0  # keep finished channels around for reconnects
+    stream_buffer_bytes: int = 4 * 1024 * 1024  # per-channel replay buffer cap
+    # subscriber behind the buffer gets an `overflow` event, then:
+    # "drop_oldest" (continue from the oldest buffered event) or "disconnect"
+    stream_overflow_policy: str = "drop_oldest"
+    # all channels of the process; finished channels go first, then big buffers are trimmed
+    stream_memory_budget_bytes: int = 256 * 1024 * 1024
+    stream_idle_ttl_seconds: float = 600.0  # drop channels with no events/subscribers for this long
+    stream_sweep_interval: float = 10.0
+    # Fragment coalescing: text fragments are merged into one event until
+    # `stream_coalesce_bytes` are pending or `stream_coalesce_ms` passed
+    # (0 ms = one event per fragment). Overridable per execution.
+    stream_coalesce_ms: float = 20
+    stream_coalesce_bytes: int = 4096
+
+    # Event broker between executors and stream subscribers: "memory" (single
+    # process), "sqlite" (shared file, no outside service) or "redis"
+    event_broker: str = "memory"
+    broker_sqlite_path: str = "./taskforge_events.db"
+    broker_redis_url: str = "redis://localhost:6379/0"
+    broker_poll_interval: float = 0.05
+    broker_flush_interval: float = 0.005
+    broker_retention_seconds: float = 3600.0
+
+    # Execution persistence: one writer batches row updates into a single
+    # transaction per flush; partial results are checkpointed while streaming
+    persistence_flush_ms: int = 50
+    persistence_max_batch: int = 256
+    persistence_retry_max_seconds: float = 5.0  # backoff cap after a failed flush
+    checkpoint_every_tokens: int = 64
+    checkpoint_every_ms: int = 1000
+
+    # Result cache: exact-match (provider, model, params, normalized input),
+    # memory LRU + on-disk tier under storage_path, plus in-flight coalescing.
+    # Opt-in: generation is sampled (temperature > 0), so with the cache on a
+    # resubmitted input returns the earlier text instead of a new sample.
+    result_cache_enabled: bool = False
+    result_cache_max_entries: int = 1024
+    result_cache_ttl_seconds: float = 3600.0
+    result_cache_disk: bool = True
+    result_cache_max_disk_entries: int = 10000
+
+    # Semantic cache (needs numpy): after an exact miss, an input whose hashed
+    # n-gram vector has cosine similarity >= threshold with an earlier input of
+    # the same agent/provider/model reuses its result. Memory per index is
+    # about entries x dim x 4 bytes; indexes persist under storage_path.
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.9
+    semantic_cache_dim: int = 1024
+    semantic_cache_max_entries_per_agent: int = 2000
+    semantic_cache_max_indexes: int = 32
+    semantic_cache_ttl_seconds: float = 86400.0  # 0 = no expiry
+    semantic_cache_save_interval: float = 60.0
+
+    # Execution payloads (`input`/`result` columns): values of at least
+    # `payload_compress_min_bytes` are stored compressed ("zlib", or "zstd"
+    # with the `zstandard` package); finished results of at least
+    # `payload_offrow_min_bytes` move to storage_path/results (0 = never).
+    payload_compression: str = "zlib"
+    payload_compress_min_bytes: int = 512
+    payload_offrow_min_bytes: int = 64 * 1024
+
+    # Full-text search (GET /api/v1/executions/search): FTS5 on SQLite,
+    # tsvector + GIN on Postgres; executions are indexed when they finish
+    search_enabled: bool = True
+    search_pg_config: str = "simple"  # Postgres text search configuration, e.g. "english"
+    search_index_max_chars: int = 100_000  # per column
+    search_max_candidates: int = 10000  # rank only the newest N matches (0 = all of them)
+
+    # Batch submission (POST /api/v1/executions/batch)
+    batch_max_items: int = 5000
+
+    # GET /api/v1/executions/{id}: ETag on the row version plus ?wait= long-poll.
+    # Parked requests re-read the row every `execution_longpoll_recheck`
+    # seconds to see changes committed by other processes (no notification).
+    execution_longpoll_max_wait: float = 30.0
+    execution_longpoll_recheck: float = 2.0
+
+    # Multiplexed WebSocket (/api/v1/ws): bounded per-connection send queue
+    # (full queue = the connection's streams wait) and subscription cap
+    ws_send_queue: int = 1024
+    ws_max_subscriptions: int = 1000
+
+    # Execution scheduler (worker pool over the `executions` table)
+    scheduler_enabled: bool = True
+    scheduler_workers: int = 8
+    scheduler_provider_concurrency: int = 4
+    scheduler_provider_limits: dict[str, int] = {}  # e.g. {"gemini": 16, "huggingface": 2}
+    scheduler_poll_interval: float = 1.0
+    # Weighted fair queueing across users when claiming queued rows (off =
+    # oldest first). Weights default to 1, e.g. {"7": 2.0} doubles user 7's share.
+    scheduler_fair_queueing: bool = True
+    scheduler_user_weights: dict[int, float] = {}
+    # Leases: a claimed row records its process (`claimed_by`) and the process
+    # renews `heartbeat_at` every `scheduler_heartbeat_interval` seconds. Rows
+    # still `running` whose lease is older than `scheduler_lease_seconds` were
+    # left by a dead process and go back to the queue (checked at startup and
+    # on every heartbeat), so processes sharing a database never requeue each
+    # other's live executions.
+    scheduler_recover_orphans: bool = True
+    scheduler_heartbeat_interval: float = 10.0
+    scheduler_lease_seconds: float = 60.0
+
+    # Rate limits (token buckets, per-minute rates; 0 / absent = unlimited).
+    # Users are limited at admission (POST /executions answers 429 with
+    # Retry-After); providers at dispatch (workers wait for a token). Provider
+    # keys are "gemini" or "gemini:<model>". Backend "memory" (per process) or
+    # "redis" (shared; RATE_LIMIT_REDIS_URL, default BROKER_REDIS_URL).
+    rate_limit_backend: str = "memory"
+    rate_limit_redis_url: Optional[str] = None
+    rate_limit_user_per_minute: float = 0
+    rate_limit_user_burst: int = 20
+    rate_limit_user_overrides: dict[int, float] = {}  # user id -> per-minute rate
+    rate_limit_provider_per_minute: dict[str, float] = {}
+    rate_limit_provider_burst: int = 10
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,141 @@
+"""Password hashing off the event loop and off the API's thread pool.
+
+bcrypt is deliberately slow (~250 ms of CPU per call at the default cost),
+so hashing runs in a small process pool: a login storm then uses those
+processes' cores instead of the threads and GIL shared with every other
+route. Admission is bounded: once `auth_hash_workers + auth_hash_max_queue`
+calls are pending, new ones fail fast with `HashingSaturated` (HTTP 429)
+instead of queueing for seconds. The pool's functions live in this module
+(not under `app.services`) so worker processes import very little.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import anyio
+from passlib.context import CryptContext
+
+from .config import settings
+
+logger = logging.getLogger("security")
+
+_contexts: dict[int, CryptContext] = {}
+
+
+def _context(rounds: int) -> CryptContext:
+    ctx = _contexts.get(rounds)
+    if ctx is None:
+        ctx = _contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    return ctx
+
+
+# ---- executadas nos processos do pool (precisam ser picklable: nível de módulo) ----
+def hash_password(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def verify_and_update(password: str, hashed: str, rounds: int) -> tuple[bool, str | None]:
+    """(valid, new_hash); new_hash is set when `hashed` was made with other cost parameters."""
+    return _context(rounds).verify_and_update(password, hashed)
+
+
+def _warm() -> int:
+    return os.getpid()
+
+
+class HashingSaturated(Exception):
+    """Too many hashing calls pending; the caller should answer 429."""
+
+
+class PasswordHasher:
+    """Bounded process pool for bcrypt hashing/verification.
+
+    `workers=0` keeps the old behaviour (anyio worker threads), still with
+    the same admission limit.
+    """
+
+    def __init__(self, workers: int | None = None, max_queue: int | None = None, rounds: int | None = None):
+        self._workers = workers
+        self._max_queue = max_queue
+        self._rounds = rounds
+        self._pool: ProcessPoolExecutor | None = None
+        self.pending = 0
+        self.stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0, "pool_restarts": 0}
+
+    @property
+    def workers(self) -> int:
+        workers = settings.auth_hash_workers if self._workers is None else self._workers
+        return min(4, os.cpu_count() or 1) if workers < 0 else workers
+
+    @property
+    def capacity(self) -> int:
+        max_queue = settings.auth_hash_max_queue if self._max_queue is None else self._max_queue
+        return max(1, self.workers) + max_queue
+
+    @property
+    def rounds(self) -> int:
+        return settings.auth_bcrypt_rounds if self._rounds is None else self._rounds
+
+    async def start(self):
+        if self.workers > 0 and self._pool is None:
+            self._pool = self._new_pool()
+            # sobe os processos agora para o primeiro login não pagar o spawn
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self._pool, _warm) for _ in range(self.workers)))
+
+    async def stop(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            await anyio.to_thread.run_sync(pool.shutdown)
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: fork de um processo com event loop e threads não é seguro
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(hash_password, password, self.rounds)
+        self.stats["hashed"] += 1
+        return hashed
+
+    async def verify(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        """(valid, new_hash): new_hash is a rehash with the current cost, to be stored."""
+        valid, new_hash = await self._run(verify_and_update, password, hashed, self.rounds)
+        self.stats["verified"] += 1
+        if new_hash:
+            self.stats["rehashed"] += 1
+        return valid, new_hash
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.capacity:
+            self.stats["rejected"] += 1
+            raise HashingSaturated()
+        self.pending += 1
+        try:
+            if self.workers <= 0:
+                return await anyio.to_thread.run_sync(fn, *args)
+            if self._pool is None:
+                await self.start()
+            pool = self._pool
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                # um worker morreu (ex: OOM): recria o pool (uma vez só) e tenta de novo
+                if self._pool is pool:
+                    logger.warning("[security] hashing pool broken, restarting")
+                    self.stats["pool_restarts"] += 1
+                    self._pool = self._new_pool()
+                return await loop.run_in_executor(self._pool, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "workers": self.workers, "pending": self.pending, "capacity": self.capacity,
+                "rounds": self.rounds}
+
+
+password_hasher = PasswordHasher()
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index
+from sqlalchemy.orm import deferred, relationship
 import datetime
 
 from .base import Base
+from .types import CompressedText
 
 
 class User(Base):
@@ -26,6 +27,11 @@ class Agent(Base):
 
     owner = relationship("User")
 
+    __table_args__ = (
+        Index("ix_agents_owner_created", "owner_id", "created_at"),
+        Index("ix_agents_created", "created_at"),
+    )
+
 
 class Execution(Base):
     __tablename__ = "executions"
@@ -34,15 +40,37 @@ class Execution(Base):
     agent_id = Column(Integer, ForeignKey("agents.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     status = Column(String, default="queued")
-    input = Column(Text, nullable=True)
-    result = Column(Text, nullable=True)
+    # payloads comprimidos/fora da linha e só carregados quando pedidos (undefer/load_only)
+    input = deferred(Column(CompressedText, nullable=True))
+    result = deferred(Column(CompressedText, nullable=True))
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     started_at = Column(DateTime, nullable=True)
     finished_at = Column(DateTime, nullable=True)
+    options = Column(Text, nullable=True)  # JSON com opções por request (ex: bypass_cache)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # incrementa a cada UPDATE (ETag / long-poll)
+    # lease do scheduler: quem reivindicou a linha e quando renovou pela última vez
+    claimed_by = Column(String(64), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    # tempos da execução (ms) gravados ao terminar
+    queue_wait_ms = Column(Integer, nullable=True)
+    connect_ms = Column(Integer, nullable=True)  # só quando abriu conexão nova com o provider
+    ttft_ms = Column(Integer, nullable=True)
+    duration_ms = Column(Integer, nullable=True)
+    output_bytes = Column(Integer, nullable=True)
 
     agent = relationship("Agent")
     user = relationship("User")
 
+    # índices para listagem paginada (keyset em created_at, id) com filtros
+    __table_args__ = (
+        Index("ix_executions_user_created", "user_id", "created_at"),
+        Index("ix_executions_agent_status", "agent_id", "status"),
+        Index("ix_executions_agent_created", "agent_id", "created_at"),
+        Index("ix_executions_status_created", "status", "created_at"),
+        Index("ix_executions_status_user", "status", "user_id", "id"),  # fair queueing (fila por usuário)
+        Index("ix_executions_created", "created_at"),
+    )
+
 
 class Artifact(Base):
     __tablename__ = "artifacts"
@@ -51,6 +79,9 @@ class Artifact(Base):
     agent_id = Column(Integer, ForeignKey("agents.id"), nullable=True)
     filename = Column(String, nullable=False)
     url = Column(String, nullable=False)
+    sha256 = Column(String(64), index=True, nullable=True)  # blob content-addressed em storage/blobs
+    size = Column(Integer, nullable=True)
+    content_type = Column(String, nullable=True)
     uploaded_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     agent = relationship("Agent")
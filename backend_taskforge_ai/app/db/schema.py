@@ -0,0 +1,36 @@
+from sqlalchemy import inspect
+
+from .base import Base
+
+
+def add_missing_columns(connection):
+    """Dev helper: `ALTER TABLE ... ADD COLUMN` for model columns missing in an existing DB.
+
+    `create_all` only creates missing tables, so a database created by an
+    older version would otherwise break on new columns. New columns must be
+    nullable or carry a `server_default`, which fills the existing rows. Run
+    with `conn.run_sync(add_missing_columns)` after `create_all`.
+    """
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or column.primary_key:
+                continue
+            ddl = f"{preparer.quote(column.name)} {column.type.compile(dialect=connection.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            connection.exec_driver_sql(f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {ddl}")
+
+
+def create_missing_indexes(connection):
+    """Dev helper: create model indexes that an existing DB does not have yet."""
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
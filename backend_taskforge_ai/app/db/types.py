@@ -0,0 +1,124 @@
+"""`CompressedText`: a TEXT column with transparent compression and off-row blobs.
+
+Stored values are plain text unless they start with a marker:
+
+- `\\x1fz:` / `\\x1fs:` + base85 of the zlib / zstd-compressed UTF-8 text
+  (values of at least `payload_compress_min_bytes`, when that is smaller);
+- `\\x1fb:<sha256>`: the compressed text lives in
+  `storage_path/results/ab/cd/<sha256>` (bind an `OffRow`, see
+  `storage.store_result_blob`);
+- `\\x1fp:` + text: plain text that itself started with the marker.
+
+Rows written before this type existed have no marker and read back as is.
+Off-row values read back as an `OffRow` reference, never as file I/O on
+the event loop: callers swap it for the text with
+`storage.load_result_blobs`, which reads the blob in a worker thread.
+"""
+
+import base64
+import logging
+import zlib
+from pathlib import Path
+
+from sqlalchemy.types import Text, TypeDecorator
+
+from ..core.config import settings
+
+logger = logging.getLogger("db.types")
+
+MARK = "\x1f"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_zstd_missing_logged = False
+
+
+class OffRow:
+    """Reference to a stored result blob: bound to write one, read back in its place."""
+
+    __slots__ = ("sha256",)
+
+    def __init__(self, sha256: str):
+        self.sha256 = sha256
+
+    def __eq__(self, other):
+        return isinstance(other, OffRow) and other.sha256 == self.sha256
+
+    def __hash__(self):
+        return hash(self.sha256)
+
+    def __repr__(self):
+        return f"OffRow({self.sha256!r})"
+
+
+def _zstd():
+    global _zstd_missing_logged
+    try:
+        import zstandard
+    except ImportError:
+        if not _zstd_missing_logged:
+            logger.warning("PAYLOAD_COMPRESSION=zstd but the `zstandard` package is missing; using zlib")
+            _zstd_missing_logged = True
+        return None
+    return zstandard
+
+
+def compress(raw: bytes) -> tuple[str, bytes]:
+    """(tag, compressed bytes) with the configured codec."""
+    if settings.payload_compression == "zstd":
+        zstd = _zstd()
+        if zstd is not None:
+            return "s", zstd.ZstdCompressor(level=3).compress(raw)
+    return "z", zlib.compress(raw, 6)
+
+
+def decompress(data: bytes) -> str:
+    """Either codec; zstd frames are told apart by their magic number."""
+    if data[:4] == _ZSTD_MAGIC:
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+def result_blob_path(sha256: str) -> Path:
+    return Path(settings.storage_path) / "results" / sha256[:2] / sha256[2:4] / sha256
+
+
+def encode_payload(value) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, OffRow):
+        return f"{MARK}b:{value.sha256}"
+    if not isinstance(value, str):
+        value = str(value)
+    raw = value.encode("utf-8")
+    if settings.payload_compress_min_bytes and len(raw) >= settings.payload_compress_min_bytes:
+        tag, packed = compress(raw)
+        encoded = base64.b85encode(packed).decode("ascii")
+        # texto pouco compressível fica como está
+        if len(encoded) + 3 < len(raw):
+            return f"{MARK}{tag}:{encoded}"
+    if value.startswith(MARK):
+        return f"{MARK}p:{value}"
+    return value
+
+
+def decode_payload(value: str | None) -> "str | OffRow | None":
+    if value is None or not value.startswith(MARK) or value[2:3] != ":":
+        return value
+    tag, body = value[1], value[3:]
+    if tag == "p":
+        return body
+    if tag == "b":
+        return OffRow(body)
+    return decompress(base64.b85decode(body))
+
+
+class CompressedText(TypeDecorator):
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return encode_payload(value)
+
+    def process_result_value(self, value, dialect):
+        return decode_payload(value)
@@ -1,11 +1,24 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from .api.v1 import auth, users, agents, executions
+from .api.v1 import auth, users, agents, executions, system, ws
 from .core.config import settings
+from .core.security import password_hasher
 from .db import session as db_session
 from .db import base as db_base
+from .db import schema as db_schema
 from .db import models as db_models
+from .services.broker import get_broker
+from .services.channels import channel_sweeper
+from .services import metrics
+from .services.http_clients import provider_clients
+from .services.providers import hf_batcher
+from .services.persistence import execution_writer
+from .services.rate_limit import rate_limiter
+from .services import search
+from .services.scheduler import scheduler
+from .services.semantic_cache import semantic_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,23 +39,54 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text exposition of the process metrics."""
+    return PlainTextResponse(await metrics.collect(), media_type="text/plain; version=0.0.4")
+
+
 def include_routers(application: FastAPI):
     application.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
     application.include_router(users.router, prefix="/api/v1/users", tags=["users"])
     application.include_router(agents.router, prefix="/api/v1/agents", tags=["agents"])
     application.include_router(executions.router, prefix="/api/v1/executions", tags=["executions"])
+    application.include_router(system.router, prefix="/api/v1/system", tags=["system"])
+    application.include_router(ws.router, prefix="/api/v1", tags=["ws"])
 
 
 include_routers(app)
+metrics.instrument_engine(db_session.async_engine)
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     # Create DB tables for dev if they don't exist
-    db_base.Base.metadata.create_all(bind=db_session.engine)
+    async with db_session.async_engine.begin() as conn:
+        await conn.run_sync(db_base.Base.metadata.create_all)
+        await conn.run_sync(db_schema.add_missing_columns)
+        await conn.run_sync(db_schema.create_missing_indexes)
+        await conn.run_sync(search.create_search_index)
     logger.info("Database tables ensured.")
+    await provider_clients.start()
+    await password_hasher.start()
+    await get_broker().start()
+    await channel_sweeper.start()
+    await execution_writer.start()
+    await semantic_cache.start()
+    if settings.scheduler_enabled:
+        await scheduler.start()
 
 
 @app.on_event("shutdown")
-def on_shutdown():
+async def on_shutdown():
     logger.info("Shutting down application")
+    await scheduler.stop()
+    await execution_writer.stop()
+    await channel_sweeper.stop()
+    await get_broker().stop()
+    await rate_limiter.stop()
+    await hf_batcher.stop()
+    await semantic_cache.stop()
+    await provider_clients.close()
+    await password_hasher.stop()
+    await db_session.async_engine.dispose()
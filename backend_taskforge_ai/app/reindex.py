@@ -0,0 +1,17 @@
+"""Index executions that finished before the full-text index existed: `python -m app.reindex`."""
+
+import asyncio
+
+from .db.session import async_engine
+from .services.search import reindex
+
+
+async def run():
+    try:
+        print(f"indexed {await reindex()} executions")
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -19,3 +19,17 @@ class AgentOut(AgentBase):
 
     class Config:
         orm_mode = True
+
+
+class ArtifactOut(BaseModel):
+    id: int
+    agent_id: Optional[int]
+    filename: str
+    url: str
+    sha256: Optional[str]
+    size: Optional[int]
+    content_type: Optional[str]
+    uploaded_at: datetime.datetime
+
+    class Config:
+        orm_mode = True
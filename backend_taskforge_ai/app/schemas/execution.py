@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Any
 import datetime
 
@@ -6,6 +6,31 @@ import datetime
 class ExecutionCreate(BaseModel):
     agent_id: int
     input: Optional[Any] = None
+    bypass_cache: bool = False
+    # coalescing do stream (None = padrão do servidor; 0 ms = sem coalescing)
+    stream_max_latency_ms: Optional[float] = Field(None, ge=0, le=5000)
+    stream_max_bytes: Optional[int] = Field(None, ge=1)
+    profile: bool = False  # guarda o perfil detalhado desta execução (GET /api/v1/system/profiling)
+
+    def options(self) -> dict:
+        """Per-request options persisted on the execution row."""
+        opts = {"bypass_cache": self.bypass_cache}
+        if self.stream_max_latency_ms is not None:
+            opts["stream_max_latency_ms"] = self.stream_max_latency_ms
+        if self.stream_max_bytes is not None:
+            opts["stream_max_bytes"] = self.stream_max_bytes
+        if self.profile:
+            opts["profile"] = True
+        return opts
+
+
+class ExecutionBatchCreate(BaseModel):
+    items: list[ExecutionCreate]
+
+
+class ExecutionBatchOut(BaseModel):
+    ids: list[int]
+    stream_url: str
 
 
 class ExecutionOut(BaseModel):
@@ -18,6 +43,12 @@ class ExecutionOut(BaseModel):
     created_at: datetime.datetime
     started_at: Optional[datetime.datetime]
     finished_at: Optional[datetime.datetime]
+    version: int
+    queue_wait_ms: Optional[int] = None
+    connect_ms: Optional[int] = None
+    ttft_ms: Optional[int] = None
+    duration_ms: Optional[int] = None
+    output_bytes: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -1,2 +1,3 @@
 from .storage import *
 from .executor_async import *
+from .scheduler import *
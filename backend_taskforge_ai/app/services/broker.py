@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+import anyio
+
+from ..core.config import settings
+from .channels import DONE_DATA, ChannelEvent, get_channel, open_channel, release_channel
+
+logger = logging.getLogger("broker")
+
+
+class EventBroker:
+    """Transport between `process_execution` (publisher) and stream subscribers.
+
+    Event ids are per-execution, start at 1 and are contiguous, so
+    `Last-Event-ID` means the same thing on every backend.
+    """
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, execution_id: int, data: str, event: str | None = None):
+        raise NotImplementedError
+
+    async def close(self, execution_id: int):
+        """Publish the final `done` event for an execution."""
+        await self.publish(execution_id, DONE_DATA, event="done")
+
+    async def has_events(self, execution_id: int) -> bool:
+        """True when the broker still holds (replayable) events for the execution."""
+        raise NotImplementedError
+
+    def subscribe(self, execution_id: int, last_event_id: int = 0, keepalive: float = 25.0):
+        """Async iterator of `ChannelEvent`s (None on keep-alive timeouts), ending after `done`."""
+        raise NotImplementedError
+
+
+class SeqAllocator:
+    """Contiguous per-execution event ids for a publishing process.
+
+    The first id of an execution continues from `lookup()` (the last id already
+    stored, e.g. by an earlier attempt). That lookup awaits, so it runs once per
+    execution under a lock: concurrent first publishes (a coalescer flush racing
+    an error or `close`) never get the same id.
+    """
+
+    def __init__(self):
+        self._seq: dict[int, int] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+
+    def __contains__(self, execution_id: int) -> bool:
+        return execution_id in self._seq
+
+    async def next(self, execution_id: int, lookup) -> int:
+        if execution_id not in self._seq:
+            lock = self._locks.setdefault(execution_id, asyncio.Lock())
+            async with lock:
+                if execution_id not in self._seq:
+                    self._seq[execution_id] = await lookup()
+            self._locks.pop(execution_id, None)
+        # sem await entre ler e gravar: incremento atômico no loop
+        seq = self._seq[execution_id] + 1
+        self._seq[execution_id] = seq
+        return seq
+
+    def forget(self, execution_id: int):
+        self._seq.pop(execution_id, None)
+
+
+class InMemoryBroker(EventBroker):
+    """Process-local broker: publisher and subscribers must share one process."""
+
+    async def publish(self, execution_id: int, data: str, event: str | None = None):
+        open_channel(execution_id).publish(data, event)
+
+    async def close(self, execution_id: int):
+        open_channel(execution_id).close()
+        release_channel(execution_id)
+
+    async def has_events(self, execution_id: int) -> bool:
+        return get_channel(execution_id) is not None
+
+    def subscribe(self, execution_id: int, last_event_id: int = 0, keepalive: float = 25.0):
+        return open_channel(execution_id).subscribe(last_event_id, keepalive)
+
+
+class SQLiteBroker(EventBroker):
+    """Cross-process broker over a shared SQLite file (no outside service).
+
+    Publishes go to the local channel immediately and are written to the
+    events table in small batches by a flusher task. A process that serves a
+    stream it is not executing mirrors the table into a local channel with
+    one polling task per execution, so any number of local subscribers cost
+    a single query per poll interval.
+    """
+
+    def __init__(self, path: str | None = None, poll_interval: float | None = None):
+        self.path = path or settings.broker_sqlite_path
+        self.poll_interval = poll_interval or settings.broker_poll_interval
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._pending: list[tuple] = []
+        self._seq = SeqAllocator()
+        self._mirrors: dict[int, asyncio.Task] = {}
+        self._flusher: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._last_purge = 0.0
+
+    # ---- sync helpers (executados em thread pool) ----
+    def _connect_sync(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS execution_events ("
+            " execution_id INTEGER NOT NULL, seq INTEGER NOT NULL, event TEXT, data TEXT NOT NULL,"
+            " created_at REAL NOT NULL, PRIMARY KEY (execution_id, seq))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_execution_events_created_at ON execution_events (created_at)")
+        return conn
+
+    def _ensure_conn_sync(self):
+        # publish/has_events antes de start() (scripts, testes) abrem a conexão sob demanda
+        if self._conn is None:
+            self._conn = self._connect_sync()
+
+    def _query_sync(self, sql: str, params=()):
+        with self._lock:
+            self._ensure_conn_sync()
+            return self._conn.execute(sql, params).fetchall()
+
+    def _insert_many_sync(self, rows):
+        now = time.time()
+        with self._lock:
+            self._ensure_conn_sync()
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO execution_events (execution_id, seq, event, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                if now - self._last_purge > 60:
+                    self._conn.execute("DELETE FROM execution_events WHERE created_at < ?", (now - settings.broker_retention_seconds,))
+                    self._last_purge = now
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ---- lifecycle ----
+    async def start(self):
+        await anyio.to_thread.run_sync(self._ensure_conn_sync)
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        if self._pending:
+            self._wakeup.set()
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        for task in list(self._mirrors.values()):
+            task.cancel()
+        await self._flush()
+        self._wakeup = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _flush(self):
+        rows, self._pending = self._pending, []
+        if rows:
+            await anyio.to_thread.run_sync(self._insert_many_sync, rows)
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # junta publicações que chegam quase juntas num único INSERT
+            await asyncio.sleep(settings.broker_flush_interval)
+            try:
+                await self._flush()
+            except Exception:
+                logger.exception("[broker] failed to write events")
+
+    # ---- publisher side ----
+    async def _last_seq(self, execution_id: int) -> int:
+        # uma execução re-enfileirada continua a numeração da tentativa anterior,
+        # inclusive eventos ainda não gravados (pendentes ou só no canal local)
+        rows = await anyio.to_thread.run_sync(
+            self._query_sync, "SELECT COALESCE(MAX(seq), 0) FROM execution_events WHERE execution_id = ?", (execution_id,)
+        )
+        channel = get_channel(execution_id)
+        pending = (row[1] for row in self._pending if row[0] == execution_id)
+        return max(rows[0][0], channel.last_id if channel else 0, *pending)
+
+    async def publish(self, execution_id: int, data: str, event: str | None = None):
+        seq = await self._seq.next(execution_id, lambda: self._last_seq(execution_id))
+        open_channel(execution_id).append(seq, data, event)
+        self._pending.append((execution_id, seq, event, data, time.time()))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def close(self, execution_id: int):
+        await self.publish(execution_id, DONE_DATA, event="done")
+        self._seq.forget(execution_id)
+        release_channel(execution_id)
+
+    # ---- subscriber side ----
+    async def has_events(self, execution_id: int) -> bool:
+        if get_channel(execution_id) is not None:
+            return True
+        rows = await anyio.to_thread.run_sync(
+            self._query_sync, "SELECT 1 FROM execution_events WHERE execution_id = ? LIMIT 1", (execution_id,)
+        )
+        return bool(rows)
+
+    def subscribe(self, execution_id: int, last_event_id: int = 0, keepalive: float = 25.0):
+        channel = open_channel(execution_id)
+        if execution_id not in self._seq and execution_id not in self._mirrors and not channel.closed:
+            self._mirrors[execution_id] = asyncio.create_task(self._mirror(channel))
+        return channel.subscribe(last_event_id, keepalive)
+
+    async def _mirror(self, channel):
+        execution_id = channel.execution_id
+        idle_since = None
+        try:
+            while not channel.closed and execution_id not in self._seq:
+                rows = await anyio.to_thread.run_sync(
+                    self._query_sync,
+                    "SELECT seq, event, data FROM execution_events WHERE execution_id = ? AND seq > ? ORDER BY seq LIMIT 1000",
+                    (execution_id, channel.last_id),
+                )
+                for seq, event, data in rows:
+                    channel.append(seq, data, event)
+                if rows:
+                    continue
+                # ninguém mais ouvindo: para de consultar e libera o canal
+                if channel.subscribers == 0:
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since > settings.stream_retention_seconds:
+                        break
+                else:
+                    idle_since = None
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            self._mirrors.pop(execution_id, None)
+            if execution_id not in self._seq:
+                release_channel(execution_id, delay=0 if not channel.closed else None)
+
+
+class RedisBroker(EventBroker):
+    """Cross-process broker over Redis streams (`pip install redis`).
+
+    Each execution is a stream keyed `taskforge:exec:<id>` whose entry ids are
+    `0-<seq>`, so `XREAD` from `0-<Last-Event-ID>` is the replay. Point
+    `BROKER_REDIS_URL` at any Redis-compatible server (or a local stand-in).
+    """
+
+    def __init__(self, url: str | None = None, client=None):
+        if client is None:
+            try:
+                import redis.asyncio as aioredis
+            except ImportError as e:  # pragma: no cover - optional dependency
+                raise RuntimeError("EVENT_BROKER=redis requires the `redis` package") from e
+            client = aioredis.from_url(url or settings.broker_redis_url, decode_responses=True)
+        # `client`: qualquer objeto com a API de redis.asyncio usada aqui (decode_responses=True)
+        self._redis = client
+        self._seq = SeqAllocator()
+
+    @staticmethod
+    def _key(execution_id: int) -> str:
+        return f"taskforge:exec:{execution_id}"
+
+    async def stop(self):
+        await self._redis.aclose()
+
+    async def _last_seq(self, execution_id: int) -> int:
+        last = await self._redis.xrevrange(self._key(execution_id), count=1)
+        return int(last[0][0].split("-")[1]) if last else 0
+
+    async def publish(self, execution_id: int, data: str, event: str | None = None):
+        key = self._key(execution_id)
+        seq = await self._seq.next(execution_id, lambda: self._last_seq(execution_id))
+        await self._redis.xadd(key, {"event": event or "", "data": data}, id=f"0-{seq}", maxlen=settings.stream_buffer_events, approximate=True)
+
+    async def close(self, execution_id: int):
+        await self.publish(execution_id, DONE_DATA, event="done")
+        self._seq.forget(execution_id)
+        await self._redis.expire(self._key(execution_id), int(settings.broker_retention_seconds))
+
+    async def has_events(self, execution_id: int) -> bool:
+        return bool(await self._redis.exists(self._key(execution_id)))
+
+    async def subscribe(self, execution_id: int, last_event_id: int = 0, keepalive: float = 25.0):
+        key = self._key(execution_id)
+        cursor = f"0-{last_event_id}"
+        while True:
+            resp = await self._redis.xread({key: cursor}, count=500, block=int(keepalive * 1000))
+            if not resp:
+                yield None
+                continue
+            for entry_id, fields in resp[0][1]:
+                cursor = entry_id
+                event = fields.get("event") or None
+                yield ChannelEvent(int(entry_id.split("-")[1]), fields.get("data", ""), event)
+                if event == "done":
+                    return
+
+
+_broker: EventBroker | None = None
+
+
+def get_broker() -> EventBroker:
+    global _broker
+    if _broker is None:
+        backend = settings.event_broker
+        if backend == "sqlite":
+            _broker = SQLiteBroker()
+        elif backend == "redis":
+            _broker = RedisBroker()
+        elif backend == "memory":
+            _broker = InMemoryBroker()
+        else:
+            raise RuntimeError(f"unknown EVENT_BROKER {backend!r} (expected memory, sqlite or redis)")
+        logger.info("[broker] using %s backend", backend)
+    return _broker
@@ -0,0 +1,295 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import deque
+
+from ..core.config import settings
+
+logger = logging.getLogger("channels")
+
+DONE_DATA = '{"finished": true}'
+
+
+class ChannelEvent:
+    """One numbered event published on an execution channel."""
+
+    __slots__ = ("id", "event", "data", "_frame")
+
+    def __init__(self, id: int, data: str, event: str | None = None):
+        self.id = id
+        self.data = data
+        self.event = event
+        self._frame: bytes | None = None
+
+    def sse_bytes(self) -> bytes:
+        """`sse()` encoded once and shared by every subscriber of the channel."""
+        if self._frame is None:
+            self._frame = self.sse().encode("utf-8")
+        return self._frame
+
+    def sse(self) -> str:
+        """Render as a Server-Sent Events frame (with `id:` for resume)."""
+        # id 0 = evento sintético (ex: resultado persistido), sem posição para retomar
+        lines = [f"id: {self.id}"] if self.id else []
+        if self.event:
+            lines.append(f"event: {self.event}")
+        # split("\n") em vez de splitlines() para não perder quebras de linha do texto
+        lines.extend(f"data: {line}" for line in str(self.data).split("\n"))
+        return "\n".join(lines) + "\n\n"
+
+
+# sobrecarga aproximada por evento (objeto, frame SSE) além do texto
+EVENT_OVERHEAD = 64
+
+
+def _event_size(ev: ChannelEvent) -> int:
+    return len(ev.data) + EVENT_OVERHEAD
+
+
+# contadores globais dos canais deste processo
+stats = {
+    "buffered_bytes": 0, "evicted_events": 0, "budget_evictions": 0,
+    "overflows": 0, "swept_channels": 0,
+}
+
+
+class ExecutionChannel:
+    """Broadcast channel for one execution with a bounded replay buffer.
+
+    Every subscriber keeps its own cursor into the ring buffer, so all of them
+    see every event, and a reconnecting client can resume from the id it last
+    received. The buffer holds at most `stream_buffer_events` events and
+    `stream_buffer_bytes` bytes; older events are dropped. A subscriber whose
+    cursor falls behind the buffer gets a synthetic `overflow` event with the
+    number of events it missed, then either continues from the oldest event
+    still held (`stream_overflow_policy=drop_oldest`) or is ended
+    (`disconnect`) so the client falls back to the persisted row.
+    """
+
+    def __init__(self, execution_id: int, maxlen: int | None = None, max_bytes: int | None = None):
+        self.execution_id = execution_id
+        self.events: deque[ChannelEvent] = deque()
+        self.maxlen = maxlen or settings.stream_buffer_events
+        self.max_bytes = max_bytes or settings.stream_buffer_bytes
+        self.bytes = 0
+        self.last_id = 0
+        self.closed = False
+        self.subscribers = 0
+        self.last_activity = time.monotonic()
+        self.expires_at: float | None = None
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def trim(self, max_bytes: int) -> int:
+        """Drop oldest events until at most `max_bytes` are buffered (the newest is kept)."""
+        freed = 0
+        while len(self.events) > 1 and self.bytes > max_bytes:
+            size = _event_size(self.events.popleft())
+            self.bytes -= size
+            freed += size
+            stats["evicted_events"] += 1
+        stats["buffered_bytes"] -= freed
+        return freed
+
+    def drop(self):
+        """Release the whole buffer (channel removed from CHANNELS)."""
+        stats["buffered_bytes"] -= self.bytes
+        self.bytes = 0
+        self.events.clear()
+
+    def append(self, id: int, data: str, event: str | None = None) -> ChannelEvent | None:
+        """Add an event with an id assigned elsewhere (e.g. by a broker backend).
+
+        Ids at or below `last_id` are ignored, so a channel can be fed from
+        two sources without duplicating events. A `done` event closes it.
+        """
+        if id <= self.last_id:
+            return None
+        self.last_id = id
+        ev = ChannelEvent(id, data, event)
+        size = _event_size(ev)
+        self.events.append(ev)
+        self.bytes += size
+        stats["buffered_bytes"] += size
+        if len(self.events) > self.maxlen:
+            size = _event_size(self.events.popleft())
+            self.bytes -= size
+            stats["buffered_bytes"] -= size
+            stats["evicted_events"] += 1
+        if self.bytes > self.max_bytes:
+            self.trim(self.max_bytes)
+        if stats["buffered_bytes"] > settings.stream_memory_budget_bytes:
+            enforce_budget()
+        self.last_activity = time.monotonic()
+        if event == "done":
+            self.closed = True
+        self._wake()
+        return ev
+
+    def publish(self, data: str, event: str | None = None) -> ChannelEvent:
+        return self.append(self.last_id + 1, data, event)
+
+    def close(self):
+        """Publish the final `done` event and stop accepting new ones."""
+        if not self.closed:
+            self.publish(DONE_DATA, event="done")
+
+    def _after(self, cursor: int):
+        if not self.events:
+            return []
+        start = max(0, cursor - self.events[0].id + 1)
+        return list(itertools.islice(self.events, start, None))
+
+    async def subscribe(self, last_event_id: int = 0, keepalive: float = 25.0):
+        """Yield events after `last_event_id`; yields None on keep-alive timeouts."""
+        cursor = last_event_id
+        self.subscribers += 1
+        self.last_activity = time.monotonic()
+        try:
+            while True:
+                if self.events and cursor < self.events[0].id - 1:
+                    # o cursor ficou para trás do buffer: avisa quantos eventos se perderam
+                    missed = self.events[0].id - 1 - cursor
+                    stats["overflows"] += 1
+                    yield ChannelEvent(0, json.dumps({"missed": missed}), "overflow")
+                    if settings.stream_overflow_policy == "disconnect":
+                        return
+                    cursor = self.events[0].id - 1
+                for ev in self._after(cursor):
+                    cursor = ev.id
+                    yield ev
+                if self.closed:
+                    return
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self.subscribers -= 1
+            self.last_activity = time.monotonic()
+
+
+# IN-MEMORY pub/sub: execution_id -> ExecutionChannel
+CHANNELS: dict[int, ExecutionChannel] = {}
+
+
+def get_channel(execution_id: int) -> ExecutionChannel | None:
+    return CHANNELS.get(execution_id)
+
+
+def open_channel(execution_id: int) -> ExecutionChannel:
+    channel = CHANNELS.get(execution_id)
+    if channel is None:
+        channel = ExecutionChannel(execution_id)
+        CHANNELS[execution_id] = channel
+    return channel
+
+
+def _remove(execution_id: int):
+    channel = CHANNELS.pop(execution_id, None)
+    if channel is not None:
+        channel.drop()
+
+
+def release_channel(execution_id: int, delay: float | None = None):
+    """Let the sweeper drop a channel after `delay` (default: the replay retention window)."""
+    channel = CHANNELS.get(execution_id)
+    if channel is None:
+        return
+    delay = settings.stream_retention_seconds if delay is None else delay
+    if delay <= 0 and channel.subscribers == 0:
+        _remove(execution_id)
+    else:
+        channel.expires_at = time.monotonic() + delay
+
+
+def enforce_budget():
+    """Bring buffered bytes back under 90% of `stream_memory_budget_bytes`.
+
+    Finished channels without subscribers go first (oldest first), then the
+    largest buffers are trimmed from their oldest events.
+    """
+    target = settings.stream_memory_budget_bytes * 0.9
+    for execution_id, channel in list(CHANNELS.items()):
+        if stats["buffered_bytes"] <= target:
+            return
+        if channel.closed and channel.subscribers == 0:
+            _remove(execution_id)
+            stats["budget_evictions"] += 1
+    for channel in sorted(CHANNELS.values(), key=lambda c: c.bytes, reverse=True):
+        excess = stats["buffered_bytes"] - target
+        if excess <= 0:
+            return
+        if channel.trim(max(0, channel.bytes - excess)):
+            stats["budget_evictions"] += 1
+
+
+def sweep(now: float | None = None) -> int:
+    """Drop released channels past their expiry and idle ones nobody uses."""
+    now = time.monotonic() if now is None else now
+    removed = 0
+    for execution_id, channel in list(CHANNELS.items()):
+        if channel.subscribers:
+            continue
+        expired = channel.expires_at is not None and channel.expires_at <= now
+        idle = now - channel.last_activity > settings.stream_idle_ttl_seconds
+        if expired or idle:
+            _remove(execution_id)
+            removed += 1
+    stats["swept_channels"] += removed
+    return removed
+
+
+def snapshot(top: int = 20) -> dict:
+    """Live channels, buffered events/bytes and the largest buffers."""
+    channels = list(CHANNELS.values())
+    largest = sorted(channels, key=lambda c: c.bytes, reverse=True)[:top]
+    return {
+        **stats,
+        "channels": len(channels),
+        "open_channels": sum(1 for c in channels if not c.closed),
+        "subscribers": sum(c.subscribers for c in channels),
+        "buffered_events": sum(len(c.events) for c in channels),
+        "memory_budget_bytes": settings.stream_memory_budget_bytes,
+        "largest": [
+            {"execution_id": c.execution_id, "events": len(c.events), "bytes": c.bytes,
+             "last_id": c.last_id, "closed": c.closed, "subscribers": c.subscribers}
+            for c in largest
+        ],
+    }
+
+
+class ChannelSweeper:
+    """Background task that runs `sweep()` every `stream_sweep_interval` seconds."""
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.stream_sweep_interval)
+            try:
+                removed = sweep()
+                if removed:
+                    logger.debug("[channels] swept %d channels", removed)
+            except Exception:
+                logger.exception("[channels] sweep failed")
+
+
+channel_sweeper = ChannelSweeper()
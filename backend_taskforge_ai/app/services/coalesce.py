@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+from ..core.config import settings
+
+# contadores globais (todas as execuções deste processo)
+stats = {
+    "fragments": 0, "frames": 0, "bytes": 0,
+    "flush_idle": 0, "flush_latency": 0, "flush_size": 0, "flush_event": 0, "flush_close": 0,
+}
+_started = time.monotonic()
+
+
+def snapshot() -> dict:
+    """Counters plus derived rates: frames/s since start and bytes/fragments per frame."""
+    frames = stats["frames"]
+    elapsed = max(time.monotonic() - _started, 1e-9)
+    return {
+        **stats,
+        "frames_per_sec": round(frames / elapsed, 3),
+        "bytes_per_frame": round(stats["bytes"] / frames, 1) if frames else 0.0,
+        "fragments_per_frame": round(stats["fragments"] / frames, 2) if frames else 0.0,
+    }
+
+
+class CoalescingPublisher:
+    """Merges text fragments of one execution into fewer, larger stream events.
+
+    Sits between the executor and the broker with the same `publish()`
+    signature. Plain text is buffered and published as one event once
+    `max_bytes` are pending or `max_latency_ms` has passed since the first
+    buffered fragment. A fragment that arrives after the stream has been idle
+    for `max_latency_ms` goes out at once, so a slow stream (and the first
+    token) gets no added latency. Named events (errors, results) flush the
+    buffer first to keep ordering. `max_latency_ms=0` disables coalescing.
+    """
+
+    def __init__(self, broker, execution_id: int, max_latency_ms: float | None = None, max_bytes: int | None = None):
+        self.broker = broker
+        self.execution_id = execution_id
+        self.max_latency = (settings.stream_coalesce_ms if max_latency_ms is None else max_latency_ms) / 1000
+        self.max_bytes = settings.stream_coalesce_bytes if max_bytes is None else max_bytes
+        self._parts: list[str] = []
+        self._size = 0
+        self._last_flush = 0.0
+        self._timer: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    async def publish(self, execution_id: int, data: str, event: str | None = None):
+        if event is not None:
+            await self._flush("flush_event")
+            await self._send(data, event)
+            return
+        stats["fragments"] += 1
+        if self.max_latency <= 0:
+            await self._send(data)
+            return
+        idle = not self._parts and time.monotonic() - self._last_flush >= self.max_latency
+        self._parts.append(data)
+        self._size += len(data)
+        if idle:
+            await self._flush("flush_idle")
+        elif self._size >= self.max_bytes:
+            await self._flush("flush_size")
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def close(self):
+        """Flush whatever is still buffered (call before the broker's `close`)."""
+        await self._flush("flush_close")
+        # espera publicações em andamento (ex: o timer) antes do `done`
+        async with self._lock:
+            pass
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_latency)
+        self._timer = None
+        await self._flush("flush_latency")
+
+    async def _flush(self, reason: str):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        if not self._parts:
+            return
+        data = "".join(self._parts)
+        self._parts, self._size = [], 0
+        stats[reason] += 1
+        await self._send(data)
+
+    async def _send(self, data: str, event: str | None = None):
+        # serializa as publicações: o broker numera os eventos na ordem de chegada
+        async with self._lock:
+            await self.broker.publish(self.execution_id, data, event)
+        if event is None:
+            stats["frames"] += 1
+            stats["bytes"] += len(data.encode("utf-8"))
+        self._last_flush = time.monotonic()
@@ -1,236 +1,237 @@
 # executor_async.py
-import asyncio
 import json
 import logging
 from datetime import datetime
-import anyio
-import httpx
+
+from sqlalchemy import update
+from sqlalchemy.orm import undefer
 
 from ..db import models
 from ..core.config import settings
-from ..db.session import SessionLocal
+from ..db.session import AsyncSessionLocal
+from . import metrics
+from .broker import get_broker
+from .coalesce import CoalescingPublisher
+from .notify import execution_changes
+from .persistence import ResultCheckpointer, execution_writer
+from .providers import ProviderError, provider_router
+from .providers.gemini import GEMINI_PARAMS
+from .providers.huggingface import HF_PARAMS
+from .result_cache import cache_key, result_cache
+from .semantic_cache import semantic_cache
+from .storage import load_result_blobs, store_result_blob
 
 logger = logging.getLogger("executor_async")
 
-# IN-MEMORY pub/sub: maps execution_id -> asyncio.Queue[str]
-# (cada item da queue será um fragmento de texto que chegamos do LLM)
-QUEUES: dict[int, asyncio.Queue] = {}
-QUEUES_LOCK = asyncio.Lock()  # protege criação/remoção da fila
+# ---- async DB helpers (sessão curta por chamada, sem thread pool) ----
+async def _fetch_execution(execution_id: int):
+    with metrics.db_timer("fetch"):
+        async with AsyncSessionLocal() as db:
+            exe = await db.get(
+                models.Execution, execution_id,
+                options=[undefer(models.Execution.input), undefer(models.Execution.result)],
+            )
+    if exe is not None:
+        await load_result_blobs(exe)
+    return exe
+
+async def _update_execution(execution_id: int, **fields):
+    """UPDATE direcionado e imediato só com as colunas informadas (sem SELECT + merge)."""
+    with metrics.db_timer("update"):
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(models.Execution)
+                .where(models.Execution.id == execution_id)
+                .values(**fields, version=models.Execution.version + 1)
+            )
+            await db.commit()
+    execution_changes.notify(execution_id)
+
+async def _commit(exe, **extra):
+    """Grava status/resultado (e `extra`) pelo writer em lote e espera o commit."""
+    result = exe.result
+    if exe.status in ("completed", "failed"):
+        execution_writer.stage_search(exe.id, exe.input, exe.result)
+        offrow = settings.payload_offrow_min_bytes
+        if offrow and result and len(result) >= offrow:
+            # resultado final grande sai da linha; checkpoints parciais continuam na coluna
+            result = await store_result_blob(result)
+    with metrics.db_timer("commit"):
+        await execution_writer.write(
+            exe.id, status=exe.status, result=result, started_at=exe.started_at, finished_at=exe.finished_at,
+            **extra,
+        )
 
-def _get_db():
-    return SessionLocal()
 
-# ---- sync DB helpers (executados em thread pool) ----
-def _fetch_execution_sync(execution_id: int):
-    db = _get_db()
+# ---- core async worker ----
+async def process_execution(execution_id: int):
+    """Coroutine que chama o provider (streaming) e publica fragmentos no canal da execução."""
+    token = metrics.current_spans.set(None)
     try:
-        return db.query(models.Execution).filter(models.Execution.id == execution_id).first()
+        await _process_execution(execution_id)
     finally:
-        db.close()
+        metrics.current_spans.reset(token)
 
-def _commit_sync(exe):
-    db = _get_db()
-    try:
-        db.merge(exe)
-        db.commit()
-    finally:
-        db.close()
 
-def _update_status_sync(execution_id: int, **fields):
-    """Atualiza campos simples do registro (rodado em thread)."""
-    db = _get_db()
-    try:
-        exe = db.query(models.Execution).filter(models.Execution.id == execution_id).first()
-        if not exe:
-            return None
-        for k, v in fields.items():
-            setattr(exe, k, v)
-        db.commit()
-        db.refresh(exe)
-        return exe
-    finally:
-        db.close()
+async def _process_execution(execution_id: int):
+    # broker de eventos (memória, sqlite ou redis) entre executor e clientes SSE
+    broker = get_broker()
 
-# ---- core async worker ----
-async def process_execution(execution_id: int):
-    """Coroutine que chama o Gemini (streaming) e publica fragmentos na QUEUE correspondente."""
-    # cria fila se necessário
-    async with QUEUES_LOCK:
-        q = QUEUES.get(execution_id)
-        if q is None:
-            q = asyncio.Queue()
-            QUEUES[execution_id] = q
-
-    # busca execução (sync em thread)
-    exe = await anyio.to_thread.run_sync(_fetch_execution_sync, execution_id)
+    exe = await _fetch_execution(execution_id)
     if not exe:
         logger.warning("[executor] Execution %s not found", execution_id)
-        # assegura remoção da fila se ninguém usar
-        async with QUEUES_LOCK:
-            QUEUES.pop(execution_id, None)
         return
 
-    # marca como running
-    exe.started_at = exe.started_at or datetime.utcnow()
-    exe.status = "running"
-    await anyio.to_thread.run_sync(_commit_sync, exe)
+    # marca como running (o scheduler já faz isso ao reivindicar a linha)
+    if exe.status != "running":
+        exe.started_at = exe.started_at or datetime.utcnow()
+        exe.status = "running"
+        await _commit(exe)
 
     user_input = (exe.input or "").strip()
     if not user_input:
         exe.result = json.dumps({"error": "no input provided"})
         exe.status = "failed"
         exe.finished_at = datetime.utcnow()
-        await anyio.to_thread.run_sync(_commit_sync, exe)
+        await _commit(exe)
         # publica um evento final para quem ouvir
-        await q.put(json.dumps({"type": "error", "text": "no input provided"}))
-        await q.put("__DONE__")
-        async with QUEUES_LOCK:
-            QUEUES.pop(execution_id, None)
+        await broker.publish(execution_id, json.dumps({"type": "error", "text": "no input provided"}), event="error")
+        await broker.close(execution_id)
         return
 
-    # --- Preferência: Gemini streaming (usando streamGenerateContent / generateContentStream endpoints) ---
-    # NOTE: endpoint/exact payload pode variar por versão da API. Ajuste se necessário.
-    GEMINI_KEY = settings.gemini_api_key
-    GEMINI_MODEL = settings.gemini_model or "gemini-2.5"  # substitua conforme config
-
-    if GEMINI_KEY:
-        # Exemplo: usar endpoint "streamGenerateContent" (Vertex / GenAI streaming)
-        # URL e headers podem variar: aqui usamos o endpoint público de GenAI (ajuste conforme tua conta)
-        url = f"https://generativelanguage.googleapis.com/v1/models/{GEMINI_MODEL}:generateContent?key={GEMINI_KEY}"
-        # Alguns endpoints de streaming usam /streamGenerateContent ou streamGenerateContent RPC;
-        # Se for o caso, ajuste a URL de acordo com a doc da sua versão.
-        payload = {
-            "contents": [{"text": user_input}],
-            # parâmetros típicos
-            "temperature": 0.2,
-            "maxOutputTokens": 1024,
-            # "streaming": True  # dependendo da versão; nem sempre necessário
-        }
-
+    options = json.loads(exe.options or "{}")
+    use_cache = settings.result_cache_enabled and not options.get("bypass_cache")
+    provider = current_provider()
+    # tempos da execução: colunas *_ms na linha, histogramas em /metrics e, se perfilada, os passos
+    spans = metrics.ExecutionSpans(execution_id, provider, detailed=metrics.should_profile(options.get("profile", False)))
+    metrics.current_spans.set(spans)
+    params = GEMINI_PARAMS if provider == "gemini" else HF_PARAMS
+    key = cache_key(provider, current_model(), params, user_input)
+
+    # fragmentos viram menos eventos (maiores) antes de chegar ao broker
+    out = CoalescingPublisher(
+        broker, execution_id, options.get("stream_max_latency_ms"), options.get("stream_max_bytes")
+    )
+
+    flight = None
+
+    async def emit(piece: str):
+        spans.output(piece)
+        await out.publish(execution_id, piece)
+        if flight is not None:
+            flight.push(piece)
+
+    if use_cache:
+        leader = result_cache.flights.get(key)
+        cached = None if leader else await result_cache.get(key)
+        leader = leader or result_cache.flights.get(key)
+        if cached is not None:
+            # cache hit: nenhuma chamada upstream
+            await emit(cached)
+            exe.result, exe.status = cached, "completed"
+        elif leader is not None:
+            # execução idêntica já em andamento: segue o stream dela
+            result_cache.stats["coalesced"] += 1
+            async for piece in leader.follow():
+                await emit(piece)
+            exe.result, exe.status = leader.result, leader.status
+            if exe.status not in ("completed", "failed"):
+                # líder interrompido (cancelado) sem estado final: esta execução não pode ficar `running`
+                exe.result = json.dumps({"error": "coalesced execution did not finish", "partial": exe.result})
+                exe.status = "failed"
+        else:
+            flight = result_cache.start_flight(key)
+
+    if not use_cache or flight is not None:
         try:
-            # Usando AsyncClient e stream para iterar por linhas/chunks
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                # Se a API fornece endpoint de streaming específico (ex: streamGenerateContent),
-                # use-o; aqui demonstramos leitura incremental do response.iter_text().
-                async with client.stream("POST", url, json=payload) as resp:
-                    if resp.status_code not in (200, 201):
-                        text = await resp.aread()
-                        err = f"Gemini HTTP {resp.status_code}: {text!r}"
-                        logger.error(err)
-                        await q.put(json.dumps({"type":"error","text": err}))
-                        exe.result = json.dumps({"error": "Gemini HTTP error", "detail": str(resp.status_code)})
-                        exe.status = "failed"
-                        exe.finished_at = datetime.utcnow()
-                        await anyio.to_thread.run_sync(_commit_sync, exe)
-                        await q.put("__DONE__")
-                        async with QUEUES_LOCK:
-                            QUEUES.pop(execution_id, None)
-                        return
-
-                    # processa streaming incremental
-                    buffer = []
-                    async for chunk in resp.aiter_text():
-                        if not chunk:
-                            continue
-                        # chunk pode conter JSON parts or plain text depending on API
-                        # Tentar extrair texto simples; se for json-lines, parsear
-                        text_piece = chunk
-                        # limpa prefixos tipo "data: " (se provider usar SSE style)
-                        for line in text_piece.splitlines():
-                            if not line.strip():
-                                continue
-                            # se for "data: {...}" ou json, tenta extrair
-                            if line.startswith("data:"):
-                                content = line[len("data:"):].strip()
-                                # some providers send "[DONE]"
-                                if content == "[DONE]":
-                                    break
-                                try:
-                                    js = json.loads(content)
-                                except Exception:
-                                    js = content
-                                piece = js if isinstance(js, str) else js.get("text") if isinstance(js, dict) else str(js)
-                                if piece:
-                                    await q.put(piece)
-                                    buffer.append(piece)
-                            else:
-                                # fallback: envia a linha como texto
-                                await q.put(line)
-                                buffer.append(line)
-
-                    # fim do stream
-                    # junta tudo para salvar no DB
-                    full_text = "".join(buffer).strip()
-                    exe.result = full_text or json.dumps({"error": "empty response"})
-                    exe.status = "completed" if full_text else "failed"
-
-        except Exception as e:
-            logger.exception("Gemini streaming failed")
-            await q.put(json.dumps({"type":"error","text": f"exception calling Gemini: {str(e)}"}))
-            exe.result = json.dumps({"error": "exception calling Gemini", "detail": str(e)})
-            exe.status = "failed"
-
-    else:
-        # --- Fallback HuggingFace (simples, não-streaming) ---
-        hf_token = settings.huggingfacehub_api_token
-        hf_model = settings.hf_model
-        if not hf_token or not hf_model:
-            msg = "No LLM provider configured"
-            await q.put(json.dumps({"type":"error","text": msg}))
-            exe.result = json.dumps({"error": msg})
-            exe.status = "failed"
-            exe.finished_at = datetime.utcnow()
-            await anyio.to_thread.run_sync(_commit_sync, exe)
-            await q.put("__DONE__")
-            async with QUEUES_LOCK:
-                QUEUES.pop(execution_id, None)
-            return
-
-        hf_url = f"https://api-inference.huggingface.co/models/{hf_model}"
-        headers = {"Authorization": f"Bearer {hf_token}"}
-        payload = {"inputs": user_input, "parameters": {"max_new_tokens": 200, "temperature": 0.7}}
-        try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                resp = await client.post(hf_url, json=payload, headers=headers)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    if isinstance(data, list) and data and "generated_text" in data[0]:
-                        text = data[0]["generated_text"]
-                        await q.put(text)
-                        exe.result = text
-                        exe.status = "completed"
-                    else:
-                        text = f"unexpected HF response: {data!r}"
-                        await q.put(json.dumps({"type":"error","text": text}))
-                        exe.result = json.dumps({"error": "unexpected HF response", "detail": data})
-                        exe.status = "failed"
-                else:
-                    text = f"HF request failed ({resp.status_code})"
-                    await q.put(json.dumps({"type":"error","text": text}))
-                    exe.result = json.dumps({"error": "HF http error", "status": resp.status_code, "detail": resp.text})
-                    exe.status = "failed"
-        except Exception as e:
-            logger.exception("HF call failed")
-            await q.put(json.dumps({"type":"error","text": f"exception calling HF: {str(e)}"}))
-            exe.result = json.dumps({"error":"exception calling HF", "detail": str(e)})
-            exe.status = "failed"
-
+            probe = None
+            if semantic_cache.enabled and not options.get("bypass_cache"):
+                # o índice é por agente; provider/modelo/params entram como variante
+                variant = cache_key(provider, current_model(), params, "")[:16]
+                probe = await semantic_cache.lookup(exe.agent_id, variant, user_input)
+            if probe is not None and probe.result is not None:
+                # input parecido já respondido: nenhuma chamada upstream
+                await emit(probe.result)
+                exe.result, exe.status = probe.result, "completed"
+            else:
+                await _run_provider(exe, user_input, out, emit)
+                if probe is not None and exe.status == "completed":
+                    semantic_cache.add(probe, exe.result)
+        finally:
+            if flight is not None:
+                result_cache.end_flight(key, flight, exe.status, exe.result)
+        if flight is not None and exe.status == "completed":
+            await result_cache.set(key, exe.result)
+
+    await out.close()
     exe.finished_at = datetime.utcnow()
-    # commit final (sync)
-    await anyio.to_thread.run_sync(_commit_sync, exe)
+    queue_wait_ms = None
+    if exe.started_at and exe.created_at:
+        queue_wait_ms = (exe.started_at - exe.created_at).total_seconds() * 1000
+    # commit final (com os tempos da execução)
+    await _commit(exe, **spans.finish(exe.status, queue_wait_ms))
+
+    # sinaliza finalização para listeners; o broker guarda os eventos um tempo para replay
+    await broker.close(execution_id)
+
+
+async def _run_provider(exe, user_input: str, broker, emit):
+    """Chama o provider escolhido pelo router; preenche exe.result/exe.status (sem commit).
+
+    `broker` só precisa de `publish()` (aqui, o CoalescingPublisher da execução).
+    O router escolhe o provider mais saudável, faz hedge e failover (providers/router.py).
+    """
+    execution_id = exe.id
+    # resultado parcial vai pro banco em checkpoints
+    buffer = ResultCheckpointer(execution_id, execution_writer)
+    stream = provider_router.stream(user_input)
+    finish = usage = None
+    try:
+        async for ev in stream:
+            if ev.kind == "text":
+                await emit(ev.value)
+                buffer.append(ev.value)
+            elif ev.kind == "finish":
+                finish = ev.value
+            elif ev.kind == "usage":
+                usage = ev.value
+    except ProviderError as e:
+        logger.error("[executor] %s: %s (%s) attempts=%s", execution_id, e.message, e.detail, stream.attempts)
+        text = e.message if e.detail is None else f"{e.message}: {e.detail}"
+        await broker.publish(execution_id, json.dumps({"type":"error","text": text}), event="error")
+        exe.result = json.dumps({"error": e.message, "detail": e.detail})
+        exe.status = "failed"
+        return
+    except Exception as e:
+        logger.exception("provider call failed")
+        await broker.publish(execution_id, json.dumps({"type":"error","text": f"exception calling provider: {str(e)}"}), event="error")
+        exe.result = json.dumps({"error": "exception calling provider", "detail": str(e)})
+        exe.status = "failed"
+        return
+    logger.debug("[executor] %s provider=%s finish=%s usage=%s attempts=%s",
+                 execution_id, stream.provider, finish, usage, stream.attempts)
+    spans = metrics.current_spans.get()
+    if spans is not None and stream.provider is not None:
+        spans.provider = stream.provider.name
+
+    # fim do stream: junta tudo para salvar no DB
+    full_text = buffer.text().strip()
+    exe.result = full_text or json.dumps({"error": "empty response"})
+    exe.status = "completed" if full_text else "failed"
 
-    # sinaliza finalização para listeners
-    await q.put("__DONE__")
 
-    # opcional: Retira a fila para liberar memória depois de um tempo
-    async def _cleanup():
-        await asyncio.sleep(2.0)
-        async with QUEUES_LOCK:
-            QUEUES.pop(execution_id, None)
+def current_provider() -> str:
+    """Provider preferido pela config (chave do cache, slots do scheduler); o router pode usar outro."""
+    return "gemini" if settings.gemini_api_key else "huggingface"
 
-    asyncio.create_task(_cleanup())
+
+def current_model() -> str | None:
+    return (settings.gemini_model or "gemini-2.5") if settings.gemini_api_key else settings.hf_model
 
 
 # helper para enfileirar (usado no router)
-def enqueue_execution(background_tasks, execution_id: int):
-    background_tasks.add_task(process_execution, execution_id)
+def enqueue_execution(execution_id: int):
+    """A linha `queued` já está no banco; só acorda os workers do scheduler."""
+    from .scheduler import scheduler
+
+    scheduler.notify()
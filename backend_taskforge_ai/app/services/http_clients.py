@@ -0,0 +1,94 @@
+import logging
+from contextlib import asynccontextmanager
+
+import httpx
+
+from ..core.config import settings
+from . import metrics
+
+logger = logging.getLogger("http_clients")
+
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.provider_max_connections,
+        max_keepalive_connections=settings.provider_max_keepalive,
+        keepalive_expiry=settings.provider_keepalive_expiry,
+    )
+    timeout = httpx.Timeout(
+        connect=settings.provider_connect_timeout,
+        read=settings.provider_read_timeout,
+        write=settings.provider_write_timeout,
+        pool=settings.provider_pool_timeout,
+    )
+    http2 = settings.provider_http2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("PROVIDER_HTTP2 is set but the `h2` package is missing; using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+
+class ProviderClients:
+    """One pooled `httpx.AsyncClient` per LLM provider, owned by the app lifespan.
+
+    Clients are created on first use (or by `start()`) and closed by `close()`.
+    `track()` wraps each upstream call so we can see how close every pool is
+    to saturation.
+    """
+
+    def __init__(self):
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._stats: dict[str, dict[str, int]] = {}
+
+    async def start(self, providers=("gemini", "huggingface")):
+        for name in providers:
+            self.get(name)
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = _build_client()
+            self._clients[provider] = client
+        return client
+
+    def _counters(self, provider: str) -> dict[str, int]:
+        stats = self._stats.get(provider)
+        if stats is None:
+            stats = {"requests": 0, "in_flight": 0, "peak_in_flight": 0, "saturated": 0, "pool_timeouts": 0}
+            self._stats[provider] = stats
+        return stats
+
+    @asynccontextmanager
+    async def track(self, provider: str):
+        stats = self._counters(provider)
+        stats["requests"] += 1
+        if stats["in_flight"] >= settings.provider_max_connections:
+            # esta chamada vai esperar por uma conexão livre no pool
+            stats["saturated"] += 1
+        stats["in_flight"] += 1
+        stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        try:
+            yield
+        except httpx.PoolTimeout:
+            stats["pool_timeouts"] += 1
+            metrics.provider_responses_total.inc(provider=provider, code="exception")
+            raise
+        except Exception:
+            metrics.provider_responses_total.inc(provider=provider, code="exception")
+            raise
+        finally:
+            stats["in_flight"] -= 1
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {name: dict(counters) for name, counters in self._stats.items()}
+
+    async def close(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+provider_clients = ProviderClients()
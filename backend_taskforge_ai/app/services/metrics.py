@@ -0,0 +1,375 @@
+"""Process metrics in Prometheus text format plus per-execution spans.
+
+A tiny registry (counters, gauges, histograms with labels) with no outside
+dependency; `render()` produces the `/metrics` body. `ExecutionSpans` times
+one execution run and is reachable from helpers through the `current_spans`
+context variable, so DB helpers and the upstream HTTP trace hook can record
+into it without threading it through every call.
+"""
+
+import bisect
+import contextvars
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+
+_REGISTRY: list = []
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.925, 0.95, 0.975, 0.99, 1)
+RATE_BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+
+def _escape(value) -> str:
+    """Label value escaping required by the text exposition format: `\\`, `"` and newlines."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labels
+        _REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {v}" for k, v in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.series: dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * (len(self.buckets) + 2)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):  # acima do último limite: só conta em +Inf (= count)
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def _samples(self):
+        lines = []
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _fmt_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _fmt_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            labels = _fmt_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---- métricas da aplicação ----
+executions_total = Counter("taskforge_executions_total", "Finished executions", ("provider", "status"))
+queue_wait_seconds = Histogram("taskforge_execution_queue_wait_seconds", "Time from created_at to started_at")
+ttft_seconds = Histogram("taskforge_execution_ttft_seconds", "Time from start to first output fragment")
+duration_seconds = Histogram("taskforge_execution_duration_seconds", "Execution run time (start to finish)")
+output_bytes_per_second = Histogram(
+    "taskforge_execution_output_bytes_per_second", "Output bytes per second after the first fragment",
+    buckets=RATE_BUCKETS,
+)
+db_call_seconds = Histogram("taskforge_db_call_seconds", "Executor DB helper calls", ("op",), buckets=DB_BUCKETS)
+db_write_seconds = Histogram(
+    "taskforge_db_write_seconds", "INSERT/UPDATE/DELETE statements, including waits for the database write lock",
+    buckets=DB_BUCKETS + (2.5, 5, 10),
+)
+upstream_connect_seconds = Histogram(
+    "taskforge_upstream_connect_seconds", "TCP+TLS connect to a provider (new connections only)", ("provider",)
+)
+upstream_headers_seconds = Histogram(
+    "taskforge_upstream_headers_seconds", "Request sent to response headers received", ("provider",)
+)
+provider_responses_total = Counter(
+    "taskforge_provider_responses_total", "Provider responses by HTTP status (or 'exception')", ("provider", "code")
+)
+rate_limit_decisions = Counter(
+    "taskforge_rate_limit_decisions_total", "Rate limit decisions (user: admission, provider: dispatch)",
+    ("scope", "decision"),
+)
+rate_limit_wait_seconds = Histogram(
+    "taskforge_rate_limit_wait_seconds", "Time workers waited for a provider token", ("provider",)
+)
+hf_batch_size = Histogram("taskforge_hf_batch_size", "Inputs per HF inference request", buckets=BATCH_BUCKETS)
+hf_batch_wait_seconds = Histogram(
+    "taskforge_hf_batch_wait_seconds", "Time an HF input waited for its batch to be sent", buckets=DB_BUCKETS
+)
+router_hedges = Counter("taskforge_router_hedges_total", "Hedged second requests fired", ("provider",))
+router_hedge_wins = Counter("taskforge_router_hedge_wins_total", "Executions won by the hedged request", ("provider",))
+router_failovers = Counter(
+    "taskforge_router_failovers_total", "Failed attempts that moved on to another request", ("provider",)
+)
+semantic_cache_lookups = Counter("taskforge_semantic_cache_lookups_total", "Semantic cache lookups", ("outcome",))
+semantic_cache_lookup_seconds = Histogram(
+    "taskforge_semantic_cache_lookup_seconds", "Semantic cache lookup (embedding + matrix search)", buckets=DB_BUCKETS
+)
+semantic_cache_similarity = Histogram(
+    "taskforge_semantic_cache_similarity", "Best cosine similarity found per lookup on a non-empty index",
+    buckets=SIMILARITY_BUCKETS,
+)
+
+executions_in_flight = Gauge("taskforge_executions_in_flight", "Executions being run by this process")
+queue_depth = Gauge("taskforge_queue_depth", "Executions waiting in the queue (status=queued)")
+queue_users = Gauge("taskforge_queue_users", "Users with queued executions at the last fair-queueing claim")
+stream_channels = Gauge("taskforge_stream_channels", "Live stream channels in this process")
+stream_buffered_bytes = Gauge("taskforge_stream_buffered_bytes", "Bytes held by stream replay buffers")
+threadpool_busy = Gauge("taskforge_threadpool_busy", "Worker threads in use (anyio default limiter)")
+threadpool_size = Gauge("taskforge_threadpool_size", "Worker thread limit (anyio default limiter)")
+provider_in_flight = Gauge("taskforge_provider_in_flight", "Upstream requests in flight", ("provider",))
+provider_pool_timeouts = Gauge("taskforge_provider_pool_timeouts", "Upstream pool timeouts so far", ("provider",))
+router_ttft_p50 = Gauge("taskforge_router_ttft_p50_seconds", "Rolling median TTFT per provider:model", ("provider",))
+router_error_rate = Gauge("taskforge_router_error_rate", "Rolling error rate per provider:model", ("provider",))
+auth_hash_pending = Gauge("taskforge_auth_hash_pending", "Password hashing calls running or queued")
+auth_hash_rejected = Gauge("taskforge_auth_hash_rejected", "Auth requests shed with 429 so far (hashing pool full)")
+semantic_cache_entries = Gauge("taskforge_semantic_cache_entries", "Inputs held by the semantic cache indexes")
+
+
+async def collect() -> str:
+    """Refresh gauges read from other components, then render everything."""
+    import anyio
+    from sqlalchemy import func, select
+
+    from ..core.security import password_hasher
+    from ..db import models
+    from ..db.session import AsyncSessionLocal
+    from . import channels
+    from .http_clients import provider_clients
+    from .providers import provider_router
+    from .scheduler import scheduler
+    from .semantic_cache import semantic_cache
+
+    executions_in_flight.set(len(scheduler.running))
+    async with AsyncSessionLocal() as db:
+        queued = (
+            await db.execute(select(func.count()).select_from(models.Execution).where(models.Execution.status == "queued"))
+        ).scalar()
+    queue_depth.set(queued or 0)
+    stream_channels.set(len(channels.CHANNELS))
+    stream_buffered_bytes.set(channels.stats["buffered_bytes"])
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    threadpool_busy.set(limiter.borrowed_tokens)
+    threadpool_size.set(limiter.total_tokens)
+    for provider, pool in provider_clients.stats().items():
+        provider_in_flight.set(pool.get("in_flight", 0), provider=provider)
+        provider_pool_timeouts.set(pool.get("pool_timeouts", 0), provider=provider)
+    provider_router.refresh_metrics()
+    auth_hash_pending.set(password_hasher.pending)
+    auth_hash_rejected.set(password_hasher.stats["rejected"])
+    semantic_cache_entries.set(semantic_cache.entries())
+    return render()
+
+
+# ---- spans por execução e profiling ----
+current_spans: contextvars.ContextVar = contextvars.ContextVar("current_spans", default=None)
+
+# alterável em runtime (PUT /api/v1/system/profiling)
+profiling = {"enabled": False, "sample_rate": 1.0}
+recent_profiles: deque = deque(maxlen=200)
+_profile_hooks: list = []
+
+
+def add_profile_hook(hook):
+    """Call `hook(profile: dict)` for every profiled execution."""
+    _profile_hooks.append(hook)
+
+
+def remove_profile_hook(hook):
+    if hook in _profile_hooks:
+        _profile_hooks.remove(hook)
+
+
+def should_profile(requested: bool = False) -> bool:
+    if requested:
+        return True
+    return profiling["enabled"] and random.random() < profiling["sample_rate"]
+
+
+class ExecutionSpans:
+    """Timings of one execution run (monotonic clock, ms since start).
+
+    Key marks end up on the Execution row; with `detailed=True` every timed
+    step (DB helpers, upstream connect/headers) is also kept and published
+    as a profile when the run finishes.
+    """
+
+    def __init__(self, execution_id: int, provider: str, detailed: bool = False):
+        self.execution_id = execution_id
+        self.provider = provider
+        self.start = time.monotonic()
+        self.first_output: float | None = None
+        self.connect_ms: float | None = None
+        self.output_bytes = 0
+        self.steps: list | None = [] if detailed else None
+        self._connect_started: float | None = None
+
+    def elapsed_ms(self, at: float | None = None) -> float:
+        return ((at or time.monotonic()) - self.start) * 1000
+
+    def step(self, name: str, seconds: float):
+        if self.steps is not None:
+            self.steps.append({"step": name, "at_ms": round(self.elapsed_ms() - seconds * 1000, 2),
+                               "ms": round(seconds * 1000, 3)})
+
+    def output(self, piece: str):
+        if self.first_output is None:
+            self.first_output = time.monotonic()
+            ttft_seconds.observe(self.first_output - self.start)
+            self.step("first_output", 0)
+        self.output_bytes += len(piece.encode("utf-8"))
+
+    def finish(self, status: str | None, queue_wait_ms: float | None) -> dict:
+        """Observe the histograms and return the columns persisted on the row."""
+        end = time.monotonic()
+        duration = end - self.start
+        duration_seconds.observe(duration)
+        executions_total.inc(provider=self.provider, status=status or "unknown")
+        if queue_wait_ms is not None:
+            queue_wait_seconds.observe(queue_wait_ms / 1000)
+        if self.first_output is not None and end > self.first_output and self.output_bytes:
+            output_bytes_per_second.observe(self.output_bytes / (end - self.first_output))
+        row = {
+            "queue_wait_ms": None if queue_wait_ms is None else int(queue_wait_ms),
+            "connect_ms": None if self.connect_ms is None else int(self.connect_ms),
+            "ttft_ms": None if self.first_output is None else int(self.elapsed_ms(self.first_output)),
+            "duration_ms": int(duration * 1000),
+            "output_bytes": self.output_bytes,
+        }
+        if self.steps is not None:
+            profile = {"execution_id": self.execution_id, "provider": self.provider, "status": status,
+                       **row, "steps": self.steps}
+            recent_profiles.append(profile)
+            for hook in list(_profile_hooks):
+                try:
+                    hook(profile)
+                except Exception:  # hooks não podem derrubar a execução
+                    pass
+        return row
+
+    # hook `trace` do httpx/httpcore (extensions={"trace": ...})
+    async def trace(self, event_name: str, info: dict):
+        # só há eventos connect_* quando o pool abre uma conexão nova
+        now = time.monotonic()
+        if event_name == "connection.connect_tcp.started":
+            self._connect_started = now
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            if self._connect_started is not None:
+                self.connect_ms = (now - self._connect_started) * 1000
+        elif event_name.endswith(".send_request_headers.started") and self._connect_started is not None:
+            seconds = (self.connect_ms or 0) / 1000
+            upstream_connect_seconds.observe(seconds, provider=self.provider)
+            self.step("upstream_connect", seconds)
+            self._connect_started = None
+
+
+_WRITES = ("INSERT", "UPDATE", "DELETE")
+
+
+def instrument_engine(engine):
+    """Time write statements on `engine` (sync or async) into `db_write_seconds`.
+
+    With SQLite the write lock is taken by the first write of a transaction,
+    so time blocked behind another writer (busy_timeout) shows up here.
+    """
+    from sqlalchemy import event
+
+    target = getattr(engine, "sync_engine", engine)
+    if getattr(target, "_taskforge_instrumented", False):
+        return
+    target._taskforge_instrumented = True
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() in _WRITES:
+            conn.info["write_started"] = time.perf_counter()
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("write_started", None)
+        if started is not None:
+            db_write_seconds.observe(time.perf_counter() - started)
+
+    event.listen(target, "before_cursor_execute", before)
+    event.listen(target, "after_cursor_execute", after)
+
+
+def observe_headers(provider: str, seconds: float):
+    """Upstream request sent -> response headers (whole response for non-streaming calls)."""
+    upstream_headers_seconds.observe(seconds, provider=provider)
+    spans = current_spans.get()
+    if spans is not None:
+        spans.step("upstream_headers", seconds)
+
+
+@contextmanager
+def db_timer(op: str):
+    """Time an executor DB helper into the histogram and the current spans."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        db_call_seconds.observe(seconds, op=op)
+        spans = current_spans.get()
+        if spans is not None:
+            spans.step(f"db.{op}", seconds)
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.orm import undefer
+
+from ..db import models
+from ..db.session import AsyncSessionLocal
+from .broker import get_broker
+from .channels import DONE_DATA, ChannelEvent
+from .storage import load_result_blobs
+
+logger = logging.getLogger("multiplex")
+
+FINISHED = ("completed", "failed")
+_END = object()  # fim da assinatura de uma execução (com ou sem `done`)
+
+
+async def lookup_streams(execution_ids) -> tuple[dict[int, models.Execution], set[int]]:
+    """Split ids into finished rows whose events the broker no longer holds, and unknown ids."""
+    broker = get_broker()
+    Execution = models.Execution
+    async with AsyncSessionLocal() as db:
+        rows = (
+            await db.execute(select(Execution.id, Execution.status).where(Execution.id.in_(list(execution_ids))))
+        ).all()
+    done = [id for id, status in rows if status in FINISHED and not await broker.has_events(id)]
+    finished = {}
+    if done:
+        # só as execuções terminadas precisam do resultado
+        async with AsyncSessionLocal() as db:
+            stmt = select(Execution).where(Execution.id.in_(done)).options(undefer(Execution.result))
+            finished = {exe.id: exe for exe in (await db.execute(stmt)).scalars().all()}
+        await load_result_blobs(*finished.values())
+    missing = set(execution_ids) - {id for id, _ in rows}
+    return finished, missing
+
+
+def persisted_events(exe) -> list[ChannelEvent]:
+    """Stand-in events for a late joiner: the stored result, then `done`."""
+    return [
+        ChannelEvent(0, json.dumps({"status": exe.status, "result": exe.result}), "result"),
+        ChannelEvent(0, DONE_DATA, "done"),
+    ]
+
+
+async def merge_streams(execution_ids, last_event_ids: dict[int, int] | None = None, keepalive: float = 25.0,
+                        queue_size: int = 1024):
+    """Multiplex several execution streams into one async iterator.
+
+    Yields `(execution_id, ChannelEvent)` pairs (None on keep-alive timeouts)
+    and ends once every execution's stream has ended (normally after `done`).
+    A stream that fails ends with an `error` event instead of stalling the rest.
+    Each stream is pumped by its own task into one bounded queue, so a slow
+    consumer applies backpressure instead of growing memory; the broker's
+    replay buffer holds whatever the pumps have not read yet.
+    """
+    broker = get_broker()
+    last_event_ids = last_event_ids or {}
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def pump(execution_id: int):
+        ended = True
+        try:
+            async for ev in broker.subscribe(execution_id, last_event_ids.get(execution_id, 0), keepalive):
+                if ev is not None:
+                    await queue.put((execution_id, ev))
+        except asyncio.CancelledError:
+            # o merge já terminou: ninguém mais lê a fila
+            ended = False
+            raise
+        except Exception:
+            logger.exception("[multiplex] stream of execution %s failed", execution_id)
+            await queue.put((execution_id, ChannelEvent(0, json.dumps({"error": "stream failed"}), "error")))
+        finally:
+            # sem o _END o merge esperaria esta execução para sempre (só keep-alives)
+            if ended:
+                await queue.put((execution_id, _END))
+
+    tasks = [asyncio.create_task(pump(eid)) for eid in execution_ids]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if item[1] is _END:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        for t in tasks:
+            t.cancel()
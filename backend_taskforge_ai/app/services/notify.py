@@ -0,0 +1,76 @@
+import asyncio
+from contextlib import contextmanager
+from typing import Callable
+
+
+class ChangeNotifier:
+    """In-process "row changed" wakeups keyed by id.
+
+    Writers call `notify(key)` after committing; readers take `changed(key)`
+    *before* reading the row and wait on it, so a commit that lands between
+    the read and the wait is not missed. Only this process's writes notify —
+    readers in a split API/worker deployment must also re-check on a timer.
+    """
+
+    def __init__(self):
+        self._events: dict[int, asyncio.Event] = {}
+        self._watchers: dict[int, int] = {}
+
+    def notify(self, key: int):
+        event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def changed(self, key: int) -> asyncio.Event:
+        """Event set by the next `notify(key)`."""
+        event = self._events.get(key)
+        if event is None:
+            event = self._events[key] = asyncio.Event()
+        return event
+
+    @contextmanager
+    def watching(self, key: int):
+        """Scope of a reader; drops the key's event once nobody is waiting on it."""
+        self._watchers[key] = self._watchers.get(key, 0) + 1
+        try:
+            yield self
+        finally:
+            remaining = self._watchers[key] - 1
+            if remaining:
+                self._watchers[key] = remaining
+            else:
+                del self._watchers[key]
+                self._events.pop(key, None)
+
+    def watcher_count(self) -> int:
+        return sum(self._watchers.values())
+
+
+class FeedHub:
+    """In-process fan-out of small messages keyed by id (e.g. "agent X got a new execution").
+
+    Listeners are plain `callback(key, message)` functions run synchronously by `publish`, so they must
+    not block; only publishers in this process are seen.
+    """
+
+    def __init__(self):
+        self._listeners: dict[int, set[Callable]] = {}
+
+    def add(self, key: int, callback: Callable):
+        self._listeners.setdefault(key, set()).add(callback)
+
+    def remove(self, key: int, callback: Callable):
+        listeners = self._listeners.get(key)
+        if listeners is not None:
+            listeners.discard(callback)
+            if not listeners:
+                del self._listeners[key]
+
+    def publish(self, key: int, message):
+        for callback in list(self._listeners.get(key, ())):
+            callback(key, message)
+
+
+execution_changes = ChangeNotifier()
+# execution ids published per agent id when an execution is created
+agent_executions = FeedHub()
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import update
+
+from ..core.config import settings
+from ..db import models
+from ..db.session import AsyncSessionLocal
+from . import search
+from .notify import execution_changes
+
+logger = logging.getLogger("persistence")
+
+
+class ExecutionWriter:
+    """Single writer that coalesces execution updates from every running execution.
+
+    `stage()` records fields for a row and returns immediately; `write()` does
+    the same and waits until they are committed. A background task flushes all
+    staged rows in one transaction every `persistence_flush_ms` (or as soon as
+    `persistence_max_batch` rows are pending), and repeated updates to the same
+    row between flushes collapse into one UPDATE. `stage_search()` adds a
+    finished execution to the full-text index in the same transaction. A
+    failed flush keeps its rows staged and is retried with exponential
+    backoff (up to `persistence_retry_max_seconds`).
+    """
+
+    def __init__(self):
+        self._pending: dict[int, dict] = {}
+        self._search: dict[int, tuple[str | None, str | None]] = {}
+        self._waiters: list[asyncio.Future] = []
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    async def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self._flush()
+
+    def stage(self, execution_id: int, **fields):
+        self._pending.setdefault(execution_id, {}).update(fields)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stage_search(self, execution_id: int, input: str | None, result: str | None):
+        """Index `input`/`result` with the next flush (no-op without a search index)."""
+        if search.enabled():
+            self._search[execution_id] = (input, result)
+
+    async def write(self, execution_id: int, **fields):
+        """Stage `fields` and wait for the flush that commits them."""
+        self.stage(execution_id, **fields)
+        if self._task is None:
+            # writer não iniciado (script/teste): grava direto
+            await self._flush()
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        await fut
+
+    async def _run(self):
+        backoff = 0.0
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if backoff:
+                await asyncio.sleep(backoff)
+            elif len(self._pending) < settings.persistence_max_batch:
+                # dá tempo para outras execuções entrarem no mesmo lote
+                await asyncio.sleep(settings.persistence_flush_ms / 1000)
+            try:
+                await self._flush()
+                backoff = 0.0
+            except Exception:
+                logger.exception("[persistence] flush failed")
+                # o lote voltou para _pending: tenta de novo sem esperar outro stage()
+                backoff = min(max(2 * backoff, settings.persistence_flush_ms / 1000, 0.01),
+                              settings.persistence_retry_max_seconds)
+                self._wakeup.set()
+
+    async def _flush(self):
+        batch, self._pending = self._pending, {}
+        to_index, self._search = self._search, {}
+        waiters, self._waiters = self._waiters, []
+        try:
+            if batch or to_index:
+                async with AsyncSessionLocal() as db:
+                    for execution_id, fields in batch.items():
+                        await db.execute(
+                            update(models.Execution)
+                            .where(models.Execution.id == execution_id)
+                            .values(**fields, version=models.Execution.version + 1)
+                        )
+                    await search.index_rows(db, to_index)
+                    await db.commit()
+                self.flushes += 1
+                self.rows_written += len(batch)
+                for execution_id in batch:
+                    execution_changes.notify(execution_id)
+        except BaseException as e:
+            # devolve o lote para a próxima tentativa sem sobrescrever updates mais novos
+            for execution_id, fields in batch.items():
+                self._pending[execution_id] = {**fields, **self._pending.get(execution_id, {})}
+            self._search = {**to_index, **self._search}
+            if isinstance(e, asyncio.CancelledError):
+                self._waiters = waiters + self._waiters
+            else:
+                for fut in waiters:
+                    if not fut.done():
+                        fut.set_exception(e)
+            raise
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+
+class ResultCheckpointer:
+    """Accumulates streamed text and stages partial-result checkpoints.
+
+    A checkpoint is staged every `checkpoint_every_tokens` fragments or
+    `checkpoint_every_ms`, whichever comes first, so a crash loses at most
+    that much output. Only the fragments since the last checkpoint are
+    joined onto the running text, never the whole output again.
+    """
+
+    def __init__(self, execution_id: int, writer: ExecutionWriter):
+        self.execution_id = execution_id
+        self.writer = writer
+        self._text = ""
+        self.parts: list[str] = []  # fragmentos desde o último checkpoint
+        self._last = time.monotonic()
+
+    def append(self, piece: str):
+        self.parts.append(piece)
+        now = time.monotonic()
+        if len(self.parts) >= settings.checkpoint_every_tokens or (now - self._last) * 1000 >= settings.checkpoint_every_ms:
+            self.writer.stage(self.execution_id, result=self.text())
+            self._last = now
+
+    def text(self) -> str:
+        if self.parts:
+            self._text += "".join(self.parts)
+            self.parts.clear()
+        return self._text
+
+
+execution_writer = ExecutionWriter()
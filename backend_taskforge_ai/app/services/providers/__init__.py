@@ -0,0 +1,7 @@
+"""LLM providers behind one streaming interface, plus the latency-aware router."""
+
+from .base import Provider, ProviderError
+from .huggingface import hf_batcher
+from .router import provider_router
+
+__all__ = ["Provider", "ProviderError", "hf_batcher", "provider_router"]
@@ -0,0 +1,78 @@
+import time
+from typing import AsyncIterator
+
+import httpx
+
+from .. import metrics
+from ..stream_decoder import StreamEvent
+
+
+class ProviderError(Exception):
+    """A failed provider call.
+
+    `retryable` marks failures another attempt may not hit (5xx, 429,
+    timeouts, connection errors); the router fails over only on those, and
+    only while nothing has been streamed to the client yet.
+    """
+
+    def __init__(self, message: str, detail=None, status: int | None = None, retryable: bool = False):
+        super().__init__(message)
+        self.message = message
+        self.detail = detail
+        self.status = status
+        self.retryable = retryable
+
+    @classmethod
+    def from_status(cls, provider: str, status: int, body) -> "ProviderError":
+        return cls(f"{provider} HTTP error", detail=body, status=status, retryable=status >= 500 or status == 429)
+
+    @classmethod
+    def from_exception(cls, provider: str, exc: Exception) -> "ProviderError":
+        # timeouts e falhas de conexão/transporte valem outra tentativa
+        return cls(f"exception calling {provider}", detail=str(exc) or type(exc).__name__,
+                   retryable=isinstance(exc, httpx.TransportError))
+
+
+class Provider:
+    """One provider/model. `stream()` yields `StreamEvent`s (text, finish, usage).
+
+    Failures raise `ProviderError`; a provider never touches the execution
+    row or the broker, so the router can run two of them at once (hedging)
+    and drop the loser. `streams` is False for providers that answer in one
+    piece: their time to first token is the whole response, so the router
+    never hedges them.
+    """
+
+    name = ""
+    streams = True
+
+    def __init__(self, model: str | None):
+        self.model = model
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    def stream(self, user_input: str) -> AsyncIterator[StreamEvent]:
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.key}>"
+
+
+def trace_extensions() -> dict:
+    """`extensions` do httpx com o hook de trace das spans da execução atual."""
+    spans = metrics.current_spans.get()
+    return {"trace": spans.trace} if spans is not None else {}
+
+
+class HeadersTimer:
+    """Request sent -> response headers, into the upstream histogram and spans."""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.sent = time.perf_counter()
+
+    def received(self, status_code: int):
+        metrics.observe_headers(self.provider, time.perf_counter() - self.sent)
+        metrics.provider_responses_total.inc(provider=self.provider, code=str(status_code))
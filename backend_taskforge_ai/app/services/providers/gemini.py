@@ -0,0 +1,51 @@
+import logging
+
+from ...core.config import settings
+from .. import stream_decoder
+from ..http_clients import provider_clients
+from .base import HeadersTimer, Provider, ProviderError, trace_extensions
+
+logger = logging.getLogger("providers.gemini")
+
+# parâmetros de geração (fazem parte da chave do cache de resultados)
+GEMINI_PARAMS = {"temperature": 0.2, "maxOutputTokens": 1024}
+
+
+class GeminiProvider(Provider):
+    """Google Generative Language `streamGenerateContent` (a JSON array sent bit by bit)."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, model: str | None = None, base_url: str | None = None):
+        super().__init__(model or settings.gemini_model or "gemini-2.5")
+        self.api_key = api_key
+        self.base_url = (base_url or settings.gemini_base_url).rstrip("/")
+
+    async def stream(self, user_input: str):
+        url = f"{self.base_url}/v1/models/{self.model}:streamGenerateContent?key={self.api_key}"
+        payload = {
+            "contents": [{"role": "user", "parts": [{"text": user_input}]}],
+            "generationConfig": GEMINI_PARAMS,
+        }
+        # cliente compartilhado (pool keep-alive) criado no startup da app
+        client = provider_clients.get("gemini")
+        try:
+            async with provider_clients.track("gemini"):
+                timer = HeadersTimer("gemini")
+                async with client.stream("POST", url, json=payload, extensions=trace_extensions()) as resp:
+                    timer.received(resp.status_code)
+                    if resp.status_code not in (200, 201):
+                        text = await resp.aread()
+                        logger.error("Gemini HTTP %s: %r", resp.status_code, text)
+                        raise ProviderError.from_status("Gemini", resp.status_code, str(resp.status_code))
+
+                    # decodifica o stream em bytes (seguro contra cortes entre chunks)
+                    decoder = stream_decoder.decoder_for(resp.headers.get("content-type"))
+                    async for ev in stream_decoder.iter_events(resp.aiter_bytes(), decoder, stream_decoder.gemini_events):
+                        if ev.kind == "error":
+                            raise ProviderError("Gemini stream error", detail=ev.value)
+                        yield ev
+        except ProviderError:
+            raise
+        except Exception as e:
+            raise ProviderError.from_exception("Gemini", e) from e
@@ -0,0 +1,170 @@
+"""HF inference API provider, with micro-batching of concurrent calls.
+
+The inference API takes a list of `inputs` and answers one result per
+input, so `HFBatcher` collects concurrent executions for the same
+endpoint/model: a batch is sent once it holds `hf_batch_max_size` inputs or
+`hf_batch_max_wait_ms` after its first input, and each execution gets its
+own item of the response. Inputs whose execution was cancelled while
+waiting (e.g. a losing hedge) are dropped before the request goes out.
+"""
+
+import asyncio
+import time
+
+from ...core.config import settings
+from .. import metrics, stream_decoder
+from ..http_clients import provider_clients
+from .base import HeadersTimer, Provider, ProviderError, trace_extensions
+
+HF_PARAMS = {"max_new_tokens": 200, "temperature": 0.7}
+
+
+class HuggingFaceProvider(Provider):
+    """HF inference API (one JSON response, no streaming)."""
+
+    name = "huggingface"
+    streams = False
+
+    def __init__(self, token: str, model: str, base_url: str | None = None):
+        super().__init__(model)
+        self.token = token
+        self.base_url = (base_url or settings.hf_base_url).rstrip("/")
+
+    async def request(self, inputs: list[str]) -> list:
+        """One POST for `inputs`; the raw response item of each input, in order."""
+        url = f"{self.base_url}/models/{self.model}"
+        headers = {"Authorization": f"Bearer {self.token}"}
+        # uma entrada vai como string, igual a antes do batching
+        payload = {"inputs": inputs[0] if len(inputs) == 1 else inputs, "parameters": HF_PARAMS}
+        client = provider_clients.get("huggingface")
+        try:
+            async with provider_clients.track("huggingface"):
+                timer = HeadersTimer("huggingface")
+                resp = await client.post(url, json=payload, headers=headers, extensions=trace_extensions())
+                timer.received(resp.status_code)
+        except Exception as e:
+            raise ProviderError.from_exception("HF", e) from e
+        if resp.status_code != 200:
+            raise ProviderError.from_status("HF", resp.status_code, resp.text)
+        data = resp.json()
+        if len(inputs) == 1:
+            return [data]
+        if not isinstance(data, list) or len(data) != len(inputs):
+            raise ProviderError("unexpected HF batch response", detail=data)
+        return data
+
+    async def stream(self, user_input: str):
+        if settings.hf_batch_max_size > 1:
+            data = await hf_batcher.generate(self, user_input)
+        else:
+            data = (await self.request([user_input]))[0]
+        events = stream_decoder.huggingface_events(data)
+        for ev in events:
+            if ev.kind == "error":
+                raise ProviderError("HF error", detail=ev.value, retryable=True)
+        if not any(ev.kind == "text" for ev in events):
+            raise ProviderError("unexpected HF response", detail=data)
+        for ev in events:
+            yield ev
+
+
+class _Pending:
+    __slots__ = ("text", "future", "queued", "sent")
+
+    def __init__(self, text: str, future: asyncio.Future):
+        self.text = text
+        self.future = future
+        self.queued = time.monotonic()
+        self.sent: float | None = None
+
+
+class HFBatcher:
+    """Groups concurrent HF calls per (endpoint, model, token) into batched requests."""
+
+    def __init__(self):
+        self._pending: dict[tuple, list[_Pending]] = {}
+        self._timers: dict[tuple, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = {"requests": 0, "inputs": 0, "max_batch": 0, "dropped": 0, "errors": 0}
+
+    async def generate(self, provider: HuggingFaceProvider, user_input: str):
+        """Response item for `user_input`, sent along with whatever else is pending."""
+        loop = asyncio.get_running_loop()
+        key = (provider.base_url, provider.model, provider.token)
+        item = _Pending(user_input, loop.create_future())
+        batch = self._pending.setdefault(key, [])
+        batch.append(item)
+        if len(batch) >= settings.hf_batch_max_size:
+            self._flush(key, provider)
+        elif len(batch) == 1:
+            self._timers[key] = loop.call_later(settings.hf_batch_max_wait_ms / 1000, self._flush, key, provider)
+        # cancelar quem espera cancela o future; o lote o ignora
+        data = await item.future
+        spans = metrics.current_spans.get()
+        if spans is not None and item.sent is not None:
+            spans.step("hf_batch_wait", item.sent - item.queued)
+        return data
+
+    def _flush(self, key: tuple, provider: HuggingFaceProvider):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, [])
+        items = [item for item in batch if not item.future.done()]
+        self.stats["dropped"] += len(batch) - len(items)
+        if not items:
+            return
+        task = asyncio.create_task(self._send(provider, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, provider: HuggingFaceProvider, items: list[_Pending]):
+        if len(items) > 1:
+            # a task herdou o contexto de uma das execuções; o lote não é dela
+            metrics.current_spans.set(None)
+        now = time.monotonic()
+        for item in items:
+            item.sent = now
+            metrics.hf_batch_wait_seconds.observe(now - item.queued)
+        metrics.hf_batch_size.observe(len(items))
+        self.stats["requests"] += 1
+        self.stats["inputs"] += len(items)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(items))
+        try:
+            results = await provider.request([item.text for item in items])
+        except asyncio.CancelledError:
+            # shutdown: ninguém fica esperando para sempre
+            for item in items:
+                item.future.cancel()
+            raise
+        except Exception as e:
+            self.stats["errors"] += 1
+            error = e if isinstance(e, ProviderError) else ProviderError.from_exception("HF", e)
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(error)
+            return
+        for item, data in zip(items, results):
+            if not item.future.done():
+                item.future.set_result(data)
+
+    async def stop(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for batch in self._pending.values():
+            for item in batch:
+                item.future.cancel()
+        self._pending.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        stats = self.stats
+        return {**stats, "avg_batch": round(stats["inputs"] / stats["requests"], 2) if stats["requests"] else 0.0,
+                "pending": sum(len(batch) for batch in self._pending.values()),
+                "max_size": settings.hf_batch_max_size, "max_wait_ms": settings.hf_batch_max_wait_ms}
+
+
+hf_batcher = HFBatcher()
@@ -0,0 +1,277 @@
+"""Latency-aware routing over the configured providers, with hedging and failover.
+
+Each provider/model keeps a rolling window (`router_window_seconds`) of
+outcomes: time to first token for successes, plus failures. `ranked()` orders
+the configured providers by that health (median TTFT, inflated by the error
+rate; a provider failing more than `router_eject_error_rate` goes last).
+
+`provider_router.stream(text)` returns a `RoutedStream`:
+
+- the best provider is called first; if it has produced no output after its
+  `router_hedge_percentile` TTFT (clamped to `router_hedge_min_ms`, and
+  `router_hedge_default_ms` until there are `router_min_samples`), a hedged
+  request goes to the next provider. Whichever streams first wins; the other
+  request is cancelled. There is no hedge with a single provider (a second
+  copy of the same request would queue behind the same upstream) nor for a
+  provider that does not stream (no output before the whole response).
+- a 5xx/429, connection error or timeout (no output within
+  `router_ttft_timeout`) before any output moves on to the next provider,
+  up to `router_max_attempts` requests. Once text has been streamed to the
+  client a failure is final, since a new attempt would repeat the output.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+from ...core.config import settings
+from ..metrics import router_error_rate, router_failovers, router_hedge_wins, router_hedges, router_ttft_p50
+from .base import Provider, ProviderError
+from .gemini import GeminiProvider
+from .huggingface import HuggingFaceProvider, hf_batcher
+
+_END = object()
+
+
+class ProviderHealth:
+    """Rolling outcomes of one provider/model: (time, ok, ttft seconds | None)."""
+
+    def __init__(self):
+        self.samples: deque = deque(maxlen=1000)
+
+    def record(self, ok: bool, ttft: float | None = None):
+        self.samples.append((time.monotonic(), ok, ttft))
+
+    def _recent(self) -> list:
+        cutoff = time.monotonic() - settings.router_window_seconds
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return list(self.samples)
+
+    def error_rate(self) -> float:
+        recent = self._recent()
+        return sum(1 for _, ok, _ in recent if not ok) / len(recent) if recent else 0.0
+
+    def ttft_quantile(self, q: float) -> float | None:
+        ttfts = sorted(t for _, ok, t in self._recent() if ok and t is not None)
+        if len(ttfts) < settings.router_min_samples:
+            return None
+        return ttfts[min(len(ttfts) - 1, int(q * len(ttfts)))]
+
+    def score(self) -> float:
+        """Lower is better; 0 for a provider without history (gets tried)."""
+        recent = self._recent()
+        if not recent:
+            return 0.0
+        errors = self.error_rate()
+        ttfts = sorted(t for _, ok, t in recent if ok and t is not None)
+        median = ttfts[len(ttfts) // 2] if ttfts else settings.router_ttft_timeout
+        score = median * (1 + 10 * errors)
+        if errors >= settings.router_eject_error_rate and len(recent) >= settings.router_min_samples:
+            score += 1e6
+        return score
+
+    def snapshot(self) -> dict:
+        recent = self._recent()
+        p50, p95 = self.ttft_quantile(0.5), self.ttft_quantile(0.95)
+        return {
+            "samples": len(recent),
+            "error_rate": round(self.error_rate(), 4),
+            "ttft_p50_ms": None if p50 is None else round(p50 * 1000, 1),
+            "ttft_p95_ms": None if p95 is None else round(p95 * 1000, 1),
+            "score": round(self.score(), 4),
+        }
+
+
+class _Attempt:
+    """One provider request running in its own task; events are handed over through a queue."""
+
+    def __init__(self, provider: Provider, user_input: str, health: ProviderHealth, hedge: bool = False):
+        self.provider = provider
+        self.health = health
+        self.hedge = hedge
+        # sem limite: o provider gera na velocidade do LLM, bem abaixo do consumo
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.ready = asyncio.Event()  # primeira saída, fim ou erro
+        self.started = time.monotonic()
+        self.ttft: float | None = None
+        self.error: ProviderError | None = None
+        self.done = False
+        self.task = asyncio.create_task(self._run(user_input))
+
+    async def _run(self, user_input: str):
+        try:
+            async for ev in self.provider.stream(user_input):
+                if ev.kind == "text" and self.ttft is None:
+                    self.ttft = time.monotonic() - self.started
+                    self.ready.set()
+                await self.queue.put(ev)
+            self.health.record(True, self.ttft)
+        except ProviderError as e:
+            self.error = e
+            self.health.record(False)
+        except Exception as e:
+            self.error = ProviderError.from_exception(self.provider.name, e)
+            self.health.record(False)
+        finally:
+            # perdedor cancelado: sem registro, não diz nada sobre a saúde do provider
+            self.done = True
+            self.ready.set()
+            self.queue.put_nowait(_END)
+
+    @property
+    def won(self) -> bool:
+        """Produced output, or finished cleanly (even if empty)."""
+        return self.ttft is not None or (self.done and self.error is None)
+
+    def timed_out(self):
+        self.task.cancel()
+        self.health.record(False)
+        self.error = ProviderError(f"{self.provider.name} timed out waiting for the first token",
+                                   detail=f"no output after {settings.router_ttft_timeout}s", retryable=True)
+
+    async def events(self):
+        while True:
+            ev = await self.queue.get()
+            if ev is _END:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield ev
+
+
+class RoutedStream:
+    """Events of the winning attempt; `provider` tells which one it was."""
+
+    def __init__(self, router: "ProviderRouter", user_input: str):
+        self.router = router
+        self.user_input = user_input
+        self.provider: Provider | None = None
+        self.attempts: list[dict] = []  # resumo de cada requisição (para logs/perfil)
+
+    async def __aiter__(self):
+        candidates = self.router.ranked()
+        if not candidates:
+            raise ProviderError("No LLM provider configured")
+        budget = max(1, settings.router_max_attempts)
+        error: ProviderError | None = None
+        while candidates and budget > 0:
+            primary = candidates.pop(0)
+            winner, started = await self._race(primary, candidates, budget)
+            budget -= len(started)
+            for attempt in started:
+                self.attempts.append({"provider": attempt.provider.key, "hedge": attempt.hedge,
+                                      "won": attempt is winner,
+                                      "error": None if attempt.error is None else attempt.error.message})
+                if attempt.hedge and attempt.provider in candidates:
+                    candidates.remove(attempt.provider)
+            if winner is not None:
+                self.provider = winner.provider
+                if winner.hedge:
+                    router_hedge_wins.inc(provider=winner.provider.key)
+                try:
+                    async for ev in winner.events():
+                        yield ev
+                finally:
+                    # consumidor parou antes do fim (erro/cancelamento): não deixa a requisição órfã
+                    winner.task.cancel()
+                return
+            error = next((a.error for a in reversed(started) if a.error is not None), error)
+            if error is None or not error.retryable:
+                break
+            for attempt in started:
+                router_failovers.inc(provider=attempt.provider.key)
+            if not candidates and budget > 0:
+                # sem outro provider: tenta o melhor de novo enquanto houver orçamento
+                candidates = self.router.ranked()
+        raise error or ProviderError("No LLM provider available")
+
+    async def _race(self, primary: Provider, spares: list[Provider], budget: int):
+        """Run `primary`, hedged by the next spare; (winner or None, attempts started)."""
+        started: list[_Attempt] = []
+        try:
+            return await self._run_race(primary, spares, budget, started)
+        except BaseException:
+            for a in started:
+                a.task.cancel()
+            raise
+
+    async def _run_race(self, primary: Provider, spares: list[Provider], budget: int, started: list):
+        router = self.router
+        first = _Attempt(primary, self.user_input, router.health(primary))
+        started.append(first)
+        deadline = first.started + settings.router_ttft_timeout
+        hedge_delay = router.hedge_delay(primary)
+        spare = next((p for p in spares if p.key != primary.key), None)
+        if (settings.router_hedge_enabled and budget > 1 and spare is not None and primary.streams
+                and hedge_delay < settings.router_ttft_timeout):
+            try:
+                await asyncio.wait_for(first.ready.wait(), hedge_delay)
+            except asyncio.TimeoutError:
+                router_hedges.inc(provider=spare.key)
+                started.append(_Attempt(spare, self.user_input, router.health(spare), hedge=True))
+
+        while True:
+            winner = next((a for a in started if a.won), None)
+            pending = [a for a in started if not a.done]
+            if winner is not None or not pending:
+                for a in started:
+                    if a is not winner and not a.done:
+                        a.task.cancel()
+                return winner, started
+            waits = [asyncio.create_task(a.ready.wait()) for a in pending]
+            done, _ = await asyncio.wait(waits, timeout=max(0.0, deadline - time.monotonic()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for w in waits:
+                w.cancel()
+            if not done:
+                for a in pending:
+                    a.timed_out()
+                return None, started
+
+
+class ProviderRouter:
+    def __init__(self):
+        self._health: dict[str, ProviderHealth] = {}
+
+    def configured(self) -> list[Provider]:
+        """Providers with credentials, in configuration order (Gemini first)."""
+        providers: list[Provider] = []
+        if settings.gemini_api_key:
+            providers.append(GeminiProvider(settings.gemini_api_key))
+        if settings.huggingfacehub_api_token and settings.hf_model:
+            providers.append(HuggingFaceProvider(settings.huggingfacehub_api_token, settings.hf_model))
+        return providers
+
+    def health(self, provider: Provider) -> ProviderHealth:
+        health = self._health.get(provider.key)
+        if health is None:
+            health = self._health[provider.key] = ProviderHealth()
+        return health
+
+    def ranked(self) -> list[Provider]:
+        # sort estável: empate (ex: sem histórico) mantém a ordem da configuração
+        return sorted(self.configured(), key=lambda p: self.health(p).score())
+
+    def hedge_delay(self, provider: Provider) -> float:
+        q = self.health(provider).ttft_quantile(settings.router_hedge_percentile)
+        if q is None:
+            return settings.router_hedge_default_ms / 1000
+        return max(settings.router_hedge_min_ms / 1000, q)
+
+    def stream(self, user_input: str) -> RoutedStream:
+        return RoutedStream(self, user_input)
+
+    def snapshot(self) -> dict:
+        ranked = [p.key for p in self.ranked()]
+        return {"ranking": ranked, "providers": {key: h.snapshot() for key, h in self._health.items()},
+                "hf_batching": hf_batcher.snapshot()}
+
+    def refresh_metrics(self):
+        for key, health in self._health.items():
+            p50 = health.ttft_quantile(0.5)
+            router_ttft_p50.set(p50 or 0.0, provider=key)
+            router_error_rate.set(health.error_rate(), provider=key)
+
+
+provider_router = ProviderRouter()
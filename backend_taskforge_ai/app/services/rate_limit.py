@@ -0,0 +1,193 @@
+"""Token-bucket rate limits for users (at admission) and providers (at dispatch).
+
+A bucket holds up to `burst` tokens and refills at `rate` tokens/second.
+`take(key, rate, burst, cost)` spends `cost` tokens and returns 0, or leaves
+the bucket alone and returns the seconds until enough tokens are
+available. A cost above the burst only needs a full bucket and leaves it in
+debt (negative) until the refill catches up, so a large batch is admitted
+once and the next request waits for the whole of it. A negative cost gives
+tokens back (refund).
+
+- Users: `POST /api/v1/executions/` (and `/batch`, one token per item)
+  answers 429 with `Retry-After` when the user's bucket is empty.
+- Providers: scheduler workers take a token for the provider/model before
+  claiming a row and wait (not fail) when the bucket is empty, so a burst of
+  queued work never exceeds the upstream quota.
+
+State lives in this process ("memory") or in Redis ("redis": one hash per
+bucket updated by a Lua script, so several API/worker processes share the
+same limits). Every decision is counted in `/metrics`.
+"""
+
+import asyncio
+import time
+
+from ..core.config import settings
+from .metrics import rate_limit_decisions, rate_limit_wait_seconds
+
+
+class RateLimited(Exception):
+    """The caller is over its rate; `retry_after` seconds until enough tokens."""
+
+    def __init__(self, retry_after: float, detail: str = "Rate limit exceeded"):
+        super().__init__(detail)
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class MemoryBuckets:
+    """Buckets of this process: key -> [tokens, last refill (monotonic), rate, burst]."""
+
+    max_keys = 100_000
+
+    def __init__(self):
+        self._buckets: dict[str, list] = {}
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = self._buckets[key] = [burst, now, rate, burst]
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1:] = now, rate, burst
+        need = min(cost, burst)
+        if tokens >= need:
+            bucket[0] = min(burst, tokens - cost)
+            return 0.0
+        bucket[0] = tokens
+        return (need - tokens) / rate
+
+    def _prune(self, now: float):
+        # um balde que já estaria cheio de novo equivale a não ter balde
+        self._buckets = {
+            k: b for k, b in self._buckets.items() if b[0] + (now - b[1]) * b[2] < b[3]
+        }
+
+    async def stop(self):
+        pass
+
+
+# KEYS[1] = bucket; ARGV = rate, burst, cost. Usa o relógio do Redis (TIME).
+_TAKE_SCRIPT = """
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local need = math.min(cost, burst)
+local wait = 0
+if tokens >= need then
+  tokens = math.min(burst, tokens - cost)
+else
+  wait = (need - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+-- balde em débito precisa durar até voltar a encher
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Buckets shared through Redis (`pip install redis`)."""
+
+    def __init__(self, url: str | None = None):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:  # pragma: no cover - optional dependency
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the `redis` package") from e
+        self._redis = aioredis.from_url(url or settings.rate_limit_redis_url or settings.broker_redis_url,
+                                        decode_responses=True)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        return float(await self._take(keys=[f"taskforge:rl:{key}"], args=[rate, burst, cost]))
+
+    async def stop(self):
+        await self._redis.aclose()
+
+
+class RateLimiter:
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            kind = settings.rate_limit_backend
+            if kind == "memory":
+                self._backend = MemoryBuckets()
+            elif kind == "redis":
+                self._backend = RedisBuckets()
+            else:
+                raise RuntimeError(f"unknown RATE_LIMIT_BACKEND {kind!r} (expected memory or redis)")
+        return self._backend
+
+    async def stop(self):
+        backend, self._backend = self._backend, None
+        if backend is not None:
+            await backend.stop()
+
+    # ---- admissão (por usuário) ----
+    @staticmethod
+    def user_rate(user_id: int) -> float:
+        """Tokens/second for `user_id` (0 = unlimited)."""
+        per_minute = settings.rate_limit_user_overrides.get(user_id, settings.rate_limit_user_per_minute)
+        return per_minute / 60
+
+    async def admit(self, user_id: int, cost: int = 1):
+        """Spend `cost` tokens of the user's bucket or raise `RateLimited`.
+
+        A batch larger than the burst gets in with a full bucket and leaves it
+        in debt; dispatch is still paced per provider by `acquire_dispatch`.
+        """
+        rate = self.user_rate(user_id)
+        if rate <= 0:
+            return
+        burst = settings.rate_limit_user_burst
+        wait = await self.backend.take(f"user:{user_id}", rate, burst, cost)
+        if wait > 0:
+            rate_limit_decisions.inc(scope="user", decision="limited")
+            raise RateLimited(wait)
+        rate_limit_decisions.inc(scope="user", decision="allowed")
+
+    # ---- dispatch (por provider/modelo) ----
+    @staticmethod
+    def provider_rate(provider: str, model: str | None) -> tuple[str, float]:
+        """(bucket key, tokens/second); "provider:model" overrides "provider"."""
+        limits = settings.rate_limit_provider_per_minute
+        for key in (f"{provider}:{model}", provider):
+            if key in limits:
+                return key, limits[key] / 60
+        return provider, 0.0
+
+    async def acquire_dispatch(self, provider: str, model: str | None) -> tuple[str, float] | None:
+        """Wait for a provider token; returns what `refund` needs if it goes unused (None = unlimited)."""
+        key, rate = self.provider_rate(provider, model)
+        if rate <= 0:
+            return None
+        burst = max(1, settings.rate_limit_provider_burst)
+        started = time.monotonic()
+        limited = False
+        while True:
+            wait = await self.backend.take(f"provider:{key}", rate, burst)
+            if wait <= 0:
+                break
+            limited = True
+            await asyncio.sleep(wait)
+        rate_limit_decisions.inc(scope="provider", decision="limited" if limited else "allowed")
+        rate_limit_wait_seconds.observe(time.monotonic() - started, provider=key)
+        return key, rate
+
+    async def refund(self, token: tuple[str, float] | None):
+        """Give back a dispatch token that ended up unused (nothing was claimed)."""
+        if token is not None:
+            key, rate = token
+            await self.backend.take(f"provider:{key}", rate, max(1, settings.rate_limit_provider_burst), -1)
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import anyio
+
+from ..core.config import settings
+
+logger = logging.getLogger("result_cache")
+
+
+def cache_key(provider: str, model: str | None, params: dict, user_input: str) -> str:
+    """Stable key for (provider, model, generation params, normalized input)."""
+    normalized = " ".join(user_input.split())
+    raw = json.dumps([provider, model, params, normalized], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Flight:
+    """One in-flight upstream call that identical executions can follow.
+
+    The leader pushes every fragment; followers replay what was already
+    pushed and then wait for the rest, so all of them stream the same text.
+    """
+
+    def __init__(self):
+        self.parts: list[str] = []
+        self.done = False
+        self.status: str | None = None
+        self.result: str | None = None
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def push(self, piece: str):
+        self.parts.append(piece)
+        self._wake()
+
+    def finish(self, status: str | None, result: str | None):
+        self.done = True
+        self.status = status
+        self.result = result
+        self._wake()
+
+    async def follow(self):
+        cursor = 0
+        while True:
+            while cursor < len(self.parts):
+                cursor += 1
+                yield self.parts[cursor - 1]
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class ResultCache:
+    """Two-tier (memory LRU + on-disk) TTL cache of completed results.
+
+    Also owns the singleflight table: while a result is being produced for a
+    key, identical executions follow that flight instead of calling upstream.
+    """
+
+    def __init__(self, max_entries: int | None = None, ttl: float | None = None, disk_path: Path | None = None):
+        self.max_entries = max_entries or settings.result_cache_max_entries
+        self.ttl = ttl or settings.result_cache_ttl_seconds
+        self.max_disk_entries = settings.result_cache_max_disk_entries
+        if disk_path is None and settings.result_cache_disk:
+            disk_path = Path(settings.storage_path) / "result_cache"
+        self.disk_path = disk_path
+        self._mem: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._disk_writes = 0
+        self.flights: dict[str, Flight] = {}
+        self.stats = {
+            "hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0,
+            "evictions": 0, "expired": 0, "disk_evictions": 0, "coalesced": 0,
+        }
+
+    # ---- disk tier (executado em thread pool) ----
+    def _disk_file(self, key: str) -> Path:
+        return self.disk_path / key[:2] / f"{key}.json"
+
+    def _disk_get_sync(self, key: str):
+        try:
+            with open(self._disk_file(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            self._disk_file(key).unlink(missing_ok=True)
+            return "expired"
+        return entry
+
+    def _disk_set_sync(self, key: str, expires_at: float, value: str):
+        dest = self._disk_file(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": expires_at, "value": value}, f)
+        os.replace(tmp, dest)
+
+    def _disk_prune_sync(self) -> int:
+        """Drop expired entries, then the oldest ones above `max_disk_entries`."""
+        now = time.time()
+        files = []
+        for path in self.disk_path.glob("*/*.json"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        removed = 0
+        files.sort()
+        excess = len(files) - self.max_disk_entries
+        for mtime, path in files:
+            if excess > 0 or mtime + self.ttl < now:
+                path.unlink(missing_ok=True)
+                excess -= 1
+                removed += 1
+        return removed
+
+    # ---- API ----
+    async def get(self, key: str) -> str | None:
+        entry = self._mem.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at >= time.time():
+                self._mem.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return value
+            del self._mem[key]
+            self.stats["expired"] += 1
+        if self.disk_path is not None:
+            entry = await anyio.to_thread.run_sync(self._disk_get_sync, key)
+            if entry == "expired":
+                self.stats["expired"] += 1
+            elif entry is not None:
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                self._remember(key, entry["expires_at"], entry["value"])
+                return entry["value"]
+        self.stats["misses"] += 1
+        return None
+
+    def _remember(self, key: str, expires_at: float, value: str):
+        self._mem[key] = (expires_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, value)
+        if self.disk_path is None:
+            return
+        try:
+            await anyio.to_thread.run_sync(self._disk_set_sync, key, expires_at, value)
+            self._disk_writes += 1
+            if self._disk_writes % 100 == 0:
+                self.stats["disk_evictions"] += await anyio.to_thread.run_sync(self._disk_prune_sync)
+        except OSError:
+            logger.exception("[cache] failed to write disk entry")
+
+    def start_flight(self, key: str) -> Flight:
+        flight = Flight()
+        self.flights[key] = flight
+        return flight
+
+    def end_flight(self, key: str, flight: Flight, status: str | None, result: str | None):
+        flight.finish(status, result)
+        if self.flights.get(key) is flight:
+            self.flights.pop(key, None)
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "memory_entries": len(self._mem), "in_flight": len(self.flights)}
+
+
+result_cache = ResultCache()
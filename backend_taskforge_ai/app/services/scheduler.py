@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from ..core.config import settings
+from ..db import models
+from ..db.session import AsyncSessionLocal
+from . import executor_async, metrics
+from .broker import get_broker
+from .notify import execution_changes
+from .persistence import execution_writer
+from .rate_limit import rate_limiter
+
+logger = logging.getLogger("scheduler")
+
+
+class FairQueue:
+    """Start-time fair queueing across users over the queued rows.
+
+    Every user has a virtual finish tag. The next row is the oldest one of
+    the user with the lowest tag (clamped to the current virtual time), and
+    serving it advances that user's tag by 1/weight. While several users have
+    queued work each gets a dispatch share proportional to its weight, so one
+    user's backlog of thousands of rows no longer delays everyone else's
+    next execution; an idle user banks no credit.
+    """
+
+    def __init__(self):
+        self.vtime = 0.0
+        self.finish: dict = {}
+
+    @staticmethod
+    def weight(user_id) -> float:
+        return max(1e-6, settings.scheduler_user_weights.get(user_id, 1.0))
+
+    def pick(self, heads: list) -> tuple:
+        """`heads`: (user_id, oldest queued id) per user -> the one to serve."""
+        return min(heads, key=lambda h: (max(self.finish.get(h[0], 0.0), self.vtime), h[1]))
+
+    def charge(self, user_id):
+        start = max(self.finish.get(user_id, 0.0), self.vtime)
+        self.vtime = start
+        self.finish[user_id] = start + 1 / self.weight(user_id)
+        if len(self.finish) > 10_000:
+            # tags já alcançadas pelo tempo virtual não mudam nada
+            self.finish = {u: f for u, f in self.finish.items() if f > self.vtime}
+
+
+# ---- async DB helpers ----
+async def _claim_next(fair: FairQueue | None = None, worker_id: str | None = None):
+    """Claim the next `queued` execution, returning its id (or None).
+
+    Oldest first, or the fair-queueing choice across users when `fair` is
+    given. The claim is a conditional UPDATE (`... WHERE status = 'queued'`),
+    so two workers — in this process or another one sharing the database —
+    can never both win the same row. The row is leased to `worker_id`.
+    """
+    Execution = models.Execution
+    async with AsyncSessionLocal() as db:
+        while True:
+            user_id = None
+            if fair is None:
+                execution_id = (
+                    await db.execute(select(Execution.id).where(Execution.status == "queued").order_by(Execution.id).limit(1))
+                ).scalar()
+            else:
+                heads = (
+                    await db.execute(
+                        select(Execution.user_id, func.min(Execution.id))
+                        .where(Execution.status == "queued")
+                        .group_by(Execution.user_id)
+                    )
+                ).all()
+                metrics.queue_users.set(len(heads))
+                user_id, execution_id = fair.pick(heads) if heads else (None, None)
+            if execution_id is None:
+                return None
+            now = datetime.utcnow()
+            claimed = await db.execute(
+                update(Execution)
+                .where(Execution.id == execution_id, Execution.status == "queued")
+                .values(
+                    status="running", started_at=now, claimed_by=worker_id, heartbeat_at=now,
+                    version=Execution.version + 1,
+                )
+            )
+            await db.commit()
+            if claimed.rowcount:
+                if fair is not None:
+                    fair.charge(user_id)
+                execution_changes.notify(execution_id)
+                return execution_id
+            # outro worker pegou essa linha; tenta a próxima
+
+
+async def _renew_leases(worker_id: str) -> int:
+    """Refresh `heartbeat_at` of the rows this process is running (no version bump: not a visible change)."""
+    Execution = models.Execution
+    async with AsyncSessionLocal() as db:
+        res = await db.execute(
+            update(Execution)
+            .where(Execution.status == "running", Execution.claimed_by == worker_id)
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        await db.commit()
+        return res.rowcount
+
+
+async def _recover_orphans(lease_seconds: float | None = None, worker_id: str | None = None):
+    """Put `running` rows with an expired lease (or the rows of `worker_id`) back in the queue."""
+    Execution = models.Execution
+    if worker_id is not None:
+        condition = Execution.claimed_by == worker_id
+    else:
+        cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds or settings.scheduler_lease_seconds)
+        # sem heartbeat: linhas de antes do lease existir
+        condition = (Execution.heartbeat_at.is_(None)) | (Execution.heartbeat_at < cutoff)
+    async with AsyncSessionLocal() as db:
+        res = await db.execute(
+            update(Execution).where(Execution.status == "running", condition).values(
+                status="queued", started_at=None, result=None, claimed_by=None, heartbeat_at=None,
+                version=Execution.version + 1,
+            )
+        )
+        await db.commit()
+        return res.rowcount
+
+
+class ExecutionScheduler:
+    """Fixed-size pool of async workers that drains the `executions` table.
+
+    Global concurrency is the number of workers; each provider additionally
+    gets its own semaphore so a burst never opens more upstream calls than
+    `scheduler_provider_concurrency` (or the per-provider override), and a
+    token bucket (`rate_limit_provider_per_minute`) caps how fast rows are
+    dispatched to it. Rows are picked fairly across users (`FairQueue`).
+    Claimed rows are leased to `worker_id` and renewed by a heartbeat task.
+    """
+
+    def __init__(self, workers: int | None = None, poll_interval: float | None = None):
+        self.workers = workers or settings.scheduler_workers
+        self.poll_interval = poll_interval or settings.scheduler_poll_interval
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+        self._provider_slots: dict[str, asyncio.Semaphore] = {}
+        self.running: dict[int, str] = {}  # execution_id -> provider
+        self.fair = FairQueue()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[-64:]
+        self._heartbeat_task: asyncio.Task | None = None
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    def _slots(self, provider: str) -> asyncio.Semaphore:
+        sem = self._provider_slots.get(provider)
+        if sem is None:
+            limit = settings.scheduler_provider_limits.get(provider, settings.scheduler_provider_concurrency)
+            sem = asyncio.Semaphore(max(1, limit))
+            self._provider_slots[provider] = sem
+        return sem
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        await self._recover()
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        logger.info("[scheduler] started %s worker(s) as %s", self.workers, self.worker_id)
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        if self._heartbeat_task is not None:
+            tasks.append(self._heartbeat_task)
+            self._heartbeat_task = None
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if tasks:
+            # execuções interrompidas voltam pra fila já, sem esperar o lease expirar
+            try:
+                released = await _recover_orphans(worker_id=self.worker_id)
+                if released:
+                    logger.info("[scheduler] re-queued %s interrupted execution(s)", released)
+            except Exception:
+                logger.exception("[scheduler] failed to re-queue interrupted executions")
+        logger.info("[scheduler] stopped")
+
+    async def _recover(self):
+        if not settings.scheduler_recover_orphans:
+            return
+        recovered = await _recover_orphans(settings.scheduler_lease_seconds)
+        if recovered:
+            logger.info("[scheduler] re-queued %s orphaned execution(s) with an expired lease", recovered)
+            self.notify()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.scheduler_heartbeat_interval)
+            try:
+                if self.running:
+                    await _renew_leases(self.worker_id)
+                await self._recover()
+            except Exception:
+                logger.exception("[scheduler] heartbeat failed")
+
+    def notify(self):
+        """Wake idle workers; called right after new rows are inserted."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _wait_for_work(self):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _fail_crashed(self, execution_id: int):
+        """Mark a crashed execution failed and close its stream; never raises (the worker keeps going)."""
+        try:
+            await execution_writer.write(execution_id, status="failed", finished_at=datetime.utcnow())
+        except Exception:
+            logger.exception("[scheduler] could not mark crashed execution %s as failed", execution_id)
+        try:
+            # sem isso clientes SSE/WS ficam esperando um canal que nunca fecha
+            await get_broker().close(execution_id)
+        except Exception:
+            logger.exception("[scheduler] could not close the stream of crashed execution %s", execution_id)
+
+    async def _worker(self, n: int):
+        while True:
+            provider = executor_async.current_provider()
+            sem = self._slots(provider)
+            async with sem:
+                token = execution_id = None
+                try:
+                    # token do provider antes de reivindicar; devolvido se a fila estiver vazia
+                    token = await rate_limiter.acquire_dispatch(provider, executor_async.current_model())
+                    execution_id = await _claim_next(
+                        self.fair if settings.scheduler_fair_queueing else None, self.worker_id
+                    )
+                except Exception:
+                    logger.exception("[scheduler] worker %s failed to claim", n)
+                if execution_id is None:
+                    try:
+                        await rate_limiter.refund(token)
+                    except Exception:
+                        logger.exception("[scheduler] worker %s failed to refund a dispatch token", n)
+                else:
+                    self.running[execution_id] = provider
+                    try:
+                        await executor_async.process_execution(execution_id)
+                    except Exception:
+                        logger.exception("[scheduler] execution %s crashed", execution_id)
+                        await self._fail_crashed(execution_id)
+                    finally:
+                        self.running.pop(execution_id, None)
+                    continue
+            await self._wait_for_work()
+
+
+scheduler = ExecutionScheduler()
@@ -0,0 +1,199 @@
+"""Full-text search over execution inputs and results.
+
+The index is kept by the application rather than by triggers: `input` and
+`result` are stored compressed or off-row (`app/db/types.py`), so only the
+app sees their text. An execution is indexed in the same transaction as its
+final update (`ExecutionWriter.stage_search`), once it completes or fails.
+
+- SQLite: contentless FTS5 table `execution_fts` (rowid = execution id, no
+  second copy of the text), ranked with bm25, input weighted 2x.
+- Postgres: `execution_search(execution_id, document tsvector)` with a GIN
+  index, input weighted A and result B, ranked with ts_rank_cd
+  (`search_pg_config` picks the text search configuration).
+
+Scoring every match of a very common word is what makes a query slow, so
+only the newest `search_max_candidates` matching executions are ranked.
+
+`search()` returns `(execution id, score)` hits, best first (lower score is
+better on both backends) with ties broken by id, so `(score, id)` works as
+a keyset cursor. `python -m app.reindex` (`reindex()`) indexes rows that
+finished before the index existed.
+"""
+
+import re
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import load_only
+
+from ..core.config import settings
+from ..db import models
+from ..db.session import AsyncSessionLocal, async_engine
+from .storage import load_result_blobs
+
+FTS_TABLE = "execution_fts"
+PG_TABLE = "execution_search"
+
+# preenchido por create_search_index (None = sem índice: nada é indexado)
+_index = {"kind": None, "replace": False}
+
+_TERM = re.compile(r'"([^"]+)"|(\w+\*?)', re.UNICODE)
+
+
+class SearchUnavailable(Exception):
+    """The database has no search index (unsupported dialect or search disabled)."""
+
+
+def enabled() -> bool:
+    return _index["kind"] is not None
+
+
+def create_search_index(connection):
+    """Create the index for this database's dialect; run with `conn.run_sync` at startup."""
+    kind = connection.dialect.name
+    if not settings.search_enabled or kind not in ("sqlite", "postgresql"):
+        _index["kind"] = None
+        return
+    if kind == "sqlite":
+        version = tuple(int(x) for x in connection.exec_driver_sql("SELECT sqlite_version()").scalar().split("."))
+        # 3.43+: linhas de uma tabela contentless podem ser apagadas/substituídas
+        delete = ", contentless_delete=1" if version >= (3, 43) else ""
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"input, result, content=''{delete}, tokenize='unicode61 remove_diacritics 2')"
+        )
+        ddl = connection.exec_driver_sql(
+            f"SELECT sql FROM sqlite_master WHERE type = 'table' AND name = '{FTS_TABLE}'"
+        ).scalar()
+        _index["replace"] = "contentless_delete" in (ddl or "")
+    else:
+        connection.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS {PG_TABLE} ("
+            "execution_id INTEGER PRIMARY KEY REFERENCES executions(id) ON DELETE CASCADE, "
+            "document TSVECTOR NOT NULL)"
+        )
+        connection.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS ix_{PG_TABLE}_document ON {PG_TABLE} USING GIN (document)"
+        )
+        _index["replace"] = True
+    _index["kind"] = kind
+
+
+def _clip(value: str | None) -> str:
+    return (value or "")[: settings.search_index_max_chars]
+
+
+async def index_rows(db, rows: dict[int, tuple[str | None, str | None]]) -> int:
+    """Add or replace `{execution id: (input, result)}` in the index (caller commits); rows written."""
+    if not rows or not enabled():
+        return 0
+    params = [{"id": id, "input": _clip(input), "result": _clip(result)} for id, (input, result) in rows.items()]
+    if _index["kind"] == "postgresql":
+        await db.execute(
+            text(
+                f"INSERT INTO {PG_TABLE} (execution_id, document) VALUES (:id, "
+                "setweight(to_tsvector(CAST(:config AS regconfig), :input), 'A') || "
+                "setweight(to_tsvector(CAST(:config AS regconfig), :result), 'B')) "
+                "ON CONFLICT (execution_id) DO UPDATE SET document = EXCLUDED.document"
+            ),
+            [{**p, "config": settings.search_pg_config} for p in params],
+        )
+        return len(params)
+    ids = list(rows)
+    placeholders = ", ".join(f":id{i}" for i in range(len(ids)))
+    bind = {f"id{i}": id for i, id in enumerate(ids)}
+    if _index["replace"]:
+        await db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})"), bind)
+    else:
+        # sem contentless_delete não dá para substituir: cada execução é indexada uma vez
+        found = await db.execute(text(f"SELECT rowid FROM {FTS_TABLE} WHERE rowid IN ({placeholders})"), bind)
+        existing = set(found.scalars())
+        params = [p for p in params if p["id"] not in existing]
+    if params:
+        await db.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, input, result) VALUES (:id, :input, :result)"), params)
+    return len(params)
+
+
+def fts5_query(q: str) -> str | None:
+    """User text -> FTS5 query: every word/"phrase" must match, `word*` is a prefix; no operators."""
+    terms = []
+    for phrase, word in _TERM.findall(q):
+        if phrase:
+            terms.append('"' + phrase.replace('"', "") + '"')
+        elif word.endswith("*"):
+            terms.append(f'"{word[:-1]}"*')
+        else:
+            terms.append(f'"{word}"')
+    return " ".join(terms) or None
+
+
+async def search(db, q: str, limit: int, after: tuple[float, int] | None = None, agent_id: int | None = None,
+                 user_id: int | None = None, status: str | None = None) -> list[tuple[int, float]]:
+    """Up to `limit` (execution id, score) hits after the `(score, id)` cursor `after`."""
+    if not enabled():
+        raise SearchUnavailable("Search is not available on this database")
+    params: dict = {"limit": limit}
+    filters = []
+    for column, value in (("agent_id", agent_id), ("user_id", user_id), ("status", status)):
+        if value is not None:
+            filters.append(f"e.{column} = :{column}")
+            params[column] = value
+    if _index["kind"] == "sqlite":
+        match = fts5_query(q)
+        if match is None:
+            raise ValueError("empty search query")
+        score = f"bm25({FTS_TABLE}, 2.0, 1.0)"
+        doc_id = f"{FTS_TABLE}.rowid"
+        source = f"{FTS_TABLE} JOIN executions e ON e.id = {FTS_TABLE}.rowid"
+        filters.insert(0, f"{FTS_TABLE} MATCH :q")
+        params["q"] = match
+    else:
+        if not q.strip():
+            raise ValueError("empty search query")
+        score = "-CAST(ts_rank_cd(s.document, query) AS DOUBLE PRECISION)"
+        doc_id = "s.execution_id"
+        source = (f"{PG_TABLE} s JOIN executions e ON e.id = s.execution_id, "
+                  "websearch_to_tsquery(CAST(:config AS regconfig), :q) query")
+        filters.insert(0, "s.document @@ query")
+        params.update(q=q, config=settings.search_pg_config)
+    if settings.search_max_candidates:
+        # ranquear custa por match: só as N execuções mais novas que casam entram no ranking
+        filters.append(
+            f"{doc_id} >= (SELECT min(doc_id) FROM (SELECT {doc_id} AS doc_id FROM {source} "
+            f"WHERE {' AND '.join(filters)} ORDER BY {doc_id} DESC LIMIT :candidates) AS candidates)"
+        )
+        params["candidates"] = settings.search_max_candidates
+    if after is not None:
+        filters.append(f"({score} > :after_score OR ({score} = :after_score AND e.id > :after_id))")
+        params.update(after_score=after[0], after_id=after[1])
+    stmt = text(
+        f"SELECT e.id, {score} AS score FROM {source} WHERE {' AND '.join(filters)} "
+        "ORDER BY score, e.id LIMIT :limit"
+    )
+    return [(id, score) for id, score in (await db.execute(stmt, params)).all()]
+
+
+async def reindex(batch_size: int = 1000) -> int:
+    """Index every finished execution; returns rows written (already indexed ones are replaced or skipped)."""
+    Execution = models.Execution
+    async with async_engine.begin() as conn:
+        await conn.run_sync(create_search_index)
+    if not enabled():
+        raise SearchUnavailable("Search is not available on this database")
+    total, last_id = 0, 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            rows = (
+                await db.execute(
+                    select(Execution)
+                    .options(load_only(Execution.id, Execution.input, Execution.result))
+                    .where(Execution.id > last_id, Execution.status.in_(("completed", "failed")))
+                    .order_by(Execution.id)
+                    .limit(batch_size)
+                )
+            ).scalars().all()
+            if not rows:
+                return total
+            await load_result_blobs(*rows)
+            total += await index_rows(db, {exe.id: (exe.input, exe.result) for exe in rows})
+            await db.commit()
+        last_id = rows[-1].id
@@ -0,0 +1,329 @@
+"""Semantic result cache: executions whose input is close to an earlier one reuse its result.
+
+Optional (`semantic_cache_enabled`, needs `numpy`). It sits behind the
+exact `result_cache` in `process_execution`: on an exact miss the input is
+embedded and compared with earlier inputs of the same agent, provider,
+model and generation params, and a cosine similarity of at least
+`semantic_cache_threshold` serves that earlier result without calling
+upstream.
+
+- Embedding: signed feature hashing of character 3-5-grams and word
+  unigrams/bigrams into `semantic_cache_dim` float32 buckets, L2-normalized.
+  CPU only, no model to download, identical across processes (crc32, not
+  the per-process `hash()`), so persisted vectors stay valid.
+- Index: one matrix per (agent, provider/model/params), grown by doubling
+  up to `semantic_cache_max_entries_per_agent` rows; a lookup is one
+  matrix-vector product. A full index replaces its least recently used row,
+  rows older than `semantic_cache_ttl_seconds` never match, and past
+  `semantic_cache_max_indexes` the least recently used index is dropped.
+- Persistence: changed indexes are written every
+  `semantic_cache_save_interval` seconds and at shutdown, one `.npz` per
+  index under storage_path/semantic_cache, and loaded at startup.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+import anyio
+
+from ..core.config import settings
+from . import metrics
+
+try:
+    import numpy as np
+except ImportError:  # opcional: sem numpy o cache semântico fica desligado
+    np = None
+
+logger = logging.getLogger("semantic_cache")
+
+FEATURIZER_VERSION = 1
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_CHAR_NGRAMS = (3, 4, 5)
+# peso relativo dos tipos de feature (palavras contam mais que n-grams de caracteres)
+_WEIGHTS = {"w": 1.0, "b": 1.0, "c": 0.5}
+
+
+def featurize(text: str, dim: int):
+    """L2-normalized float32 vector of hashed word and character n-gram counts."""
+    words = _WORD.findall(text.casefold())
+    features = [f"w:{w}" for w in words]
+    features += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    joined = f" {' '.join(words)} "
+    for n in _CHAR_NGRAMS:
+        features += [f"c:{joined[i:i + n]}" for i in range(len(joined) - n + 1)]
+    vec = np.zeros(dim, dtype=np.float32)
+    if not features:
+        return vec
+    hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+    weights = np.fromiter((_WEIGHTS[f[0]] for f in features), dtype=np.float32, count=len(features))
+    # bit alto decide o sinal: colisões tendem a se cancelar em vez de somar
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    vec += np.bincount(hashes % dim, weights=weights * signs, minlength=dim).astype(np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+class Probe:
+    """Outcome of one lookup; `add()` reuses its vector when the provider's result comes back."""
+
+    __slots__ = ("key", "vector", "result", "similarity")
+
+    def __init__(self, key: tuple[int, str], vector, result: str | None, similarity: float):
+        self.key = key
+        self.vector = vector
+        self.result = result
+        self.similarity = similarity
+
+
+class _Index:
+    """Vectors and results for one (agent, variant); rows [0, size) are live."""
+
+    def __init__(self, dim: int, rows: int = 16):
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)
+        self.created = np.zeros(rows, dtype=np.float64)
+        self.used = np.zeros(rows, dtype=np.float64)
+        self.results: list[str] = []
+        self.size = 0
+        self.dirty = False
+
+    def search(self, vector, now: float, ttl: float) -> tuple[int, float]:
+        """(row, cosine similarity) of the best live row, or (-1, 0.0)."""
+        if not self.size:
+            return -1, 0.0
+        scores = self.vectors[: self.size] @ vector
+        if ttl:
+            scores[self.created[: self.size] < now - ttl] = -1.0
+        row = int(np.argmax(scores))
+        return row, float(scores[row])
+
+    def add(self, vector, result: str, now: float, capacity: int) -> bool:
+        """Store a row; True when an older row had to be evicted for it."""
+        evicted = False
+        if self.size >= capacity:
+            row = int(np.argmin(self.used[: self.size]))
+            self.results[row] = result
+            evicted = True
+        else:
+            if self.size == len(self.vectors):
+                self._grow(min(capacity, 2 * len(self.vectors)))
+            row = self.size
+            self.size += 1
+            self.results.append(result)
+        self.vectors[row] = vector
+        self.created[row] = self.used[row] = now
+        self.dirty = True
+        return evicted
+
+    def _grow(self, rows: int):
+        vectors = np.zeros((rows, self.vectors.shape[1]), dtype=np.float32)
+        vectors[: self.size] = self.vectors[: self.size]
+        created, used = np.zeros(rows), np.zeros(rows)
+        created[: self.size] = self.created[: self.size]
+        used[: self.size] = self.used[: self.size]
+        self.vectors, self.created, self.used = vectors, created, used
+
+    def drop_expired(self, now: float, ttl: float) -> int:
+        if not ttl or not self.size:
+            return 0
+        keep = np.flatnonzero(self.created[: self.size] >= now - ttl)
+        removed = self.size - len(keep)
+        if removed:
+            self.vectors[: len(keep)] = self.vectors[keep]
+            self.created[: len(keep)] = self.created[keep]
+            self.used[: len(keep)] = self.used[keep]
+            self.results = [self.results[i] for i in keep]
+            self.size = len(keep)
+            self.dirty = True
+        return removed
+
+
+class SemanticCache:
+    def __init__(self):
+        self.path = Path(settings.storage_path) / "semantic_cache"
+        self._indexes: OrderedDict[tuple[int, str], _Index] = OrderedDict()
+        self._dropped: set[tuple[int, str]] = set()
+        self._task: asyncio.Task | None = None
+        self._warned = False
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "dropped_indexes": 0, "saves": 0}
+
+    @property
+    def enabled(self) -> bool:
+        if not settings.semantic_cache_enabled:
+            return False
+        if np is None:
+            if not self._warned:
+                logger.warning("SEMANTIC_CACHE_ENABLED=1 but the `numpy` package is missing; semantic cache disabled")
+                self._warned = True
+            return False
+        return True
+
+    # ---- disco (executado em thread pool) ----
+    def _file(self, key: tuple[int, str]) -> Path:
+        return self.path / f"{key[0]}-{key[1]}.npz"
+
+    def _save_sync(self, key: tuple[int, str], arrays: dict):
+        self.path.mkdir(parents=True, exist_ok=True)
+        dest = self._file(key)
+        tmp = dest.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, dest)
+
+    def _load_sync(self) -> dict:
+        indexes = {}
+        now, ttl = time.time(), settings.semantic_cache_ttl_seconds
+        for path in sorted(self.path.glob("*.npz")):
+            try:
+                with np.load(path) as data:
+                    meta = json.loads(data["meta"].tobytes())
+                    if meta.get("version") != FEATURIZER_VERSION or meta.get("dim") != settings.semantic_cache_dim:
+                        # vetores de outro featurizer não são comparáveis: recomeça
+                        path.unlink(missing_ok=True)
+                        continue
+                    results = json.loads(data["results"].tobytes())
+                    index = _Index(settings.semantic_cache_dim, max(16, len(results)))
+                    index.size = len(results)
+                    index.vectors[: index.size] = data["vectors"]
+                    index.created[: index.size] = data["created"]
+                    index.used[: index.size] = data["used"]
+                    index.results = results
+            except (OSError, ValueError, KeyError):
+                logger.warning("[semantic_cache] ignoring unreadable index %s", path.name)
+                continue
+            index.drop_expired(now, ttl)
+            index.dirty = False
+            indexes[(meta["agent_id"], meta["variant"])] = index
+        return indexes
+
+    @staticmethod
+    def _arrays(key: tuple[int, str], index: _Index) -> dict:
+        meta = {"version": FEATURIZER_VERSION, "dim": index.vectors.shape[1], "agent_id": key[0], "variant": key[1]}
+        return {
+            "meta": np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+            "vectors": index.vectors[: index.size].copy(),
+            "created": index.created[: index.size].copy(),
+            "used": index.used[: index.size].copy(),
+            "results": np.frombuffer(json.dumps(index.results).encode("utf-8"), dtype=np.uint8),
+        }
+
+    async def save(self) -> int:
+        """Write changed indexes and delete the files of dropped ones; indexes written."""
+        written = 0
+        for key in list(self._dropped):
+            self._dropped.discard(key)
+            await anyio.to_thread.run_sync(lambda k=key: self._file(k).unlink(missing_ok=True))
+        for key, index in list(self._indexes.items()):
+            if not index.dirty:
+                continue
+            # cópia no loop: a thread grava um retrato consistente enquanto o índice segue mudando
+            arrays = self._arrays(key, index)
+            index.dirty = False
+            try:
+                await anyio.to_thread.run_sync(self._save_sync, key, arrays)
+                written += 1
+            except OSError:
+                index.dirty = True
+                logger.exception("[semantic_cache] failed to save index %s", key)
+        self.stats["saves"] += written
+        return written
+
+    # ---- ciclo de vida ----
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        try:
+            loaded = await anyio.to_thread.run_sync(self._load_sync)
+        except OSError:
+            logger.exception("[semantic_cache] failed to load indexes")
+            loaded = {}
+        self._indexes.update(loaded)
+        if loaded:
+            logger.info("[semantic_cache] loaded %d indexes (%d entries)", len(loaded),
+                        sum(i.size for i in loaded.values()))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await self.save()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.semantic_cache_save_interval)
+            try:
+                now, ttl = time.time(), settings.semantic_cache_ttl_seconds
+                for index in self._indexes.values():
+                    self.stats["expired"] += index.drop_expired(now, ttl)
+                await self.save()
+            except Exception:
+                logger.exception("[semantic_cache] periodic save failed")
+
+    # ---- API ----
+    async def lookup(self, agent_id: int, variant: str, text: str) -> Probe:
+        """Embed `text` and look for a close enough input in the (agent, variant) index."""
+        t0 = time.perf_counter()
+        key = (agent_id, variant)
+        vector = await anyio.to_thread.run_sync(featurize, text, settings.semantic_cache_dim)
+        index = self._indexes.get(key)
+        result, similarity = None, 0.0
+        if index is not None:
+            self._indexes.move_to_end(key)
+            now = time.time()
+            row, similarity = index.search(vector, now, settings.semantic_cache_ttl_seconds)
+            if row >= 0 and similarity >= settings.semantic_cache_threshold:
+                index.used[row] = now
+                result = index.results[row]
+        elapsed = time.perf_counter() - t0
+        outcome = "hit" if result is not None else "miss"
+        self.stats["hits" if result is not None else "misses"] += 1
+        metrics.semantic_cache_lookups.inc(outcome=outcome)
+        metrics.semantic_cache_lookup_seconds.observe(elapsed)
+        if index is not None and index.size:
+            metrics.semantic_cache_similarity.observe(similarity)
+        spans = metrics.current_spans.get()
+        if spans is not None:
+            spans.step("semantic_cache_" + outcome, elapsed)
+        return Probe(key, vector, result, similarity)
+
+    def add(self, probe: Probe, result: str):
+        """Remember `result` for the input embedded by `probe` (after a miss)."""
+        index = self._indexes.get(probe.key)
+        if index is None:
+            index = self._indexes[probe.key] = _Index(settings.semantic_cache_dim)
+            while len(self._indexes) > settings.semantic_cache_max_indexes:
+                dropped, _ = self._indexes.popitem(last=False)
+                self._dropped.add(dropped)
+                self.stats["dropped_indexes"] += 1
+        self._indexes.move_to_end(probe.key)
+        if index.add(probe.vector, result, time.time(), settings.semantic_cache_max_entries_per_agent):
+            self.stats["evictions"] += 1
+
+    def entries(self) -> int:
+        return sum(index.size for index in self._indexes.values())
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "enabled": self.enabled,
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else None,
+            "threshold": settings.semantic_cache_threshold,
+            "indexes": len(self._indexes),
+            "entries": self.entries(),
+            "matrix_bytes": sum(index.vectors.nbytes for index in self._indexes.values()),
+        }
+
+
+semantic_cache = SemanticCache()
@@ -1,8 +1,19 @@
+import asyncio
+import hashlib
 import os
+import re
+import tempfile
 from pathlib import Path
 from typing import Tuple
 
+import aiofiles
+from sqlalchemy.orm.attributes import set_committed_value
+
 from ..core.config import settings
+from ..db.types import OffRow, compress, decompress, result_blob_path
+
+CHUNK_SIZE = 1024 * 1024
+_BYTE_RANGE = re.compile(r"bytes=([0-9]*)-([0-9]*)")
 
 
 def ensure_storage_path() -> Path:
@@ -11,10 +22,125 @@ def ensure_storage_path() -> Path:
     return p
 
 
-def save_file(filename: str, data: bytes) -> Tuple[str, str]:
-    storage = ensure_storage_path()
-    dest = storage / filename
-    with open(dest, "wb") as f:
-        f.write(data)
-    url = str(dest.resolve())
-    return filename, url
+def blob_path(sha256: str) -> Path:
+    """Content-addressed location: blobs/ab/cd/<sha256>. Never derived from user input."""
+    return Path(settings.storage_path) / "blobs" / sha256[:2] / sha256[2:4] / sha256
+
+
+async def save_upload(upload) -> Tuple[str, int]:
+    """Stream an `UploadFile` to disk in chunks while hashing it.
+
+    Returns `(sha256, size)`. The data lands in a temp file first and is then
+    renamed into its content-addressed path; if that blob already exists the
+    temp file is dropped, so identical uploads are stored once.
+    """
+    tmp_dir = ensure_storage_path() / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+    os.close(fd)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp, "wb") as f:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                await f.write(chunk)
+        sha256 = digest.hexdigest()
+        dest = blob_path(sha256)
+        if dest.exists():
+            os.unlink(tmp)
+        else:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return sha256, size
+
+
+def _write_result_blob(text: str) -> str:
+    raw = text.encode("utf-8")
+    sha256 = hashlib.sha256(raw).hexdigest()
+    dest = result_blob_path(sha256)
+    if not dest.exists():
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dest.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(compress(raw)[1])
+            os.replace(tmp, dest)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+    return sha256
+
+
+async def store_result_blob(text: str) -> OffRow:
+    """Write `text` compressed to `storage_path/results/<sha256>` (once per content).
+
+    Bind the returned `OffRow` to a `CompressedText` column instead of the text.
+    """
+    return OffRow(await asyncio.to_thread(_write_result_blob, text))
+
+
+def _read_result_blob(sha256: str) -> str:
+    return decompress(result_blob_path(sha256).read_bytes())
+
+
+async def load_result_blobs(*objs, fields=("input", "result")):
+    """Replace `OffRow` references loaded from `CompressedText` columns with their text.
+
+    The blobs are read in a worker thread; only attributes already loaded are
+    touched (nothing is lazy-loaded) and the objects are not marked dirty.
+    """
+    for obj in objs:
+        for field in fields:
+            value = obj.__dict__.get(field)
+            if isinstance(value, OffRow):
+                set_committed_value(obj, field, await asyncio.to_thread(_read_result_blob, value.sha256))
+    return objs
+
+
+def parse_range(header: str | None, size: int) -> Tuple[int, int] | None:
+    """Parse a single `Range: bytes=start-end` header into an inclusive (start, end).
+
+    Returns None when there is no usable range (absent, malformed or several
+    ranges: the full body is sent); raises ValueError for a well-formed range
+    that cannot be satisfied (416).
+    """
+    m = _BYTE_RANGE.fullmatch(header.strip()) if header else None
+    if m is None or m.group(1) == m.group(2) == "":
+        return None
+    start_s, end_s = m.groups()
+    if start_s == "":
+        # sufixo: últimos N bytes; `-0` (ou arquivo vazio) não tem o que servir
+        length = int(end_s)
+        if length == 0 or size == 0:
+            raise ValueError("range not satisfiable")
+        return max(0, size - length), size - 1
+    start = int(start_s)
+    if end_s and int(end_s) < start:
+        # last-pos antes de first-pos é um header inválido: ignorado
+        return None
+    end = int(end_s) if end_s else size - 1
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+async def iter_file_range(path: Path, start: int, end: int):
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
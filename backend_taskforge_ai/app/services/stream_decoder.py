@@ -0,0 +1,332 @@
+"""Incremental decoders for streamed provider responses.
+
+Network chunks can end anywhere — in the middle of a `data:` line, of a JSON
+object or of a multi-byte character — so each decoder appends the chunk to
+one buffer, returns the payloads that are now complete and keeps only the
+unfinished tail. SSE and NDJSON are framed on bytes and their payloads go to
+`json.loads` as bytes; the JSON-array decoder hands back parsed objects.
+Provider parsers turn each object into typed `StreamEvent`s.
+"""
+
+import codecs
+import json
+import re
+
+_NL = ord("\n")
+_CR = ord("\r")
+
+
+class StreamEvent:
+    """One typed delta from a provider stream.
+
+    `kind` is "text" (value: str), "usage" (value: provider usage dict),
+    "finish" (value: finish reason) or "error" (value: provider error).
+    """
+
+    __slots__ = ("kind", "value")
+
+    def __init__(self, kind: str, value):
+        self.kind = kind
+        self.value = value
+
+    def __repr__(self):
+        return f"StreamEvent({self.kind!r}, {self.value!r})"
+
+
+class _LineDecoder:
+    """Shared line splitting over a byte buffer (`\\n` or `\\r\\n` endings)."""
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def _lines(self, chunk: bytes):
+        buf = self._buf
+        buf += chunk
+        start = 0
+        while True:
+            nl = buf.find(_NL, start)
+            if nl < 0:
+                break
+            end = nl - 1 if nl > start and buf[nl - 1] == _CR else nl
+            yield bytes(buf[start:end])
+            start = nl + 1
+        del buf[:start]
+
+    def _rest(self) -> bytes:
+        rest, self._buf = bytes(self._buf).rstrip(b"\r"), bytearray()
+        return rest
+
+
+class SSEDecoder(_LineDecoder):
+    """`text/event-stream`: one payload per event (its `data:` lines joined by `\\n`)."""
+
+    def __init__(self):
+        super().__init__()
+        self._data: list[bytes] = []
+
+    def _line(self, line: bytes, out: list):
+        if not line:
+            if self._data:
+                out.append(b"\n".join(self._data))
+                self._data = []
+        elif line.startswith(b"data:"):
+            value = line[5:]
+            self._data.append(value[1:] if value[:1] == b" " else value)
+        # comentários (":"), event:, id: e retry: não carregam conteúdo
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        out = []
+        for line in self._lines(chunk):
+            self._line(line, out)
+        return out
+
+    def close(self) -> list[bytes]:
+        out = []
+        rest = self._rest()
+        if rest:
+            self._line(rest, out)
+        self._line(b"", out)
+        return out
+
+
+class NDJSONDecoder(_LineDecoder):
+    """Newline-delimited payloads (NDJSON / JSON lines); blank lines are skipped."""
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        return [line for line in self._lines(chunk) if line.strip()]
+
+    def close(self) -> list[bytes]:
+        rest = self._rest()
+        return [rest] if rest.strip() else []
+
+
+_BETWEEN = re.compile(r"[\s,]*")
+# dentro de um elemento só importam colchetes: pula (em C) caracteres comuns e strings
+# inteiras até o próximo colchete. Um `"` no fim do match é uma string que o chunk cortou
+_NEXT_BRACKET = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*(?:([{}\[\]"])|\Z)', re.S)
+# resto de uma string cortada: para antes do `"` final ou de uma `\` solta no fim do texto
+_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+_SCALAR_END = re.compile(r"[,\]\s]")
+# acima disso um elemento incompleto deixa de ser re-tentado pelo raw_decode a cada chunk
+_RETRY_CHARS = 4096
+
+
+class JSONArrayDecoder:
+    """A JSON array streamed element by element (or bare top-level values).
+
+    Unlike the line decoders this one keeps text, not bytes: each chunk is
+    decoded once by an incremental UTF-8 decoder (a character cut by the
+    chunk waits for the rest) so the C JSON scanner can frame and parse each
+    element straight off the buffer. An element cut by the chunk is retried
+    from its start on the next one while it is short; once it outgrows
+    `_RETRY_CHARS` the decoder stops retrying, keeps the pieces in a list and
+    tracks bracket depth over each new piece only, so a multi-megabyte
+    element costs linear time and is parsed once when it closes.
+
+    `feed` returns parsed objects. An element that is not valid JSON, or one
+    cut short by `close`, comes back as its raw bytes and `payload_events`
+    passes it through as text.
+    """
+
+    def __init__(self):
+        self._text = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._raw_decode = json.JSONDecoder().raw_decode
+        self._buf = ""
+        self._in_array = False  # dentro do array de nível de cima
+        # elemento grande em andamento: pedaços e estado do scanner de colchetes
+        self._parts: list[str] | None = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False  # `\` no fim do último pedaço, dentro de uma string
+
+    def _track(self, text: str, pos: int = 0) -> int:
+        """Advance the open element over `text`; returns the index just past its end, or -1."""
+        n = len(text)
+        if self._escape:
+            if pos >= n:
+                return -1
+            self._escape = False
+            pos += 1
+        depth = self._depth
+        while True:
+            if self._in_string:
+                end = _STRING_TAIL.match(text, pos).end()
+                if end >= n or text[end] != '"':
+                    self._escape = end < n  # sobrou só a `\`
+                    break
+                self._in_string = False
+                pos = end + 1
+                if depth == 0:
+                    return pos
+                continue
+            m = _NEXT_BRACKET.match(text, pos)
+            if m.lastindex is None:
+                break  # fim do texto sem colchete
+            pos = m.end()
+            char = text[pos - 1]
+            if char == '"':
+                self._in_string = True
+                continue
+            depth += 1 if char in "{[" else -1
+            if depth == 0:
+                self._depth = 0
+                return pos
+        self._depth = depth
+        return -1
+
+    def _decode(self, text: str, final: bool = False) -> list:
+        out = []
+        if self._parts is not None:
+            end = self._track(text)
+            if end < 0:
+                self._parts.append(text)
+                return out
+            self._parts.append(text[:end])
+            element, self._parts = "".join(self._parts), None
+            try:
+                out.append(json.loads(element))
+            except ValueError:
+                out.append(element.encode())
+            text = text[end:]
+        buf = self._buf + text if self._buf else text
+        pos, n = 0, len(buf)
+        while True:
+            pos = _BETWEEN.match(buf, pos).end()
+            if pos >= n:
+                break
+            char = buf[pos]
+            if char == "[" and not self._in_array:
+                self._in_array = True
+                pos += 1
+                continue
+            if char == "]" and self._in_array:
+                self._in_array = False
+                pos += 1
+                continue
+            try:
+                obj, end = self._raw_decode(buf, pos)
+            except ValueError:
+                end = -1
+            # um número no fim do texto pode continuar no próximo chunk
+            if end >= 0 and (end < n or final or not isinstance(obj, (int, float))):
+                out.append(obj)
+                pos = end
+                continue
+            if char in '{["':
+                if n - pos < _RETRY_CHARS and not final:
+                    break  # ainda curto: re-tenta do início com o próximo chunk
+                self._depth, self._in_string, self._escape = 0, False, False
+                end = self._track(buf, pos)
+                if end < 0:
+                    self._parts = [buf[pos:]]
+                    pos = n
+                    break
+            else:
+                # escalar inválido (ou incompleto): termina no próximo separador
+                m = _SCALAR_END.search(buf, pos)
+                if m is None and not final:
+                    break
+                end = max(m.start() if m else n, pos + 1)
+            # completo mas não é JSON: vai como texto
+            out.append(buf[pos:end].encode())
+            pos = end
+        self._buf = buf[pos:]
+        return out
+
+    def feed(self, chunk: bytes) -> list:
+        return self._decode(self._text.decode(chunk))
+
+    def close(self) -> list:
+        out = self._decode(self._text.decode(b"", final=True), final=True)
+        rest = "".join(self._parts) if self._parts is not None else self._buf
+        if rest.strip():
+            # elemento truncado: vai como está (payload_events o trata como texto)
+            out.append(rest.encode())
+        self.__init__()
+        return out
+
+
+def decoder_for(content_type: str | None):
+    """Pick the framing from the response Content-Type (line-based when unknown)."""
+    ct = (content_type or "").split(";")[0].strip().lower()
+    if ct == "text/event-stream":
+        return SSEDecoder()
+    if ct in ("application/json", "text/json"):
+        return JSONArrayDecoder()
+    return NDJSONDecoder()
+
+
+# ---- provider parsers: objeto JSON -> StreamEvents ----
+def gemini_events(obj) -> list[StreamEvent]:
+    """One `GenerateContentResponse` from `streamGenerateContent` (first candidate only)."""
+    if not isinstance(obj, dict):
+        return []
+    if "error" in obj:
+        return [StreamEvent("error", obj["error"])]
+    events = []
+    candidates = obj.get("candidates") or []
+    if candidates:
+        candidate = candidates[0]
+        for part in (candidate.get("content") or {}).get("parts") or []:
+            text = part.get("text")
+            if text:
+                events.append(StreamEvent("text", text))
+        if candidate.get("finishReason"):
+            events.append(StreamEvent("finish", candidate["finishReason"]))
+    if obj.get("usageMetadata"):
+        events.append(StreamEvent("usage", obj["usageMetadata"]))
+    return events
+
+
+def huggingface_events(obj) -> list[StreamEvent]:
+    """Inference API items (`generated_text`) and TGI stream frames (`token`, `details`)."""
+    if isinstance(obj, list):
+        return [ev for item in obj[:1] for ev in huggingface_events(item)]
+    if not isinstance(obj, dict):
+        return []
+    if "error" in obj:
+        return [StreamEvent("error", obj["error"])]
+    events = []
+    token = obj.get("token")
+    if isinstance(token, dict):
+        if token.get("text") and not token.get("special"):
+            events.append(StreamEvent("text", token["text"]))
+    elif isinstance(obj.get("generated_text"), str):
+        events.append(StreamEvent("text", obj["generated_text"]))
+    details = obj.get("details")
+    if isinstance(details, dict):
+        if details.get("finish_reason"):
+            events.append(StreamEvent("finish", details["finish_reason"]))
+        if details.get("generated_tokens") is not None:
+            events.append(StreamEvent("usage", {"generated_tokens": details["generated_tokens"]}))
+    return events
+
+
+def payload_events(payload, parse) -> list[StreamEvent]:
+    """Decode one framed payload; non-JSON payloads are passed through as text.
+
+    Already-parsed objects (from `JSONArrayDecoder`) skip `json.loads`.
+    """
+    if isinstance(payload, bytes):
+        if payload == b"[DONE]":
+            return []
+        try:
+            obj = json.loads(payload)
+        except ValueError:
+            return [StreamEvent("text", payload.decode("utf-8", errors="replace"))]
+    else:
+        obj = payload
+    if isinstance(obj, str):
+        return [StreamEvent("text", obj)] if obj else []
+    return parse(obj)
+
+
+async def iter_events(chunks, decoder, parse):
+    """Async iterator of `StreamEvent`s over an async iterator of byte chunks."""
+    async for chunk in chunks:
+        for payload in decoder.feed(chunk):
+            for ev in payload_events(payload, parse):
+                yield ev
+    for payload in decoder.close():
+        for ev in payload_events(payload, parse):
+            yield ev
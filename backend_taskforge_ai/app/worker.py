@@ -0,0 +1,63 @@
+"""Standalone execution worker: runs the scheduler without the HTTP API.
+
+Run: `python -m app.worker` next to API processes started with
+`SCHEDULER_ENABLED=0`. Streams reach the API processes through a
+cross-process broker (`EVENT_BROKER=sqlite` or `redis`).
+"""
+
+import asyncio
+import logging
+
+from .core.config import settings
+from .db import base as db_base
+from .db import schema as db_schema
+from .db import session as db_session
+from .services.broker import get_broker
+from .services.channels import channel_sweeper
+from .services import metrics
+from .services.http_clients import provider_clients
+from .services.providers import hf_batcher
+from .services.persistence import execution_writer
+from .services.rate_limit import rate_limiter
+from .services import search
+from .services.scheduler import scheduler
+from .services.semantic_cache import semantic_cache
+
+logger = logging.getLogger("worker")
+
+
+async def run():
+    if settings.event_broker == "memory":
+        logger.warning("EVENT_BROKER=memory: streams from this worker are not visible to API processes")
+    metrics.instrument_engine(db_session.async_engine)
+    async with db_session.async_engine.begin() as conn:
+        await conn.run_sync(db_base.Base.metadata.create_all)
+        await conn.run_sync(db_schema.add_missing_columns)
+        await conn.run_sync(db_schema.create_missing_indexes)
+        await conn.run_sync(search.create_search_index)
+    await provider_clients.start()
+    await get_broker().start()
+    await channel_sweeper.start()
+    await execution_writer.start()
+    await semantic_cache.start()
+    await scheduler.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await scheduler.stop()
+        await execution_writer.stop()
+        await channel_sweeper.stop()
+        await get_broker().stop()
+        await rate_limiter.stop()
+        await hf_batcher.stop()
+        await semantic_cache.stop()
+        await provider_clients.close()
+        await db_session.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,84 @@
+"""Benchmark: cost of resolving the current user per request, cached vs. uncached.
+
+Run from backend_taskforge_ai: `python -m benchmarks.auth [--requests 5000]`.
+
+Uses a throwaway SQLite database and calls the auth dependency directly
+(no HTTP) so only the auth work is measured:
+
+- uncached: JWT signature check + primary-key SELECT on every call (the
+  previous `users.get_current_user`);
+- token cached: the token LRU hit skips the signature check, the user is
+  still loaded from the DB;
+- cached: both caches hit, no crypto and no DB.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+_tmp = tempfile.TemporaryDirectory(prefix="taskforge-auth-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/bench.db"
+
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+from jose import jwt  # noqa: E402
+
+from app.api import deps  # noqa: E402
+from app.api.v1.auth import create_access_token  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.db import base, models  # noqa: E402
+from app.db.session import AsyncSessionLocal, async_engine  # noqa: E402
+
+
+async def uncached(token: str):
+    payload = jwt.decode(token, settings.secret_key, algorithms=["HS256"])
+    async with AsyncSessionLocal() as db:
+        return await db.get(models.User, int(payload["sub"]))
+
+
+async def token_cached(token: str):
+    user_id = deps.verify_token(token)
+    async with AsyncSessionLocal() as db:
+        return await db.get(models.User, user_id)
+
+
+async def cached(token: str):
+    return await deps.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
+
+async def bench(fn, token: str, n: int) -> float:
+    await fn(token)  # aquece (e preenche os caches)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        await fn(token)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+async def main_async(n: int):
+    async with async_engine.begin() as conn:
+        await conn.run_sync(base.Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = models.User(email="bench@example.com", hashed_password="x", display_name="bench")
+        db.add(user)
+        await db.commit()
+        token = create_access_token(user.id)
+
+    print(f"{'path':14} {'us/request':>11} {'requests/s':>11}")
+    results = {}
+    for name, fn in (("uncached", uncached), ("token cached", token_cached), ("cached", cached)):
+        us = results[name] = await bench(fn, token, n)
+        print(f"{name:14} {us:11.1f} {1e6 / us:11.0f}")
+    print(f"\ncached is {results['uncached'] / results['cached']:.0f}x cheaper than uncached")
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""Load driver: runs executions end to end and reports latency, throughput and resource use.
+
+Run from backend_taskforge_ai:
+
+    python -m benchmarks.load [--executions 200] [--concurrency 20] [--mode stream|poll|longpoll]
+                              [--fanout 1] [--provider gemini|huggingface] [mock provider options]
+
+Without `--api` it starts `benchmarks.mock_provider` and the API (uvicorn,
+fresh SQLite database in a temp dir, pointed at the mock) as subprocesses;
+`--api-env KEY=VALUE` passes settings to that API process. With `--api URL`
+it drives an already running backend (configure its provider yourself).
+
+Each of `--concurrency` clients loops: `POST /api/v1/executions/`, then
+follows the execution until it finishes, either with `--fanout` parallel
+`/stream` subscribers, by polling `GET /executions/{id}` every
+`--poll-interval` seconds, or by long-polling it with `?wait=&since_version=`.
+
+Reported: executions/s, time to first output seen by the client (TTFT) and
+end-to-end latency from the POST (p50/p99), the API process RSS (sampled,
+spawned API only), and DB write time from `/metrics`
+(`taskforge_db_write_seconds`, which includes SQLite write-lock waits).
+Results are written as JSON (`--output`); `--compare OLD.json` prints the
+change of the headline numbers against an earlier run.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from . import mock_provider
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+TERMINAL = ("completed", "failed")
+
+# números comparados com --compare: (caminho no JSON, maior é melhor)
+HEADLINE = [
+    ("throughput_per_s", True),
+    ("ttft_ms.p50", False),
+    ("ttft_ms.p99", False),
+    ("e2e_ms.p50", False),
+    ("e2e_ms.p99", False),
+    ("rss_mb.peak", False),
+    ("db.write_ms_mean", False),
+    ("db.writes_over_100ms", False),
+]
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """Nearest-rank percentile (None for no samples)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(p / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+def summarize(values: list[float]) -> dict:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {"n": 0, "p50": None, "p99": None, "mean": None, "max": None}
+    return {
+        "n": len(values),
+        "p50": round(percentile(values, 50), 2),
+        "p99": round(percentile(values, 99), 2),
+        "mean": round(sum(values) / len(values), 2),
+        "max": round(max(values), 2),
+    }
+
+
+def parse_metrics(text: str) -> dict[str, float]:
+    """Prometheus text -> {"name{labels}": value}."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, _, value = line.rpartition(" ")
+        try:
+            samples[name] = float(value)
+        except ValueError:
+            continue
+    return samples
+
+
+def db_report(before: dict, after: dict) -> dict:
+    """DB write time and executor DB helper calls during the run (metric deltas)."""
+    def delta(name):
+        return after.get(name, 0.0) - before.get(name, 0.0)
+
+    writes = delta("taskforge_db_write_seconds_count")
+    write_seconds = delta("taskforge_db_write_seconds_sum")
+    report = {
+        "writes": int(writes),
+        "write_wait_ms_total": round(write_seconds * 1000, 1),
+        "write_ms_mean": round(write_seconds * 1000 / writes, 3) if writes else None,
+        "writes_over_100ms": int(writes - delta('taskforge_db_write_seconds_bucket{le="0.1"}')),
+        "calls": {},
+    }
+    for op in ("fetch", "update", "commit"):
+        count = delta(f'taskforge_db_call_seconds_count{{op="{op}"}}')
+        total = delta(f'taskforge_db_call_seconds_sum{{op="{op}"}}')
+        if count:
+            report["calls"][op] = {"count": int(count), "mean_ms": round(total * 1000 / count, 3)}
+    return report
+
+
+def hf_batch_report(before: dict, after: dict) -> dict | None:
+    """HF requests sent and inputs per request during the run (None without HF traffic)."""
+    requests = after.get("taskforge_hf_batch_size_count", 0.0) - before.get("taskforge_hf_batch_size_count", 0.0)
+    if not requests:
+        return None
+    inputs = after.get("taskforge_hf_batch_size_sum", 0.0) - before.get("taskforge_hf_batch_size_sum", 0.0)
+    wait = after.get("taskforge_hf_batch_wait_seconds_sum", 0.0) - before.get("taskforge_hf_batch_wait_seconds_sum", 0.0)
+    return {"requests": int(requests), "inputs": int(inputs), "avg_batch": round(inputs / requests, 2),
+            "wait_ms_mean": round(wait * 1000 / inputs, 3) if inputs else None}
+
+
+def read_rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    except psutil.Error:
+        return None
+
+
+class Run:
+    """Shared state of one load run."""
+
+    def __init__(self, args, client: httpx.AsyncClient, agent_id: int):
+        self.args = args
+        self.client = client
+        self.agent_id = agent_id
+        self.tag = datetime.now().strftime("%H%M%S")
+        self.next_index = 0
+        self.samples: list[dict] = []
+        self.errors: dict[str, int] = {}
+
+    def error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    async def client_loop(self):
+        while self.next_index < self.args.executions:
+            index = self.next_index
+            self.next_index += 1
+            try:
+                sample = await asyncio.wait_for(self.one(index), self.args.timeout)
+            except asyncio.TimeoutError:
+                self.error("timeout")
+                continue
+            except httpx.HTTPError as e:
+                self.error(type(e).__name__)
+                continue
+            if sample is not None:
+                self.samples.append(sample)
+
+    async def one(self, index: int) -> dict | None:
+        t0 = time.perf_counter()
+        body = {"agent_id": self.agent_id, "input": f"load {self.tag} #{index}", "bypass_cache": True}
+        resp = await self.client.post("/api/v1/executions/", json=body)
+        if resp.status_code != 200:
+            self.error(f"post_{resp.status_code}")
+            return None
+        post_ms = (time.perf_counter() - t0) * 1000
+        execution_id = resp.json()["id"]
+
+        if self.args.mode == "stream":
+            results = await asyncio.gather(*(self.follow_stream(execution_id, t0) for _ in range(self.args.fanout)))
+            firsts = [r[0] for r in results if r[0] is not None]
+            first = min(firsts) if firsts else None
+            end = max(r[1] for r in results)
+            frames = sum(r[2] for r in results)
+            row = (await self.client.get(f"/api/v1/executions/{execution_id}")).json()
+        else:
+            first, end, row = await self.follow_polling(execution_id, t0)
+            frames = 0
+        return {
+            "id": execution_id,
+            "status": row.get("status"),
+            "post_ms": post_ms,
+            "ttft_ms": None if first is None else (first - t0) * 1000,
+            "e2e_ms": (end - t0) * 1000,
+            "frames": frames,
+            "server_ttft_ms": row.get("ttft_ms"),
+            "queue_wait_ms": row.get("queue_wait_ms"),
+        }
+
+    async def follow_stream(self, execution_id: int, t0: float) -> tuple[float | None, float, int]:
+        """One SSE subscriber: (first text frame time, end time, frames)."""
+        first = None
+        frames = 0
+        event, has_data = None, False
+        async with self.client.stream("GET", f"/api/v1/executions/{execution_id}/stream") as resp:
+            async for line in resp.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    has_data = True
+                elif not line:
+                    if has_data:
+                        frames += 1
+                        if event is None and first is None:
+                            first = time.perf_counter()
+                        elif event == "error":
+                            self.error("stream_error_event")
+                        elif event == "done":
+                            break
+                    event, has_data = None, False
+        return first, time.perf_counter(), frames
+
+    async def follow_polling(self, execution_id: int, t0: float) -> tuple[float | None, float, dict]:
+        first = None
+        version = 0
+        url = f"/api/v1/executions/{execution_id}"
+        while True:
+            if self.args.mode == "longpoll":
+                resp = await self.client.get(url, params={"wait": 25, "since_version": version})
+            else:
+                resp = await self.client.get(url)
+            if resp.status_code == 200:
+                row = resp.json()
+                version = row.get("version", version)
+                if first is None and row.get("result"):
+                    first = time.perf_counter()
+                if row.get("status") in TERMINAL:
+                    return first, time.perf_counter(), row
+            elif resp.status_code != 304:
+                self.error(f"get_{resp.status_code}")
+            if self.args.mode == "poll":
+                await asyncio.sleep(self.args.poll_interval)
+
+
+async def sample_rss(pid: int | None, out: list[float], interval: float = 0.25):
+    if pid is None:
+        return
+    while True:
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            out.append(rss)
+        await asyncio.sleep(interval)
+
+
+async def drive(args, api_url: str, api_pid: int | None) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency * (args.fanout + 1) + 10, max_keepalive_connections=None)
+    timeout = httpx.Timeout(args.timeout, connect=10.0)
+    async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=timeout) as client:
+        resp = await client.post("/api/v1/agents/", json={"name": "load-test", "description": "benchmarks.load"})
+        resp.raise_for_status()
+        run = Run(args, client, resp.json()["id"])
+        before = parse_metrics((await client.get("/metrics")).text)
+
+        rss: list[float] = []
+        sampler = asyncio.create_task(sample_rss(api_pid, rss))
+        started = time.perf_counter()
+        await asyncio.gather(*(run.client_loop() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+        sampler.cancel()
+        if api_pid is not None:
+            rss.append(read_rss_mb(api_pid) or 0.0)
+
+        after = parse_metrics((await client.get("/metrics")).text)
+
+    samples = run.samples
+    completed = sum(1 for s in samples if s["status"] == "completed")
+    return {
+        "executions": args.executions,
+        "completed": completed,
+        "failed": sum(1 for s in samples if s["status"] == "failed"),
+        "client_errors": run.errors,
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(completed / wall, 3) if wall else None,
+        "post_ms": summarize([s["post_ms"] for s in samples]),
+        "ttft_ms": summarize([s["ttft_ms"] for s in samples]),
+        "e2e_ms": summarize([s["e2e_ms"] for s in samples]),
+        "server_ttft_ms": summarize([s["server_ttft_ms"] for s in samples]),
+        "queue_wait_ms": summarize([s["queue_wait_ms"] for s in samples]),
+        "frames_per_subscriber": round(sum(s["frames"] for s in samples) / max(1, len(samples) * args.fanout), 2)
+        if args.mode == "stream" else None,
+        "rss_mb": {
+            "start": round(rss[0], 1) if rss else None,
+            "peak": round(max(rss), 1) if rss else None,
+            "end": round(rss[-1], 1) if rss else None,
+        },
+        "driver_max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "db": db_report(before, after),
+        "hf_batching": hf_batch_report(before, after),
+    }
+
+
+# ---- processos (mock provider + API) ----
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{url}: process exited with code {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise SystemExit(f"{url}: not ready after {timeout:.0f}s")
+
+
+def spawn(args, workdir: str) -> tuple[str, list[subprocess.Popen]]:
+    root = Path(__file__).resolve().parent.parent
+    mock_port, api_port = free_port(), free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    mock_args = []
+    for key in mock_provider.config:
+        mock_args += ["--" + key.replace("_", "-"), str(getattr(args, key))]
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_provider", "--port", str(mock_port), "--seed", "1", *mock_args], cwd=root
+    )
+    procs = [mock]
+    wait_ready(mock_url + "/stats", mock)
+
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "STORAGE_PATH": f"{workdir}/storage",
+        "BROKER_SQLITE_PATH": f"{workdir}/events.db",
+    }
+    if args.provider == "gemini":
+        env.update(GEMINI_API_KEY="mock", GEMINI_MODEL="mock", GEMINI_BASE_URL=mock_url)
+    else:
+        env.update(GEMINI_API_KEY="", HUGGINGFACEHUB_API_TOKEN="mock", HF_MODEL="mock", HF_BASE_URL=mock_url)
+    for item in args.api_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    api_url = f"http://127.0.0.1:{api_port}"
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(api_port), "--log-level", "warning",
+         "--no-access-log"],
+        cwd=root, env=env,
+    )
+    procs.append(api)
+    wait_ready(api_url + "/health", api)
+    return api_url, procs
+
+
+def git_revision() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=Path(__file__).resolve().parent)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _lookup(results: dict, path: str):
+    value = results
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def compare(old: dict, new: dict):
+    print(f"\ncompared with {old.get('label') or old.get('timestamp')} ({old.get('git') or '?'})")
+    print(f"{'metric':24} {'old':>10} {'new':>10} {'change':>8}")
+    for path, higher_is_better in HEADLINE:
+        a, b = _lookup(old["results"], path), _lookup(new["results"], path)
+        if a is None or b is None:
+            continue
+        change = (b - a) / a * 100 if a else 0.0
+        worse = change < 0 if higher_is_better else change > 0
+        flag = "  <-- worse" if worse and abs(change) >= 10 else ""
+        print(f"{path:24} {a:10.2f} {b:10.2f} {change:+7.1f}%{flag}")
+
+
+def print_report(results: dict):
+    print(f"executions {results['executions']}  completed {results['completed']}  failed {results['failed']}"
+          f"  client errors {results['client_errors'] or 0}")
+    print(f"wall {results['wall_s']}s  throughput {results['throughput_per_s']}/s")
+    for key in ("post_ms", "ttft_ms", "e2e_ms", "server_ttft_ms", "queue_wait_ms"):
+        s = results[key]
+        print(f"{key:15} p50 {s['p50']}  p99 {s['p99']}  mean {s['mean']}  max {s['max']}")
+    print(f"api rss MB      {results['rss_mb']}")
+    db = results["db"]
+    print(f"db writes       {db['writes']}  mean {db['write_ms_mean']} ms  over 100ms {db['writes_over_100ms']}"
+          f"  total {db['write_wait_ms_total']} ms")
+    if results.get("hf_batching"):
+        hf = results["hf_batching"]
+        print(f"hf batching     {hf['requests']} requests for {hf['inputs']} inputs  avg batch {hf['avg_batch']}"
+              f"  wait mean {hf['wait_ms_mean']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api", help="base URL of a running backend (default: spawn mock provider + API)")
+    parser.add_argument("--api-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="setting for the spawned API process (repeatable)")
+    parser.add_argument("--provider", choices=("gemini", "huggingface"), default="gemini")
+    parser.add_argument("--executions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mode", choices=("stream", "poll", "longpoll"), default="stream")
+    parser.add_argument("--fanout", type=int, default=1, help="stream subscribers per execution")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per execution, seconds")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", help="results JSON (default: benchmarks/results/load-<timestamp>.json)")
+    parser.add_argument("--compare", metavar="OLD_JSON", help="print changes against an earlier results file")
+    mock_provider.add_arguments(parser)
+    args = parser.parse_args()
+
+    procs: list[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory(prefix="taskforge-load-") as workdir:
+        try:
+            if args.api:
+                api_url, api_pid = args.api.rstrip("/"), None
+            else:
+                api_url, procs = spawn(args, workdir)
+                api_pid = procs[-1].pid
+            results = asyncio.run(drive(args, api_url, api_pid))
+        finally:
+            for proc in reversed(procs):
+                proc.terminate()
+            for proc in procs:
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+    now = datetime.now(timezone.utc)
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    report = {"label": args.label, "timestamp": now.isoformat(timespec="seconds"), "git": git_revision(),
+              "config": config, "results": results}
+    print_report(results)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load-{now.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nresults: {output}")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark: password verification throughput vs. hashing workers, and its cost to the rest of the API.
+
+Run from backend_taskforge_ai: `python -m benchmarks.login [--logins 64] [--rounds 12] [--workers 0,1,2,4]`.
+
+For each worker count it runs `--logins` concurrent `password_hasher.verify`
+calls (0 workers = the old path, bcrypt on the anyio worker threads) and,
+at the same time, two probes standing in for the other routes: event-loop
+lag (a 10 ms sleep that should wake on time) and a no-op thread-pool call
+(what sync endpoints wait for). Logins/s should grow with workers up to
+the number of cores, while the probes stay flat with a process pool.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import anyio
+
+from app.core.security import PasswordHasher, hash_password
+
+
+async def loop_lag(stop: asyncio.Event, out: list[float]):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.01)
+        out.append((time.perf_counter() - t0 - 0.01) * 1000)
+
+
+async def threadpool_probe(stop: asyncio.Event, out: list[float]):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await anyio.to_thread.run_sync(lambda: None)
+        out.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(0.01)
+
+
+def p99(values: list[float]) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+
+async def run(workers: int, logins: int, rounds: int, hashed: str) -> tuple[float, float, float]:
+    hasher = PasswordHasher(workers=workers, max_queue=logins, rounds=rounds)
+    await hasher.start()
+    try:
+        stop = asyncio.Event()
+        lag, probe = [], []
+        probes = [asyncio.create_task(loop_lag(stop, lag)), asyncio.create_task(threadpool_probe(stop, probe))]
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(hasher.verify("correct horse", hashed) for _ in range(logins)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await asyncio.gather(*probes)
+        assert all(valid for valid, _ in results)
+        return logins / elapsed, p99(lag), p99(probe)
+    finally:
+        await hasher.stop()
+
+
+def main():
+    cores = os.cpu_count() or 1
+    default_workers = sorted({0, 1, 2, 4, cores})
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", default=",".join(map(str, default_workers)),
+                        help="comma-separated worker counts (0 = anyio threads)")
+    args = parser.parse_args()
+
+    hashed = hash_password("correct horse", args.rounds)
+    print(f"cores {cores}  bcrypt rounds {args.rounds}  logins {args.logins}")
+    print(f"{'workers':>8} {'logins/s':>9} {'loop lag p99 ms':>16} {'threadpool p99 ms':>18}")
+    for workers in map(int, args.workers.split(",")):
+        rate, lag, probe = asyncio.run(run(workers, args.logins, args.rounds, hashed))
+        label = f"{workers}" if workers else "threads"
+        print(f"{label:>8} {rate:9.1f} {lag:16.1f} {probe:18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Local mock of the LLM endpoints `process_execution` calls, for offline load tests.
+
+Run from backend_taskforge_ai: `python -m benchmarks.mock_provider [--port 8090] [options]`
+and point the backend at it:
+
+    GEMINI_API_KEY=mock GEMINI_BASE_URL=http://127.0.0.1:8090
+    # or: HUGGINGFACEHUB_API_TOKEN=mock HF_MODEL=mock HF_BASE_URL=http://127.0.0.1:8090
+
+Endpoints:
+- `POST /v1/models/{model}:streamGenerateContent` streams a JSON array of
+  GenerateContentResponse objects (last one with finishReason/usageMetadata)
+  at `--tokens-per-sec`, with each object's bytes cut into random chunks of
+  at most `--fragment` bytes so the client sees the same splits as over a
+  real network.
+- `POST /models/{model}` answers like the HF inference API
+  (`[{"generated_text": ...}]`) once the whole generation time has passed;
+  a list of `inputs` gets one such list per input, in order.
+- `GET /stats` returns request/error counters; `PUT /config` changes the
+  options at runtime (same names as the flags, with underscores).
+
+`--latency-ms` (± `--jitter-ms`) delays the response headers, and a
+`--slow-rate` fraction of them by `--slow-ms` more (a latency tail);
+`--error-rate` answers that fraction of requests with HTTP 503.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+config = {
+    "tokens": 200,  # tokens por resposta
+    "tokens_per_sec": 100.0,  # 0 = sem pausa entre tokens
+    "tokens_per_event": 1,  # tokens por objeto do array (Gemini)
+    "latency_ms": 50.0,  # até os headers da resposta
+    "jitter_ms": 10.0,
+    "error_rate": 0.0,
+    "slow_rate": 0.0,  # fração das respostas com `slow_ms` a mais antes dos headers (cauda)
+    "slow_ms": 2000.0,
+    "fragment": 64,  # tamanho máximo de cada chunk enviado (0 = objeto inteiro)
+}
+stats = {"requests": 0, "errors": 0, "in_flight": 0, "tokens": 0, "chunks": 0, "inputs": 0}
+
+# a cada tick mandamos todos os tokens já devidos (evita um sleep por token em taxas altas)
+_TICK = 0.01
+
+
+def _token(i: int) -> str:
+    return f"tok{i} "
+
+
+async def _latency():
+    delay = config["latency_ms"] + random.uniform(-config["jitter_ms"], config["jitter_ms"])
+    if config["slow_rate"] > 0 and random.random() < config["slow_rate"]:
+        delay += config["slow_ms"]
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+
+
+def _fragments(data: bytes):
+    size = config["fragment"]
+    if size <= 0:
+        yield data
+        return
+    pos = 0
+    while pos < len(data):
+        step = random.randint(1, size)
+        yield data[pos:pos + step]
+        pos += step
+
+
+def _error() -> Response | None:
+    if config["error_rate"] > 0 and random.random() < config["error_rate"]:
+        stats["errors"] += 1
+        body = {"error": {"code": 503, "message": "mock overloaded", "status": "UNAVAILABLE"}}
+        return JSONResponse(body, status_code=503)
+    return None
+
+
+def _gemini_object(text: str, last: bool, total: int) -> dict:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    obj = {"candidates": [candidate]}
+    if last:
+        candidate["finishReason"] = "STOP"
+        obj["usageMetadata"] = {"promptTokenCount": 8, "candidatesTokenCount": total, "totalTokenCount": total + 8}
+    return obj
+
+
+async def _gemini_body(total: int, per_event: int, tps: float):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    sent = 0
+    stats["in_flight"] += 1
+    try:
+        while sent < total:
+            due = total
+            if tps > 0:
+                due = min(total, int((loop.time() - started) * tps) + 1)
+                if due <= sent:
+                    # próximo token vence em sent / tps
+                    await asyncio.sleep(max(_TICK, sent / tps - (loop.time() - started)))
+                    continue
+            parts = []
+            while sent < due:
+                n = min(per_event, due - sent)
+                text = "".join(_token(sent + k) for k in range(n))
+                parts.append(("," if sent else "[") + json.dumps(_gemini_object(text, sent + n >= total, total)) + "\r\n")
+                sent += n
+                stats["tokens"] += n
+            if sent >= total:
+                parts.append("]")
+            for chunk in _fragments("".join(parts).encode("utf-8")):
+                stats["chunks"] += 1
+                yield chunk
+    finally:
+        stats["in_flight"] -= 1
+
+
+async def gemini(request: Request):
+    action = request.path_params["model"].partition(":")[2]
+    if action != "streamGenerateContent":
+        return JSONResponse({"error": {"code": 404, "message": f"unsupported action {action!r}"}}, status_code=404)
+    stats["requests"] += 1
+    await request.body()
+    await _latency()
+    error = _error()
+    if error is not None:
+        return error
+    body = _gemini_body(int(config["tokens"]), max(1, int(config["tokens_per_event"])), float(config["tokens_per_sec"]))
+    return StreamingResponse(body, media_type="application/json")
+
+
+async def huggingface(request: Request):
+    stats["requests"] += 1
+    try:
+        inputs = json.loads(await request.body()).get("inputs")
+    except (ValueError, AttributeError):
+        inputs = None
+    await _latency()
+    error = _error()
+    if error is not None:
+        return error
+    total = int(config["tokens"])
+    if config["tokens_per_sec"] > 0:
+        await asyncio.sleep(total / config["tokens_per_sec"])
+    item = [{"generated_text": "".join(_token(i) for i in range(total))}]
+    # lote: o endpoint gera as entradas juntas, no tempo de uma
+    count = len(inputs) if isinstance(inputs, list) else 1
+    stats["inputs"] += count
+    stats["tokens"] += total * count
+    return JSONResponse([item] * count if isinstance(inputs, list) else item)
+
+
+async def get_stats(request: Request):
+    return JSONResponse({**stats, "config": config})
+
+
+async def put_config(request: Request):
+    update = await request.json()
+    unknown = set(update) - set(config)
+    if unknown:
+        return JSONResponse({"error": f"unknown options: {sorted(unknown)}"}, status_code=400)
+    for key, value in update.items():
+        config[key] = type(config[key])(value)
+    return JSONResponse(config)
+
+
+app = Starlette(routes=[
+    Route("/v1/models/{model}", gemini, methods=["POST"]),
+    Route("/v1beta/models/{model}", gemini, methods=["POST"]),
+    Route("/models/{model:path}", huggingface, methods=["POST"]),
+    Route("/stats", get_stats),
+    Route("/config", put_config, methods=["PUT"]),
+])
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Provider options (shared with `benchmarks.load`, which passes them through)."""
+    for key, default in config.items():
+        parser.add_argument("--" + key.replace("_", "-"), type=type(default), default=default)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--seed", type=int, default=None)
+    add_arguments(parser)
+    args = parser.parse_args()
+    for key in config:
+        config[key] = getattr(args, key)
+    random.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
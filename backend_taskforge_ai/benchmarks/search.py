@@ -0,0 +1,177 @@
+"""Benchmark: full-text search vs. a LIKE scan over millions of synthetic executions.
+
+Run from backend_taskforge_ai: `python -m benchmarks.search [--rows 2000000] [--repeat 5]`.
+
+Builds a throwaway SQLite database with `--rows` finished executions
+(inputs of ~12 and results of ~60 words drawn from a Zipf-like vocabulary)
+and the FTS5 index the app maintains, bulk-loaded with plain sqlite3 so
+setup stays in minutes. Then, for a rare, a medium and a common word, a
+two-word query, a phrase and a filtered query, it times the first page
+through `services.search.search()` (what `GET /api/v1/executions/search`
+runs) against the `LIKE '%word%'` scan that was the only option before.
+It also times incremental indexing in the writer's batches of
+`PERSISTENCE_MAX_BATCH` executions.
+
+The LIKE scan is unranked and stops after `--limit` matches, so it is quick
+for words found in most rows, where the index has to score every match to
+rank them. Its cost for selective queries grows with the table, the
+index's with the number of matches.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+_tmp = tempfile.TemporaryDirectory(prefix="taskforge-search-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/bench.db"
+
+from app.core.config import settings  # noqa: E402
+from app.db import base  # noqa: E402
+from app.db.session import AsyncSessionLocal, async_engine, engine  # noqa: E402
+from app.services import search  # noqa: E402
+
+VOCABULARY = 20000
+AGENTS = 50
+
+
+def make_words(rng: random.Random) -> list[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < VOCABULARY:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+    return sorted(words)
+
+
+def load(rows: int, seed: int) -> list[str]:
+    """Create the schema and bulk-insert `rows` finished executions plus their index rows."""
+    base.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        search.create_search_index(conn)
+    engine.dispose()
+    rng = random.Random(seed)
+    words = make_words(rng)
+    # pesos ~ 1/rank (Zipf): poucas palavras muito comuns, cauda longa de raras
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    cum = []
+    total = 0.0
+    for w in weights:
+        total += w
+        cum.append(total)
+
+    db = sqlite3.connect(f"{_tmp.name}/bench.db")
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=OFF")
+    db.execute("INSERT INTO users (id, email, hashed_password) VALUES (1, 'bench@example.com', 'x')")
+    db.executemany("INSERT INTO agents (id, name, owner_id) VALUES (?, 'bench', 1)", [(i,) for i in range(1, AGENTS + 1)])
+    chunk = 20000
+    t0 = time.perf_counter()
+    for start in range(0, rows, chunk):
+        batch = []
+        for i in range(start + 1, min(rows, start + chunk) + 1):
+            text_in = " ".join(rng.choices(words, cum_weights=cum, k=12))
+            text_out = " ".join(rng.choices(words, cum_weights=cum, k=60))
+            batch.append((i, rng.randint(1, AGENTS), text_in, text_out))
+        db.executemany(
+            "INSERT INTO executions (id, agent_id, user_id, status, input, result, created_at, version) "
+            "VALUES (?, ?, 1, 'completed', ?, ?, datetime('now'), 1)",
+            [(i, agent, text_in, text_out) for i, agent, text_in, text_out in batch],
+        )
+        db.executemany(
+            f"INSERT INTO {search.FTS_TABLE} (rowid, input, result) VALUES (?, ?, ?)",
+            [(i, text_in, text_out) for i, _, text_in, text_out in batch],
+        )
+        db.commit()
+        done = min(rows, start + chunk)
+        print(f"\rloaded {done}/{rows} rows ({done / (time.perf_counter() - t0):.0f} rows/s)", end="", flush=True)
+    print()
+    db.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('optimize')")
+    db.commit()
+    db.close()
+    return words
+
+
+def like_scan(word: str, limit: int, agent_id: int | None = None) -> float:
+    db = sqlite3.connect(f"{_tmp.name}/bench.db")
+    sql = "SELECT id FROM executions WHERE (input LIKE ? OR result LIKE ?)"
+    params: list = [f"%{word}%", f"%{word}%"]
+    if agent_id is not None:
+        sql += " AND agent_id = ?"
+        params.append(agent_id)
+    t0 = time.perf_counter()
+    db.execute(sql + " ORDER BY id DESC LIMIT ?", [*params, limit]).fetchall()
+    elapsed = time.perf_counter() - t0
+    db.close()
+    return elapsed
+
+
+async def fts(q: str, limit: int, repeat: int, agent_id: int | None = None) -> tuple[float, int]:
+    best, hits = float("inf"), []
+    for _ in range(repeat):
+        async with AsyncSessionLocal() as db:
+            t0 = time.perf_counter()
+            hits = await search.search(db, q, limit + 1, agent_id=agent_id)
+            best = min(best, time.perf_counter() - t0)
+    return best, len(hits)
+
+
+async def incremental(words: list[str], rows: int, batches: int = 20) -> float:
+    """ms per writer flush indexing `persistence_max_batch` executions."""
+    rng = random.Random(1)
+    size = settings.persistence_max_batch
+    next_id = rows + 1
+    times = []
+    async with AsyncSessionLocal() as db:
+        for _ in range(batches):
+            docs = {next_id + i: (" ".join(rng.choices(words, k=12)), " ".join(rng.choices(words, k=60)))
+                    for i in range(size)}
+            next_id += size
+            t0 = time.perf_counter()
+            await search.index_rows(db, docs)
+            await db.commit()
+            times.append(time.perf_counter() - t0)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+async def main_async(args):
+    words = load(args.rows, args.seed)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(search.create_search_index)
+    rare, medium, common = words[-1], words[len(words) // 100], words[0]
+    queries = [
+        ("rare word", rare, None),
+        ("medium word", medium, None),
+        ("common word", common, None),
+        ("two words", f"{medium} {words[len(words) // 50]}", None),
+        ("phrase", f'"{common} {words[1]}"', None),
+        ("common + agent", common, 7),
+    ]
+    print(f"\n{'query':16} {'hits':>5} {'fts ms':>9} {'like ms':>10} {'speedup':>8}")
+    for name, q, agent_id in queries:
+        fts_s, hits = await fts(q, args.limit, args.repeat, agent_id)
+        like_word = q.strip('"').split()[0]
+        like_s = like_scan(like_word, args.limit, agent_id) if not args.skip_like else float("nan")
+        print(f"{name:16} {min(hits, args.limit):5} {fts_s * 1000:9.2f} {like_s * 1000:10.1f} {like_s / fts_s:7.1f}x")
+    print(f"\nincremental indexing: {await incremental(words, args.rows):.1f} ms per flush of "
+          f"{settings.persistence_max_batch} executions")
+    size = os.path.getsize(f"{_tmp.name}/bench.db") / 1e6
+    print(f"database file: {size:.0f} MB for {args.rows} rows (table + FTS index)")
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5, help="FTS runs per query (best is reported)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-like", action="store_true", help="skip the LIKE baseline (slow on big tables)")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark: semantic cache lookup cost by index size, and hit rate on near-duplicates.
+
+Run from backend_taskforge_ai: `python -m benchmarks.semantic_cache [--sizes 100,1000,2000,10000]`.
+
+Fills one index with synthetic prompts (12-30 words from a 5000-word
+vocabulary), then times `lookup()` (embedding in the thread pool plus the
+matrix-vector search) for each size. The hit rate is measured on
+perturbed copies of stored prompts (one word swapped, case and
+punctuation changed) and on unrelated prompts, which should never hit.
+Also reports the time to save and load the index.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+_tmp = tempfile.TemporaryDirectory(prefix="taskforge-semantic-bench-")
+os.environ["STORAGE_PATH"] = _tmp.name
+os.environ["SEMANTIC_CACHE_ENABLED"] = "1"
+
+from app.core.config import settings  # noqa: E402
+from app.services.semantic_cache import SemanticCache  # noqa: E402
+
+
+def make_words(rng: random.Random, count: int = 5000) -> list[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+    return sorted(words)
+
+
+def perturb(rng: random.Random, prompt: str, words: list[str]) -> str:
+    parts = prompt.split()
+    parts[rng.randrange(len(parts))] = rng.choice(words)
+    text = " ".join(parts)
+    return (text.capitalize() + "?") if rng.random() < 0.5 else text.upper()
+
+
+async def run_size(size: int, args, rng: random.Random, words: list[str]):
+    settings.semantic_cache_max_entries_per_agent = max(size, 1)
+    cache = SemanticCache()
+    prompts = [" ".join(rng.choices(words, k=rng.randint(12, 30))) for _ in range(size)]
+    t0 = time.perf_counter()
+    for i, prompt in enumerate(prompts):
+        probe = await cache.lookup(1, "bench", prompt)
+        cache.add(probe, f"result {i}")
+    fill_s = time.perf_counter() - t0
+
+    timings = []
+    near = [perturb(rng, rng.choice(prompts), words) for _ in range(args.lookups)]
+    far = [" ".join(rng.choices(words, k=rng.randint(12, 30))) for _ in range(args.lookups)]
+    cache.stats.update(hits=0, misses=0)
+    for text in near:
+        t0 = time.perf_counter()
+        await cache.lookup(1, "bench", text)
+        timings.append(time.perf_counter() - t0)
+    near_hits = cache.stats["hits"]
+    cache.stats.update(hits=0, misses=0)
+    for text in far:
+        await cache.lookup(1, "bench", text)
+    far_hits = cache.stats["hits"]
+
+    t0 = time.perf_counter()
+    await cache.save()
+    save_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    loaded = cache._load_sync()
+    load_s = time.perf_counter() - t0
+    assert sum(index.size for index in loaded.values()) == size
+
+    timings.sort()
+    p50, p99 = timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+    print(f"{size:8} {fill_s / size * 1000:8.3f} {p50 * 1000:8.3f} {p99 * 1000:8.3f} "
+          f"{near_hits / len(near):8.1%} {far_hits / len(far):8.1%} {save_s * 1000:8.1f} {load_s * 1000:8.1f}")
+
+
+async def main_async(args):
+    rng = random.Random(args.seed)
+    words = make_words(rng)
+    print(f"dim={settings.semantic_cache_dim} threshold={settings.semantic_cache_threshold}")
+    print(f"{'entries':>8} {'add ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'near hit':>8} "
+          f"{'far hit':>8} {'save ms':>8} {'load ms':>8}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        await run_size(size, args, rng, words)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,1000,2000,10000")
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Microbenchmark: incremental stream decoders vs. the old per-chunk splitlines path.
+
+Run from backend_taskforge_ai: `python -m benchmarks.stream_decoder [--events N] [--chunk BYTES]`.
+
+Builds large synthetic Gemini streams (JSON array, SSE and NDJSON framing),
+cuts them into random-sized network chunks and reports decode throughput
+next to a floor (parsing the same objects already split, no framing) and the
+old path, which is fast mostly because it never parses the objects.
+Every run also checks that the decoded text matches the source exactly,
+which the old path does not do once objects straddle chunk boundaries.
+Last, one JSON array element of `--large-mb` (and 4x that) megabytes cut
+into 4 KB chunks: framing cost must grow linearly with the element.
+"""
+
+import argparse
+import json
+import random
+import time
+
+from app.services import stream_decoder
+
+
+def gemini_object(i: int) -> dict:
+    text = f"token {i} \"quoted\" \\ ünïcødé \n"
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]}
+
+
+def build_stream(fmt: str, n: int) -> tuple[bytes, str]:
+    objects = [gemini_object(i) for i in range(n)]
+    objects[-1]["candidates"][0]["finishReason"] = "STOP"
+    objects[-1]["usageMetadata"] = {"promptTokenCount": 3, "candidatesTokenCount": n, "totalTokenCount": n + 3}
+    expected = "".join(o["candidates"][0]["content"]["parts"][0]["text"] for o in objects)
+    encoded = [json.dumps(o) for o in objects]
+    if fmt == "json":
+        body = "[" + ",\r\n".join(encoded) + "]"
+    elif fmt == "sse":
+        body = "".join(f"data: {e}\r\n\r\n" for e in encoded)
+    else:
+        body = "".join(e + "\n" for e in encoded)
+    return body.encode("utf-8"), expected
+
+
+def chunked(data: bytes, size: int, seed: int = 7) -> list[bytes]:
+    rnd = random.Random(seed)
+    chunks, pos = [], 0
+    while pos < len(data):
+        step = rnd.randint(1, size)
+        chunks.append(data[pos:pos + step])
+        pos += step
+    return chunks
+
+
+def decode_new(chunks: list[bytes], content_type: str) -> str:
+    decoder = stream_decoder.decoder_for(content_type)
+    parts = []
+    for chunk in chunks:
+        for payload in decoder.feed(chunk):
+            parts.extend(ev.value for ev in stream_decoder.payload_events(payload, stream_decoder.gemini_events) if ev.kind == "text")
+    for payload in decoder.close():
+        parts.extend(ev.value for ev in stream_decoder.payload_events(payload, stream_decoder.gemini_events) if ev.kind == "text")
+    return "".join(parts)
+
+
+def parse_floor(objects: list[bytes]) -> str:
+    """Lower bound: parse already-framed objects, no framing work at all."""
+    parts = []
+    for raw in objects:
+        parts.extend(ev.value for ev in stream_decoder.gemini_events(json.loads(raw)) if ev.kind == "text")
+    return "".join(parts)
+
+
+def decode_old(chunks: list[bytes]) -> str:
+    """The previous executor loop: decode each chunk, splitlines(), json.loads per line."""
+    parts = []
+    for raw in chunks:
+        chunk = raw.decode("utf-8", errors="replace")
+        for line in chunk.splitlines():
+            if not line.strip():
+                continue
+            if line.startswith("data:"):
+                content = line[len("data:"):].strip()
+                try:
+                    js = json.loads(content)
+                except Exception:
+                    js = content
+                piece = js if isinstance(js, str) else js.get("text") if isinstance(js, dict) else str(js)
+                if piece:
+                    parts.append(piece)
+            else:
+                parts.append(line)
+    return "".join(parts)
+
+
+def bench(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=50_000)
+    parser.add_argument("--chunk", type=int, default=512, help="max random chunk size in bytes")
+    parser.add_argument("--large-mb", type=float, default=2.0, help="size of the single large element")
+    args = parser.parse_args()
+
+    content_types = {"json": "application/json", "sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+    print(f"{'format':8} {'MB':>6} {'chunks':>8} {'new MB/s':>9} {'floor MB/s':>10} {'old MB/s':>9} {'new ok':>7} {'old ok':>7}")
+    for fmt, ct in content_types.items():
+        data, expected = build_stream(fmt, args.events)
+        chunks = chunked(data, args.chunk)
+        mb = len(data) / 1e6
+        t_new = bench(decode_new, chunks, ct)
+        t_old = bench(decode_old, chunks)
+        t_floor = bench(parse_floor, build_stream("ndjson", args.events)[0].splitlines())
+        ok_new = decode_new(chunks, ct) == expected
+        ok_old = decode_old(chunks) == expected
+        print(f"{fmt:8} {mb:6.1f} {len(chunks):8d} {mb / t_new:9.1f} {mb / t_floor:10.1f} {mb / t_old:9.1f} {str(ok_new):>7} {str(ok_old):>7}")
+
+    print(f"\n{'large element':14} {'MB':>6} {'chunks':>8} {'MB/s':>8} {'ok':>5}")
+    for mb in (args.large_mb, args.large_mb * 4):
+        text = "ünï \"big\" [element] {text} " * int(mb * 1e6 / 32)
+        obj = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+        data = ("[" + json.dumps(obj) + "]").encode("utf-8")
+        chunks = [data[i:i + 4096] for i in range(0, len(data), 4096)]
+        t = bench(decode_new, chunks, "application/json", repeat=1)
+        ok = decode_new(chunks, "application/json") == text
+        print(f"{'json':14} {len(data) / 1e6:6.1f} {len(chunks):8d} {len(data) / 1e6 / t:8.1f} {str(ok):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Test settings: a throwaway SQLite database and storage directory per session.
+
+The environment is set before anything under `app` is imported, since
+settings and engines are created at import time. Run from
+backend_taskforge_ai: `python -m pytest -q`.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_tmp = tempfile.TemporaryDirectory(prefix="taskforge-tests-")
+os.environ["STORAGE_PATH"] = _tmp.name
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/test.db"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.db.base import Base  # noqa: E402
+from app.db.session import async_engine, engine  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Fresh tables for the test."""
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a new loop; pooled async connections are closed on that same loop."""
+
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def api(db, monkeypatch):
+    """TestClient over the whole app, without the scheduler (tests drive executions themselves)."""
+    from fastapi.testclient import TestClient
+
+    from app.core.config import settings
+    from app.main import app
+    from app.services import channels
+
+    monkeypatch.setattr(settings, "scheduler_enabled", False)
+    with TestClient(app) as client:
+        yield client
+    for execution_id in list(channels.CHANNELS):
+        channels._remove(execution_id)
@@ -0,0 +1,65 @@
+import pytest
+
+from app.api.v1 import agents
+from app.services.storage import parse_range
+
+BODY = b"0123456789abcdef"
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=2-5", (2, 5)),
+    ("bytes=10-", (10, 15)),
+    ("bytes=-4", (12, 15)),
+    ("bytes=-100", (0, 15)),
+    ("bytes=4-1000", (4, 15)),
+    (None, None),
+    ("", None),
+    ("bytes=-", None),
+    ("bytes=5-3", None),
+    ("bytes=a-b", None),
+    ("bytes=--5", None),
+    ("bytes=1-2,4-5", None),
+    ("items=0-5", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, len(BODY)) == expected
+
+
+@pytest.mark.parametrize("header, size", [("bytes=-0", 16), ("bytes=16-", 16), ("bytes=99-100", 16), ("bytes=-5", 0)])
+def test_unsatisfiable_ranges_raise(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
+
+
+@pytest.fixture(params=[True, False], ids=["file-response", "fallback"])
+def artifact_url(request, api, monkeypatch):
+    # os dois caminhos: FileResponse com Range (Starlette novo) e o StreamingResponse próprio
+    monkeypatch.setattr(agents, "_FILE_RESPONSE_RANGES", request.param and agents._FILE_RESPONSE_RANGES)
+    r = api.post("/api/v1/agents/upload", files={"file": ("data.bin", BODY, "application/octet-stream")})
+    assert r.status_code == 200, r.text
+    return r.json()["url"]
+
+
+@pytest.mark.parametrize("header, status, body, content_range", [
+    (None, 200, BODY, None),
+    ("bytes=2-5", 206, BODY[2:6], "bytes 2-5/16"),
+    ("bytes=-4", 206, BODY[-4:], "bytes 12-15/16"),
+    ("bytes=10-", 206, BODY[10:], "bytes 10-15/16"),
+    ("bytes=8-999", 206, BODY[8:], "bytes 8-15/16"),
+    ("bytes=16-", 416, None, "bytes */16"),
+    ("bytes=-0", 416, None, "bytes */16"),
+])
+def test_download_ranges(api, artifact_url, header, status, body, content_range):
+    r = api.get(artifact_url, headers={"Range": header} if header else {})
+    assert r.status_code == status
+    if body is not None:
+        assert r.content == body
+    assert r.headers.get("content-range") == content_range
+
+
+def test_malformed_range_on_file_response(api, artifact_url):
+    if not agents._FILE_RESPONSE_RANGES:
+        pytest.skip("fallback path: header parsing covered by test_parse_range")
+    r = api.get(artifact_url, headers={"Range": "bytes=x-y"})
+    # regra do Starlette para header malformado
+    assert r.status_code == 400
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import deps
+from app.api.v1.auth import create_access_token
+from app.core import security
+from app.core.config import settings
+from app.core.security import HashingSaturated, PasswordHasher
+from app.db import models
+from app.db.session import SessionLocal
+
+
+class FakeClock:
+    """Stands in for `deps.time`: wall and monotonic clocks moved by hand."""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def fast_hashing(monkeypatch):
+    # threads em vez do pool de processos e o custo mínimo do bcrypt
+    monkeypatch.setattr(settings, "auth_hash_workers", 0)
+    monkeypatch.setattr(settings, "auth_bcrypt_rounds", 4)
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    """Fresh token/user caches for the test."""
+    monkeypatch.setattr(deps, "token_cache", deps._LRU(2))
+    monkeypatch.setattr(deps, "user_cache", deps._LRU(10))
+    return deps.token_cache, deps.user_cache
+
+
+def test_saturated_hasher_sheds_instead_of_queueing(fast_hashing):
+    hasher = PasswordHasher(max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = [asyncio.create_task(hasher._run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert hasher.pending == hasher.capacity == 2
+        with pytest.raises(HashingSaturated):
+            await hasher.hash("pw")
+        release.set()
+        await asyncio.gather(*blocked)
+        # com vaga de novo, volta a aceitar
+        return await hasher.verify("pw", await hasher.hash("pw"))
+
+    assert asyncio.run(scenario()) == (True, None)
+    assert hasher.stats["rejected"] == 1 and hasher.pending == 0
+
+
+def test_saturated_hasher_answers_429(fast_hashing, api, monkeypatch):
+    monkeypatch.setattr(security.password_hasher, "pending", security.password_hasher.capacity)
+    r = api.post("/api/v1/auth/register", json={"email": "busy@example.com", "password": "pw"})
+    assert r.status_code == 429
+    assert r.headers["retry-after"] == str(settings.auth_retry_after_seconds)
+
+
+def stored_hash(email: str) -> str:
+    with SessionLocal() as session:
+        return session.query(models.User).filter_by(email=email).one().hashed_password
+
+
+def test_login_rehashes_when_the_cost_changes(fast_hashing, api, monkeypatch):
+    creds = {"email": "old@example.com", "password": "s3cret"}
+    assert api.post("/api/v1/auth/register", json=creds).status_code == 200
+    assert stored_hash(creds["email"]).startswith("$2b$04$")
+    rehashed = security.password_hasher.stats["rehashed"]
+
+    monkeypatch.setattr(settings, "auth_bcrypt_rounds", 5)
+    assert api.post("/api/v1/auth/login", json=creds).status_code == 200
+    assert stored_hash(creds["email"]).startswith("$2b$05$")
+    assert api.post("/api/v1/auth/login", json=creds).status_code == 200
+    assert security.password_hasher.stats["rehashed"] == rehashed + 1
+    # senha errada não regrava nada
+    assert api.post("/api/v1/auth/login", json={**creds, "password": "nope"}).status_code == 401
+
+
+def test_token_cache_skips_verification_until_exp(caches, monkeypatch):
+    token_cache, _ = caches
+    token = create_access_token(7)
+    assert deps.verify_token(token) == 7
+    assert deps.verify_token(token) == 7
+    assert (token_cache.stats["hits"], token_cache.stats["misses"]) == (1, 1)
+    (_, exp), = token_cache.entries.values()
+    monkeypatch.setattr(deps, "time", FakeClock(exp + 1))
+    deps.verify_token(token)  # o JWT ainda vale no relógio real: volta ao cache
+    assert token_cache.stats["expired"] == 1
+    with pytest.raises(HTTPException) as e:
+        deps.verify_token(token + "x")
+    assert e.value.status_code == 401
+
+
+def test_token_cache_is_bounded(caches):
+    token_cache, _ = caches
+    for user_id in (1, 2, 3):
+        deps.verify_token(create_access_token(user_id))
+    assert len(token_cache.entries) == 2 and token_cache.stats["evictions"] == 1
+
+
+def add_user(email: str) -> int:
+    with SessionLocal() as session:
+        user = models.User(email=email, display_name="Ana", hashed_password="x")
+        session.add(user)
+        session.commit()
+        return user.id
+
+
+def test_user_cache_ttl_and_invalidation(db, run, caches, monkeypatch):
+    _, user_cache = caches
+    clock = FakeClock(1000.0)
+    monkeypatch.setattr(deps, "time", clock)
+    monkeypatch.setattr(settings, "auth_user_cache_ttl_seconds", 30)
+    user_id = add_user("ana@example.com")
+
+    assert run(deps.load_user(user_id)).display_name == "Ana"
+    with SessionLocal() as session:
+        # UPDATE fora do ORM (não invalida): o cache ainda serve o valor antigo
+        session.execute(models.User.__table__.update().values(display_name="Bia"))
+        session.commit()
+    assert run(deps.load_user(user_id)).display_name == "Ana"
+    clock.now += 31
+    assert run(deps.load_user(user_id)).display_name == "Bia"
+    assert user_cache.stats["expired"] == 1
+
+    with SessionLocal() as session:
+        # atualização pelo ORM invalida na hora
+        session.get(models.User, user_id).display_name = "Cris"
+        session.commit()
+    assert user_cache.stats["invalidations"] == 1
+    assert run(deps.load_user(user_id)).display_name == "Cris"
+    with SessionLocal() as session:
+        session.execute(models.User.__table__.update().values(display_name="Dani"))
+        session.commit()
+    deps.invalidate_user(user_id)  # o que quem faz UPDATE em massa deve chamar
+    assert run(deps.load_user(user_id)).display_name == "Dani"
+    with SessionLocal() as session:
+        session.delete(session.get(models.User, user_id))
+        session.commit()
+    assert user_cache.stats["invalidations"] == 3
+    assert run(deps.load_user(user_id)) is None
+
+
+def test_deleted_user_token_stops_working(fast_hashing, api, caches):
+    r = api.post("/api/v1/auth/register", json={"email": "gone@example.com", "password": "pw"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    assert api.get("/api/v1/users/me", headers=headers).json()["email"] == "gone@example.com"
+    with SessionLocal() as session:
+        session.delete(session.query(models.User).filter_by(email="gone@example.com").one())
+        session.commit()
+    r = api.get("/api/v1/users/me", headers=headers)
+    assert r.status_code == 401 and r.json()["detail"] == "User not found"
@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+from sqlalchemy import select
+
+from app.db import models
+from app.db.session import SessionLocal
+from app.services.broker import get_broker
+from app.services.channels import ChannelEvent
+from app.services.multiplex import merge_streams
+
+
+def create_batch(api, count: int) -> list[int]:
+    r = api.post("/api/v1/executions/batch", json={"items": [{"agent_id": 1, "input": f"in {i}"} for i in range(count)]})
+    assert r.status_code == 200, r.text
+    return r.json()["ids"]
+
+
+def read_ndjson(api, ids) -> list[dict]:
+    with api.stream("GET", "/api/v1/executions/batch/stream", params={"ids": ",".join(map(str, ids)), "format": "ndjson"}) as r:
+        assert r.status_code == 200
+        return [json.loads(line) for line in r.iter_lines() if line.strip()]
+
+
+def test_batch_returns_ids_in_item_order(api):
+    ids = create_batch(api, 5)
+    assert ids == sorted(ids) and len(set(ids)) == 5
+    with SessionLocal() as db:
+        rows = db.execute(select(models.Execution).where(models.Execution.id.in_(ids))).scalars().all()
+        inputs = {row.id: (row.input, row.status) for row in rows}
+    assert [inputs[i] for i in ids] == [(f"in {i}", "queued") for i in range(5)]
+    r = api.post("/api/v1/executions/batch", json={"items": []})
+    assert r.status_code == 422
+
+
+def test_batch_stream_merges_every_execution_in_order(api):
+    a, b = create_batch(api, 2)
+    broker = get_broker()
+    # eventos intercalados, já no buffer de replay antes de o cliente conectar
+    for execution_id, data in ((a, "a1"), (b, "b1"), (a, "a2"), (b, "b2")):
+        api.portal.call(broker.publish, execution_id, data)
+    api.portal.call(broker.close, a)
+    api.portal.call(broker.close, b)
+
+    frames = read_ndjson(api, [a, b])
+    for execution_id, texts in ((a, ["a1", "a2"]), (b, ["b1", "b2"])):
+        mine = [f for f in frames if f["execution_id"] == execution_id]
+        assert [(f["id"], f["data"]) for f in mine[:2]] == [(1, texts[0]), (2, texts[1])]
+        assert mine[-1]["event"] == "done"
+    assert len(frames) == 6
+
+
+def test_one_failing_member_does_not_stall_the_batch(api, monkeypatch):
+    ok, broken, failed = create_batch(api, 3)
+    with SessionLocal() as db:
+        exe = db.get(models.Execution, failed)
+        exe.status, exe.result = "failed", json.dumps({"error": "provider down"})
+        db.commit()
+    broker = get_broker()
+    api.portal.call(broker.publish, ok, "fine")
+    api.portal.call(broker.close, ok)
+    subscribe = broker.subscribe
+
+    async def exploding(execution_id, last_event_id=0, keepalive=25.0):
+        raise RuntimeError("subscription lost")
+        yield
+
+    monkeypatch.setattr(
+        broker, "subscribe",
+        lambda execution_id, *args: exploding(execution_id) if execution_id == broken else subscribe(execution_id, *args),
+    )
+
+    frames = read_ndjson(api, [ok, broken, failed])
+    by_id = {eid: [(f["event"], f["data"]) for f in frames if f["execution_id"] == eid] for eid in (ok, broken, failed)}
+    assert by_id[ok] == [("message", "fine"), ("done", '{"finished": true}')]
+    assert by_id[broken] == [("error", '{"error": "stream failed"}')]
+    assert by_id[failed][0] == ("result", json.dumps({"status": "failed", "result": json.dumps({"error": "provider down"})}))
+    assert by_id[failed][1][0] == "done"
+
+
+def test_merge_streams_ends_when_a_subscription_raises(monkeypatch):
+    class Broker:
+        def subscribe(self, execution_id, last_event_id=0, keepalive=25.0):
+            async def events():
+                yield ChannelEvent(1, f"x{execution_id}")
+                if execution_id == 2:
+                    raise ConnectionError("redis went away")
+                yield ChannelEvent(2, "done", "done")
+            return events()
+
+    monkeypatch.setattr("app.services.multiplex.get_broker", lambda: Broker())
+
+    async def scenario():
+        return [(eid, ev.event, ev.data) async for eid, ev in merge_streams([1, 2], keepalive=0.05)]
+
+    items = asyncio.run(asyncio.wait_for(scenario(), 2))
+    assert [i for i in items if i[0] == 1] == [(1, None, "x1"), (1, "done", "done")]
+    assert [i for i in items if i[0] == 2] == [(2, None, "x2"), (2, "error", '{"error": "stream failed"}')]
@@ -0,0 +1,156 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app.core.config import settings
+from app.services import channels
+from app.services.broker import RedisBroker, SQLiteBroker
+
+
+@pytest.fixture(autouse=True)
+def clean_channels():
+    yield
+    for execution_id in list(channels.CHANNELS):
+        channels._remove(execution_id)
+
+
+async def collect(stream):
+    """Events of a subscription until `done` (keep-alives skipped)."""
+    return [(ev.id, ev.event, ev.data) async for ev in stream if ev is not None]
+
+
+def test_sqlite_concurrent_first_publishes_get_distinct_ids(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "events.db"))
+
+    async def scenario():
+        await broker.start()
+        await asyncio.gather(*(broker.publish(1, f"e{i}") for i in range(5)))
+        await broker.close(1)
+        await broker.stop()
+
+    asyncio.run(scenario())
+    with sqlite3.connect(tmp_path / "events.db") as conn:
+        rows = conn.execute("SELECT seq, data FROM execution_events WHERE execution_id = 1 ORDER BY seq").fetchall()
+    assert [seq for seq, _ in rows] == [1, 2, 3, 4, 5, 6]
+    assert sorted(data for _, data in rows[:5]) == [f"e{i}" for i in range(5)]
+
+
+def test_sqlite_replay_from_another_instance(tmp_path):
+    path = str(tmp_path / "events.db")
+
+    async def scenario():
+        publisher = SQLiteBroker(path)
+        await publisher.start()
+        for text in ("a", "b", "c"):
+            await publisher.publish(7, text)
+        await publisher.close(7)
+        await publisher.stop()
+        # outro processo: nada em memória, só a tabela
+        channels._remove(7)
+        reader = SQLiteBroker(path, poll_interval=0.01)
+        await reader.start()
+        try:
+            assert await reader.has_events(7)
+            assert not await reader.has_events(8)
+            replay = await asyncio.wait_for(collect(reader.subscribe(7, last_event_id=1, keepalive=0.05)), 5)
+            # re-enfileirada: a numeração continua depois do `done` anterior
+            channels._remove(7)
+            await reader.publish(7, "retry")
+            return replay, channels.get_channel(7).last_id
+        finally:
+            await reader.stop()
+
+    replay, next_id = asyncio.run(scenario())
+    assert replay == [(2, None, "b"), (3, None, "c"), (4, "done", '{"finished": true}')]
+    assert next_id == 5
+
+
+def test_sqlite_publish_before_start_is_written_on_start(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "events.db"))
+
+    async def scenario():
+        await broker.publish(3, "early")
+        await broker.start()
+        await asyncio.sleep(settings.broker_flush_interval + 0.05)
+        rows = await broker.has_events(3)
+        await broker.stop()
+        return rows
+
+    assert asyncio.run(scenario())
+    with sqlite3.connect(tmp_path / "events.db") as conn:
+        assert conn.execute("SELECT seq, data FROM execution_events").fetchall() == [(1, "early")]
+
+
+def _entry_seq(entry_id: str) -> int:
+    return int(entry_id.split("-")[1])
+
+
+class FakeRedis:
+    """Stand-in for the redis.asyncio streams API the broker uses (decode_responses=True)."""
+
+    def __init__(self):
+        self.streams: dict[str, list] = {}
+        self.expiry: dict[str, int] = {}
+        self._changed: asyncio.Event | None = None
+
+    def _event(self) -> asyncio.Event:
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    async def xrevrange(self, key, count=None):
+        await asyncio.sleep(0)  # ida e volta ao servidor
+        return list(reversed(self.streams.get(key, [])))[:count]
+
+    async def xadd(self, key, fields, id, maxlen=None, approximate=True):
+        entries = self.streams.setdefault(key, [])
+        if entries and _entry_seq(entries[-1][0]) >= _entry_seq(id):
+            raise ValueError("ERR The ID specified in XADD is equal or smaller than the target stream top item")
+        entries.append((id, {k: str(v) for k, v in fields.items()}))
+        self._event().set()
+        self._changed = None
+        return id
+
+    async def expire(self, key, seconds):
+        self.expiry[key] = seconds
+
+    async def exists(self, key):
+        return int(key in self.streams)
+
+    async def xread(self, streams, count=None, block=None):
+        ((key, cursor),) = streams.items()
+        while True:
+            new = [e for e in self.streams.get(key, []) if _entry_seq(e[0]) > _entry_seq(cursor)][:count]
+            if new:
+                return [[key, new]]
+            try:
+                await asyncio.wait_for(self._event().wait(), (block or 0) / 1000)
+            except asyncio.TimeoutError:
+                return []
+
+    async def aclose(self):
+        pass
+
+
+def test_redis_publish_and_replay_across_instances():
+    redis = FakeRedis()
+    publisher, reader = RedisBroker(client=redis), RedisBroker(client=redis)
+
+    async def scenario():
+        live = asyncio.create_task(collect(reader.subscribe(5, keepalive=0.05)))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(*(publisher.publish(5, f"e{i}") for i in range(3)))
+        await publisher.close(5)
+        replay = await collect(reader.subscribe(5, last_event_id=2))
+        await publisher.publish(5, "retry")
+        return await asyncio.wait_for(live, 5), replay, await reader.has_events(5), await reader.has_events(6)
+
+    live, replay, exists, missing = asyncio.run(scenario())
+    assert [ev[0] for ev in live] == [1, 2, 3, 4]
+    assert live[-1][1] == "done"
+    assert replay == [(3, None, live[2][2]), (4, "done", '{"finished": true}')]
+    assert exists and not missing
+    assert redis.expiry == {"taskforge:exec:5": int(settings.broker_retention_seconds)}
+    # depois do close a numeração continua do que está no stream
+    assert redis.streams["taskforge:exec:5"][-1][0] == "0-5"
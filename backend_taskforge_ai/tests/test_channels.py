@@ -0,0 +1,163 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.services import channels
+from app.services.channels import ExecutionChannel, open_channel, release_channel
+
+
+async def collect(channel, last_event_id=0, keepalive=0.05):
+    """Everything a subscriber receives until the channel ends (or goes quiet)."""
+    out = []
+    async for ev in channel.subscribe(last_event_id, keepalive=keepalive):
+        if ev is None:
+            break
+        out.append(ev)
+    return out
+
+
+def published(*texts, maxlen=None, max_bytes=None, close=True):
+    channel = ExecutionChannel(1, maxlen=maxlen, max_bytes=max_bytes)
+    for text in texts:
+        channel.publish(text)
+    if close:
+        channel.close()
+    return channel
+
+
+@pytest.fixture
+def registry():
+    """Channels registered in CHANNELS, removed again after the test."""
+    yield channels.CHANNELS
+    for execution_id in list(channels.CHANNELS):
+        channels._remove(execution_id)
+
+
+def test_replay_resumes_after_last_event_id():
+    channel = published("a", "b", "c")
+    events = asyncio.run(collect(channel, last_event_id=2))
+    assert [(ev.id, ev.event, ev.data) for ev in events] == [(3, None, "c"), (4, "done", '{"finished": true}')]
+    assert [ev.data for ev in asyncio.run(collect(channel))][:3] == ["a", "b", "c"]
+
+
+def test_every_subscriber_sees_live_events():
+    channel = published(close=False)
+
+    async def scenario():
+        readers = [asyncio.create_task(collect(channel, keepalive=5)) for _ in range(3)]
+        await asyncio.sleep(0)
+        for text in ("x", "y"):
+            channel.publish(text)
+            await asyncio.sleep(0)
+        channel.close()
+        return await asyncio.gather(*readers)
+
+    for events in asyncio.run(scenario()):
+        assert [ev.id for ev in events] == [1, 2, 3]
+    assert channel.subscribers == 0
+
+
+def test_append_ignores_ids_already_seen():
+    channel = published("a", "b", close=False)
+    assert channel.append(2, "again") is None
+    assert channel.append(5, "e").id == 5
+    assert channel.publish("f").id == 6
+
+
+def test_overflow_drop_oldest_continues_from_buffer(monkeypatch):
+    monkeypatch.setattr(settings, "stream_overflow_policy", "drop_oldest")
+    channel = published(*"abcdef", maxlen=3)
+    # buffer guarda e, f e done (ids 5-7); o cliente viu até 1
+    events = asyncio.run(collect(channel, last_event_id=1))
+    assert events[0].event == "overflow" and events[0].id == 0
+    assert json.loads(events[0].data) == {"missed": 3}
+    assert [ev.data for ev in events[1:]] == ["e", "f", '{"finished": true}']
+
+
+def test_overflow_disconnect_ends_the_subscription(monkeypatch):
+    monkeypatch.setattr(settings, "stream_overflow_policy", "disconnect")
+    channel = published(*"abcdef", maxlen=3)
+    events = asyncio.run(collect(channel, last_event_id=1))
+    assert [(ev.event, json.loads(ev.data)) for ev in events] == [("overflow", {"missed": 3})]
+
+
+def test_byte_budget_keeps_the_newest_event():
+    channel = published("x" * 100, "y" * 100, "z" * 1000, max_bytes=300, close=False)
+    assert [ev.id for ev in channel.events] == [3]
+    assert channel.bytes == len(channel.events[0].data) + 64
+
+
+def test_sse_frame_keeps_newlines_and_omits_synthetic_ids():
+    channel = published("line 1\nline 2", close=False)
+    assert channel.events[0].sse() == "id: 1\ndata: line 1\ndata: line 2\n\n"
+    events = asyncio.run(collect(published(*"abcd", maxlen=2), last_event_id=0))
+    assert events[0].sse().startswith("event: overflow\n")
+
+
+def test_budget_evicts_finished_channels_before_trimming_live_ones(registry, monkeypatch):
+    monkeypatch.setattr(settings, "stream_memory_budget_bytes", 10_000)
+    # canais de outros testes (fora do CHANNELS) não contam aqui
+    monkeypatch.setitem(channels.stats, "buffered_bytes", 0)
+    monkeypatch.setitem(channels.stats, "budget_evictions", 0)
+    done = open_channel(1)
+    done.publish("d" * 3000)
+    done.close()
+    listened = open_channel(2)
+    listened.publish("l" * 3000)
+    listened.close()
+    listened.subscribers = 1  # terminado, mas alguém ainda lê
+    live = open_channel(3)
+    for _ in range(3):
+        live.publish("x" * 1000)
+    assert set(registry) == {1, 2, 3} and channels.stats["budget_evictions"] == 0
+    # passa do orçamento: o canal terminado e sem leitores sai primeiro, nada é cortado
+    live.publish("x" * 1000)
+    assert set(registry) == {2, 3} and channels.stats["budget_evictions"] == 1
+    assert [ev.id for ev in live.events] == [1, 2, 3, 4]
+    assert channels.stats["buffered_bytes"] == listened.bytes + live.bytes <= 9_000
+    # sem canal para largar: o maior buffer perde os eventos mais antigos
+    live.publish("x" * 4000)
+    assert channels.stats["budget_evictions"] == 2
+    assert [ev.id for ev in live.events] == [4, 5] and len(listened.events) == 2
+    assert channels.stats["buffered_bytes"] == listened.bytes + live.bytes <= 9_000
+
+
+def test_sweep_drops_expired_and_idle_channels(registry, monkeypatch):
+    monkeypatch.setattr(settings, "stream_idle_ttl_seconds", 60)
+    released, idle, busy, fresh = (open_channel(i) for i in range(1, 5))
+    release_channel(1, delay=5)
+    now = released.last_activity
+    idle.last_activity = busy.last_activity = now - 120
+    busy.subscribers = 1
+    assert channels.sweep(now + 1) == 1 and set(registry) == {1, 3, 4}
+    assert channels.sweep(now + 10) == 1 and set(registry) == {3, 4}
+    busy.subscribers = 0
+    assert channels.sweep(now + 10) == 1 and set(registry) == {4}
+    assert fresh is registry[4]
+
+
+def test_release_without_delay_removes_an_unwatched_channel(registry):
+    open_channel(1).close()
+    release_channel(1, delay=0)
+    assert 1 not in registry
+
+
+def test_sweeper_task_removes_released_channels(registry, monkeypatch):
+    monkeypatch.setattr(settings, "stream_sweep_interval", 0.01)
+    sweeper = channels.ChannelSweeper()
+
+    async def scenario():
+        open_channel(1).close()
+        open_channel(2)
+        release_channel(1, delay=0.02)
+        await sweeper.start()
+        try:
+            await asyncio.sleep(0.1)
+        finally:
+            await sweeper.stop()
+        return set(registry)
+
+    assert asyncio.run(scenario()) == {2}
+    assert sweeper._task is None
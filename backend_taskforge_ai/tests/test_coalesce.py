@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services import channels, coalesce
+from app.services.broker import InMemoryBroker
+from app.services.coalesce import CoalescingPublisher
+
+
+class RecordingBroker:
+    def __init__(self):
+        self.sent = []  # (segundos desde a criação, data, event)
+        self._t0 = time.monotonic()
+
+    async def publish(self, execution_id, data, event=None):
+        self.sent.append((time.monotonic() - self._t0, data, event))
+
+
+@pytest.fixture
+def counted():
+    """Delta of the module counters over the test."""
+    before = dict(coalesce.stats)
+    yield lambda: {k: v - before[k] for k, v in coalesce.stats.items() if v != before[k]}
+
+
+def test_defaults_come_from_settings():
+    publisher = CoalescingPublisher(RecordingBroker(), 1)
+    assert publisher.max_latency == settings.stream_coalesce_ms / 1000 == 0.02
+    assert publisher.max_bytes == settings.stream_coalesce_bytes == 4096
+
+
+def test_first_fragment_goes_out_at_once_then_the_rest_waits_for_the_latency(counted):
+    broker = RecordingBroker()
+    publisher = CoalescingPublisher(broker, 1, max_latency_ms=50)
+
+    async def scenario():
+        for text in ("a", "b", "c"):
+            await publisher.publish(1, text)
+        assert [data for _, data, _ in broker.sent] == ["a"]
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert [data for _, data, _ in broker.sent] == ["a", "bc"]
+    assert broker.sent[1][0] - broker.sent[0][0] >= 0.045
+    assert counted() == {"fragments": 3, "frames": 2, "bytes": 3, "flush_idle": 1, "flush_latency": 1}
+
+
+def test_size_threshold_flushes_without_waiting(counted):
+    broker = RecordingBroker()
+    publisher = CoalescingPublisher(broker, 1, max_latency_ms=10_000, max_bytes=8)
+
+    async def scenario():
+        await publisher.publish(1, "first")
+        for text in ("1234", "5678", "9"):
+            await publisher.publish(1, text)
+        sent = [data for _, data, _ in broker.sent]
+        await publisher.close()
+        return sent
+
+    assert asyncio.run(scenario()) == ["first", "12345678"]
+    assert [data for _, data, _ in broker.sent] == ["first", "12345678", "9"]
+    assert counted()["flush_size"] == 1 and counted()["flush_close"] == 1
+
+
+def test_named_event_flushes_pending_text_first(counted):
+    broker = RecordingBroker()
+    publisher = CoalescingPublisher(broker, 1, max_latency_ms=10_000)
+
+    async def scenario():
+        for text in ("a", "b", "c"):
+            await publisher.publish(1, text)
+        await publisher.publish(1, '{"error": "x"}', "error")
+
+    asyncio.run(scenario())
+    assert [(data, event) for _, data, event in broker.sent] == [("a", None), ("bc", None), ('{"error": "x"}', "error")]
+    assert counted()["flush_event"] == 1
+
+
+def test_close_flushes_the_buffer_and_cancels_the_timer():
+    broker = RecordingBroker()
+    publisher = CoalescingPublisher(broker, 1, max_latency_ms=10_000)
+
+    async def scenario():
+        for text in ("a", "b", "c"):
+            await publisher.publish(1, text)
+        timer = publisher._timer
+        await publisher.close()
+        await asyncio.sleep(0)
+        return timer
+
+    timer = asyncio.run(scenario())
+    assert timer.cancelled() and publisher._timer is None
+    assert [data for _, data, _ in broker.sent] == ["a", "bc"]
+
+
+def test_zero_latency_publishes_every_fragment():
+    broker = RecordingBroker()
+    publisher = CoalescingPublisher(broker, 1, max_latency_ms=0)
+
+    async def scenario():
+        for text in ("a", "b", "c"):
+            await publisher.publish(1, text)
+
+    asyncio.run(scenario())
+    assert [data for _, data, _ in broker.sent] == ["a", "b", "c"]
+
+
+def test_coalesced_frames_are_pre_encoded_sse():
+    publisher = CoalescingPublisher(InMemoryBroker(), 9, max_latency_ms=10_000)
+
+    async def scenario():
+        for text in ("olá\n", "mun", "do"):
+            await publisher.publish(9, text)
+        await publisher.close()
+
+    try:
+        asyncio.run(scenario())
+        first, merged = channels.get_channel(9).events
+        assert first.sse_bytes() == b"id: 1\ndata: ol\xc3\xa1\ndata: \n\n"
+        assert merged.sse_bytes() == "id: 2\ndata: mundo\n\n".encode()
+        # codificado uma vez e compartilhado por todos os assinantes
+        assert merged.sse_bytes() is merged.sse_bytes()
+    finally:
+        channels._remove(9)
@@ -0,0 +1,95 @@
+import base64
+import os
+
+import pytest
+from sqlalchemy import inspect, select, text
+from sqlalchemy.orm import undefer
+
+from app.core.config import settings
+from app.db import models
+from app.db.session import AsyncSessionLocal, SessionLocal
+from app.db.types import MARK, OffRow, decode_payload, encode_payload, result_blob_path
+from app.services.storage import load_result_blobs, store_result_blob
+
+
+@pytest.fixture
+def compress_from(monkeypatch):
+    monkeypatch.setattr(settings, "payload_compress_min_bytes", 64)
+    monkeypatch.setattr(settings, "payload_compression", "zlib")
+
+
+@pytest.mark.parametrize("value", [None, "", "curto", "ünï 😀", MARK + "z:não é base85", "x" * 63])
+def test_small_values_round_trip_inline(compress_from, value):
+    stored = encode_payload(value)
+    assert decode_payload(stored) == value
+    if value is not None and not value.startswith(MARK):
+        assert stored == value
+
+
+def test_large_values_are_compressed(compress_from):
+    value = "linha repetida\n" * 200
+    stored = encode_payload(value)
+    assert stored.startswith(MARK + "z:") and len(stored) < len(value) / 5
+    assert decode_payload(stored) == value
+
+
+def test_incompressible_values_stay_plain(compress_from):
+    value = base64.b85encode(os.urandom(150)).decode()
+    assert encode_payload(value) == value
+
+
+def test_zstd_values_round_trip(compress_from, monkeypatch):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr(settings, "payload_compression", "zstd")
+    value = "zstd " * 100
+    stored = encode_payload(value)
+    assert stored.startswith(MARK + "s:")
+    assert decode_payload(stored) == value
+
+
+def test_rows_written_before_the_type_read_back_as_is(db, compress_from):
+    with SessionLocal() as session:
+        session.execute(text("INSERT INTO executions (agent_id, user_id, status, result) VALUES (1, 1, 'completed', 'antigo')"))
+        session.commit()
+        assert session.execute(select(models.Execution.result)).scalar() == "antigo"
+
+
+def test_off_row_result_is_a_reference_until_loaded(db, run):
+    value = "resultado grande ação " * 500
+
+    async def scenario():
+        blob = await store_result_blob(value)
+        again = await store_result_blob(value)
+        async with AsyncSessionLocal() as session:
+            session.add(models.Execution(id=1, agent_id=1, user_id=1, status="completed", input="oi", result=blob))
+            await session.commit()
+        async with AsyncSessionLocal() as session:
+            exe = await session.get(
+                models.Execution, 1, options=[undefer(models.Execution.input), undefer(models.Execution.result)],
+                populate_existing=True,
+            )
+            loaded = exe.result
+            await load_result_blobs(exe)
+            return blob, again, loaded, exe, session.is_modified(exe)
+
+    blob, again, loaded, exe, modified = run(scenario())
+    # mesmo conteúdo, mesmo arquivo
+    assert again == blob and result_blob_path(blob.sha256).is_file()
+    with SessionLocal() as session:
+        assert session.execute(text("SELECT result FROM executions")).scalar() == f"{MARK}b:{blob.sha256}"
+    assert loaded == OffRow(blob.sha256)
+    assert (exe.input, exe.result) == ("oi", value)
+    assert not modified and not inspect(exe).attrs.result.history.has_changes()
+
+
+def test_load_result_blobs_does_not_load_deferred_columns(db, run):
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            session.add(models.Execution(id=1, agent_id=1, user_id=1, status="completed", result="inline"))
+            await session.commit()
+        async with AsyncSessionLocal() as session:
+            exe = (await session.execute(select(models.Execution))).scalar_one()
+            await load_result_blobs(exe)
+            return inspect(exe).unloaded
+
+    assert {"input", "result"} <= run(scenario())
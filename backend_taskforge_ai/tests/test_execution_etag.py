@@ -0,0 +1,77 @@
+import threading
+import time
+
+from app.core.config import settings
+from app.db import models
+from app.db.session import SessionLocal
+from app.services import executor_async
+
+
+def add_execution() -> int:
+    with SessionLocal() as session:
+        exe = models.Execution(agent_id=1, user_id=1, status="queued", input="hi")
+        session.add(exe)
+        session.commit()
+        return exe.id
+
+
+def test_if_none_match_returns_304_until_the_version_changes(api):
+    execution_id = add_execution()
+    url = f"/api/v1/executions/{execution_id}"
+    first = api.get(url)
+    etag = f'W/"{execution_id}-1"'
+    assert first.status_code == 200 and first.headers["etag"] == etag
+    assert first.json()["status"] == "queued"
+
+    cached = api.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+    assert cached.headers["etag"] == etag
+    # outras ETags na lista não atrapalham; a de outra execução não vale
+    assert api.get(url, headers={"If-None-Match": f'W/"999-1", {etag}'}).status_code == 304
+    assert api.get(url, headers={"If-None-Match": 'W/"999-1"'}).status_code == 200
+
+    api.portal.call(lambda: executor_async._update_execution(execution_id, status="running"))
+    fresh = api.get(url, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["etag"] == f'W/"{execution_id}-2"'
+    assert fresh.json()["status"] == "running"
+
+
+def test_long_poll_wakes_on_change(api, monkeypatch):
+    # só a notificação do commit pode acordar antes do fim da espera
+    monkeypatch.setattr(settings, "execution_longpoll_recheck", 10)
+    execution_id = add_execution()
+    url = f"/api/v1/executions/{execution_id}"
+    replies = []
+
+    def poll():
+        t0 = time.monotonic()
+        replies.append((api.get(url, params={"wait": 5}, headers={"If-None-Match": f'W/"{execution_id}-1"'}),
+                        time.monotonic() - t0))
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    time.sleep(0.2)
+    assert not replies  # estacionado esperando mudança
+    api.portal.call(lambda: executor_async._update_execution(execution_id, status="completed", result="done"))
+    poller.join(5)
+    ((reply, elapsed),) = replies
+    assert reply.status_code == 200 and reply.json()["result"] == "done"
+    assert reply.headers["etag"] == f'W/"{execution_id}-2"'
+    assert 0.2 <= elapsed < 2
+
+
+def test_long_poll_times_out_with_304(api, monkeypatch):
+    monkeypatch.setattr(settings, "execution_longpoll_recheck", 0.05)
+    execution_id = add_execution()
+    t0 = time.monotonic()
+    reply = api.get(f"/api/v1/executions/{execution_id}", params={"wait": 0.3, "since_version": 1})
+    assert reply.status_code == 200  # sem If-None-Match não há 304: devolve a linha inalterada
+    assert time.monotonic() - t0 >= 0.3
+    t0 = time.monotonic()
+    reply = api.get(f"/api/v1/executions/{execution_id}", params={"wait": 0.3},
+                    headers={"If-None-Match": f'W/"{execution_id}-1"'})
+    assert reply.status_code == 304 and time.monotonic() - t0 >= 0.3
+
+
+def test_long_poll_on_a_missing_execution_is_404(api):
+    assert api.get("/api/v1/executions/424242", params={"wait": 1, "since_version": 1}).status_code == 404
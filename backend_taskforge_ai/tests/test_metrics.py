@@ -0,0 +1,131 @@
+import asyncio
+import re
+
+import pytest
+
+from app.api.v1.auth import create_access_token
+from app.db import models
+from app.db.session import SessionLocal
+from app.services import metrics
+
+# linha de amostra do formato texto: nome{rótulos} valor
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="(\\.|[^"\\\n])*",?)*\})? \S+$')
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Metrics created by the test stay out of the process registry."""
+    monkeypatch.setattr(metrics, "_REGISTRY", [])
+    return metrics._REGISTRY
+
+
+def test_escape_label_values():
+    assert metrics._escape('a\\b "c"\nd') == 'a\\\\b \\"c\\"\\nd'
+    assert metrics._escape(42) == "42"
+
+
+def test_counter_renders_escaped_labels(registry):
+    counter = metrics.Counter("t_total", "Test counter", ("path",))
+    counter.inc(path='C:\\tmp "x"\n')
+    counter.inc(2, path='C:\\tmp "x"\n')
+    assert metrics.render() == (
+        "# HELP t_total Test counter\n"
+        "# TYPE t_total counter\n"
+        't_total{path="C:\\\\tmp \\"x\\"\\n"} 3\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive(registry):
+    histogram = metrics.Histogram("t_seconds", "Test histogram", ("op",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, op="read")
+    lines = metrics.render().splitlines()
+    assert lines == [
+        "# HELP t_seconds Test histogram",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{op="read",le="0.1"} 2',
+        't_seconds_bucket{op="read",le="1"} 3',
+        't_seconds_bucket{op="read",le="+Inf"} 4',
+        't_seconds_sum{op="read"} 3.65',
+        't_seconds_count{op="read"} 4',
+    ]
+
+
+def test_metrics_endpoint_is_valid_exposition(api):
+    metrics.rate_limit_decisions.inc(scope="user", decision='odd "value"')
+    r = api.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = r.text
+    assert body.endswith("\n")
+    declared = set()
+    for line in body.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert kind in ("counter", "gauge", "histogram")
+            declared.add(name)
+        elif not line.startswith("# HELP "):
+            assert SAMPLE.match(line), line
+            name = re.match(r"[^{ ]+", line).group()
+            assert re.sub(r"_(bucket|sum|count)$", "", name) in declared or name in declared, line
+    assert 'taskforge_rate_limit_decisions_total{scope="user",decision="odd \\"value\\""} 1' in body.splitlines()
+    assert "# TYPE taskforge_queue_depth gauge" in body and "taskforge_queue_depth 0" in body
+
+
+def test_spans_reach_helpers_and_child_tasks_through_the_contextvar():
+    async def execution(execution_id):
+        spans = metrics.ExecutionSpans(execution_id, "gemini", detailed=True)
+        metrics.current_spans.set(spans)
+        with metrics.db_timer("fetch"):
+            await asyncio.sleep(0)
+
+        async def upstream():
+            # task filha herda o contexto (e o spans) de quem a criou
+            metrics.observe_headers("gemini", 0.002)
+
+        await asyncio.create_task(upstream())
+        return spans
+
+    async def scenario():
+        first, second = await asyncio.gather(execution(1), execution(2))
+        return first, second, metrics.current_spans.get()
+
+    first, second, outside = asyncio.run(scenario())
+    assert outside is None
+    for spans in (first, second):
+        assert [step["step"] for step in spans.steps] == ["db.fetch", "upstream_headers"]
+
+
+def test_spans_without_detail_keep_only_the_row_columns(monkeypatch):
+    monkeypatch.setattr(metrics, "recent_profiles", type(metrics.recent_profiles)(maxlen=5))
+    seen = []
+    metrics.add_profile_hook(seen.append)
+    metrics.add_profile_hook(lambda profile: 1 / 0)  # hook com erro não derruba a execução
+    try:
+        quiet = metrics.ExecutionSpans(1, "gemini")
+        quiet.step("db.fetch", 0.001)
+        quiet.output("olá")
+        row = quiet.finish("completed", 12.7)
+        detailed = metrics.ExecutionSpans(2, "gemini", detailed=True)
+        detailed.output("x")
+        detailed.finish("failed", None)
+    finally:
+        metrics._profile_hooks.clear()
+    assert quiet.steps is None and row["output_bytes"] == 4 and row["queue_wait_ms"] == 12
+    assert row["ttft_ms"] is not None and row["connect_ms"] is None
+    assert [p["execution_id"] for p in metrics.recent_profiles] == [2] and seen == list(metrics.recent_profiles)
+    assert [step["step"] for step in seen[0]["steps"]] == ["first_output"]
+
+
+def test_profiling_limit_is_bounded(api, monkeypatch):
+    with SessionLocal() as session:
+        user = models.User(email="ops@example.com", display_name="", hashed_password="x")
+        session.add(user)
+        session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+    monkeypatch.setattr(metrics, "recent_profiles", type(metrics.recent_profiles)(
+        ({"execution_id": i} for i in range(5)), maxlen=200))
+    r = api.get("/api/v1/system/profiling", params={"limit": 2}, headers=headers)
+    assert [p["execution_id"] for p in r.json()["profiles"]] == [4, 3]
+    for limit in (0, -1, 201):
+        assert api.get("/api/v1/system/profiling", params={"limit": limit}, headers=headers).status_code == 422
@@ -0,0 +1,62 @@
+import datetime
+import json
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app.api.v1 import pagination
+from app.db import models
+from app.db.session import SessionLocal
+
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2024, 2, 29, 23, 59, 59, 123456)
+    cursor = pagination.encode_cursor(created_at, 42)
+    assert "=" not in cursor
+    assert pagination.decode_cursor(cursor) == (created_at, 42)
+    score_cursor = pagination.encode_score_cursor(-1.5e-7, 9)
+    assert pagination.decode_score_cursor(score_cursor) == (-1.5e-7, 9)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", "WzFd", pagination.encode_score_cursor(1.0, 2)])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as e:
+        pagination.decode_cursor(cursor)
+    assert e.value.status_code == 400
+
+
+def test_parse_fields_rejects_unknown_columns():
+    assert pagination.parse_fields("id, status", ("id", "status", "result")) == ("id", "status")
+    with pytest.raises(HTTPException) as e:
+        pagination.parse_fields("id,password", ("id", "status"))
+    assert e.value.status_code == 400
+
+
+def test_keyset_pages_walk_every_row_once_with_tied_timestamps(db):
+    base = datetime.datetime(2024, 1, 1)
+    with SessionLocal() as session:
+        # vários created_at iguais: o id desempata
+        session.add_all(
+            models.Execution(agent_id=1, user_id=1, status="completed", created_at=base + datetime.timedelta(seconds=i // 3))
+            for i in range(10)
+        )
+        session.commit()
+        Execution = models.Execution
+        fields = ("id", "status")
+        seen, cursor, pages = [], None, 0
+        while True:
+            stmt = pagination.keyset_page(select(Execution), Execution, cursor, 4, fields)
+            rows = session.execute(stmt).scalars().all()
+            response = pagination.page_response(rows, 4, fields, "http://test/api/v1/executions/?limit=4")
+            body = json.loads(response.body)
+            assert all(set(item) == set(fields) for item in body)
+            seen += [item["id"] for item in body]
+            pages += 1
+            cursor = response.headers.get("x-next-cursor")
+            if cursor is None:
+                break
+            assert response.headers["link"] == f'<http://test/api/v1/executions/?limit=4&cursor={cursor}>; rel="next"'
+            session.expunge_all()
+    assert pages == 3
+    assert seen == list(range(10, 0, -1))
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+from app.core.config import settings
+from app.db import models
+from app.db.session import SessionLocal
+from app.services import persistence
+from app.services.persistence import ExecutionWriter, ResultCheckpointer
+
+
+def add_execution() -> int:
+    with SessionLocal() as db:
+        exe = models.Execution(agent_id=1, user_id=1, status="queued", input="hi")
+        db.add(exe)
+        db.commit()
+        return exe.id
+
+
+def row(execution_id: int):
+    with SessionLocal() as db:
+        exe = db.get(models.Execution, execution_id)
+        return exe.status, exe.result, exe.version
+
+
+def test_stages_between_flushes_collapse_into_one_commit(db, run, monkeypatch):
+    monkeypatch.setattr(settings, "persistence_flush_ms", 50)
+    a, b = add_execution(), add_execution()
+    writer = ExecutionWriter()
+
+    async def scenario():
+        await writer.start()
+        try:
+            writer.stage(a, status="running")
+            writer.stage(a, result="partial")
+            writer.stage(b, status="running")
+            await writer.write(a, status="completed", result="final")
+        finally:
+            await writer.stop()
+
+    run(scenario())
+    assert (writer.flushes, writer.rows_written) == (1, 2)
+    # um UPDATE por linha: a versão sobe uma vez só
+    assert row(a) == ("completed", "final", 2)
+    assert row(b) == ("running", None, 2)
+
+
+def test_failed_flush_is_retried_without_another_stage(db, run, monkeypatch):
+    monkeypatch.setattr(settings, "persistence_flush_ms", 30)
+    execution_id = add_execution()
+    real_session = persistence.AsyncSessionLocal
+    attempts = []
+
+    def flaky_session():
+        attempts.append(time.monotonic())
+        if len(attempts) <= 2:
+            raise OSError("database is locked")
+        return real_session()
+
+    monkeypatch.setattr(persistence, "AsyncSessionLocal", flaky_session)
+    writer = ExecutionWriter()
+
+    async def scenario():
+        await writer.start()
+        try:
+            writer.stage(execution_id, status="running", result="kept")
+            deadline = time.monotonic() + 5
+            while writer.flushes == 0 and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+        finally:
+            await writer.stop()
+
+    run(scenario())
+    assert len(attempts) == 3 and writer.flushes == 1
+    # backoff crescente entre as tentativas
+    assert attempts[2] - attempts[1] > attempts[1] - attempts[0]
+    assert row(execution_id) == ("running", "kept", 2)
+
+
+def test_write_without_a_started_writer_commits_directly(db, run):
+    execution_id = add_execution()
+    run(ExecutionWriter().write(execution_id, status="failed"))
+    assert row(execution_id)[0] == "failed"
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.staged = []
+
+    def stage(self, execution_id, **fields):
+        self.staged.append(fields["result"])
+
+
+def test_checkpoints_carry_the_whole_text_so_far(monkeypatch):
+    monkeypatch.setattr(settings, "checkpoint_every_tokens", 3)
+    monkeypatch.setattr(settings, "checkpoint_every_ms", 60_000)
+    writer = RecordingWriter()
+    buffer = ResultCheckpointer(1, writer)
+    for i in range(8):
+        buffer.append(str(i))
+    assert writer.staged == ["012", "012345"]
+    assert buffer.text() == "01234567"
+    buffer.append("8")
+    assert buffer.text() == "012345678"
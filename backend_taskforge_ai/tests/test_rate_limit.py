@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services import rate_limit
+from app.services.rate_limit import MemoryBuckets, RateLimited, RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # só o relógio do módulo: o loop do asyncio continua com o de verdade
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+def test_bucket_spends_burst_then_refills(clock):
+    buckets = MemoryBuckets()
+
+    async def scenario():
+        spent = [await buckets.take("k", rate=2, burst=3) for _ in range(4)]
+        clock.now += 0.25
+        half = await buckets.take("k", rate=2, burst=3)
+        clock.now += 0.25
+        return spent, half, await buckets.take("k", rate=2, burst=3)
+
+    spent, half, refilled = asyncio.run(scenario())
+    assert spent == [0.0, 0.0, 0.0, 0.5]
+    assert half == pytest.approx(0.25)
+    assert refilled == 0.0
+
+
+def test_refund_gives_a_token_back_up_to_the_burst(clock):
+    buckets = MemoryBuckets()
+
+    async def scenario():
+        await buckets.take("k", rate=1, burst=2)
+        await buckets.take("k", rate=1, burst=2)
+        await buckets.take("k", rate=1, burst=2, cost=-1)
+        await buckets.take("k", rate=1, burst=2, cost=-5)
+        return [await buckets.take("k", rate=1, burst=2) for _ in range(3)]
+
+    # o reembolso não passa do burst: só dois tokens disponíveis
+    assert asyncio.run(scenario()) == [0.0, 0.0, 1.0]
+
+
+def test_admit_raises_with_retry_after(clock, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_user_per_minute", 60)
+    monkeypatch.setattr(settings, "rate_limit_user_burst", 2)
+    monkeypatch.setattr(settings, "rate_limit_user_overrides", {7: 0})
+    limiter = RateLimiter()
+
+    async def scenario():
+        await limiter.admit(1)
+        await limiter.admit(1)
+        with pytest.raises(RateLimited) as limited:
+            await limiter.admit(1)
+        # usuário com override 0: sem limite
+        for _ in range(10):
+            await limiter.admit(7)
+        clock.now += 1
+        await limiter.admit(1)
+        return limited.value
+
+    assert asyncio.run(scenario()).retry_after == pytest.approx(1.0)
+
+
+def test_batch_larger_than_the_burst_is_admitted_into_debt(clock, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_user_per_minute", 60)
+    monkeypatch.setattr(settings, "rate_limit_user_burst", 2)
+    limiter = RateLimiter()
+
+    async def scenario():
+        await limiter.admit(1)
+        # balde pela metade: o lote espera até encher, não é rejeitado de vez
+        with pytest.raises(RateLimited) as not_full:
+            await limiter.admit(1, cost=50)
+        clock.now += 1
+        await limiter.admit(1, cost=50)
+        with pytest.raises(RateLimited) as in_debt:
+            await limiter.admit(1)
+        clock.now += 49
+        await limiter.admit(1)
+        return not_full.value, in_debt.value
+
+    not_full, in_debt = asyncio.run(scenario())
+    assert not_full.retry_after == pytest.approx(1.0)
+    # 48 tokens de débito + 1 para a próxima execução
+    assert in_debt.retry_after == pytest.approx(49.0)
+
+
+def test_dispatch_token_refund(clock, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_provider_per_minute", {"gemini": 60, "gemini:fast": 600})
+    monkeypatch.setattr(settings, "rate_limit_provider_burst", 1)
+    limiter = RateLimiter()
+
+    async def scenario():
+        token = await limiter.acquire_dispatch("gemini", "pro")
+        # nada foi reivindicado: o token volta e o próximo dispatch não espera
+        await limiter.refund(token)
+        again = await asyncio.wait_for(limiter.acquire_dispatch("gemini", "pro"), timeout=0.5)
+        return token, again, await limiter.acquire_dispatch("gemini", "fast"), await limiter.acquire_dispatch("hf", None)
+
+    token, again, fast, unlimited = asyncio.run(scenario())
+    assert token == again == ("gemini", 1.0)
+    assert fast == ("gemini:fast", 10.0)
+    assert unlimited is None
@@ -0,0 +1,183 @@
+import asyncio
+import importlib
+
+import pytest
+
+from app.core.config import settings
+from app.db import models
+from app.db.session import SessionLocal
+from app.services import channels, executor_async
+from app.services.result_cache import Flight, ResultCache, cache_key
+from app.services.stream_decoder import StreamEvent
+
+# o pacote reexporta o singleton `result_cache` com o nome do módulo
+result_cache_module = importlib.import_module("app.services.result_cache")
+
+
+class FakeClock:
+    """Stands in for the module's `time`: wall clock moved by hand."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def memory_only(monkeypatch):
+    monkeypatch.setattr(settings, "result_cache_disk", False)
+
+
+def test_cache_key_normalizes_whitespace_only():
+    key = cache_key("gemini", "m", {"t": 0.2}, "hello   world\n")
+    assert key == cache_key("gemini", "m", {"t": 0.2}, " hello world")
+    assert key != cache_key("gemini", "m", {"t": 0.3}, "hello world")
+    assert key != cache_key("huggingface", "m", {"t": 0.2}, "hello world")
+
+
+def test_memory_entries_expire_after_the_ttl(memory_only, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(result_cache_module, "time", clock)
+    cache = ResultCache(ttl=60)
+
+    async def scenario():
+        await cache.set("k", "v")
+        clock.now += 59
+        first = await cache.get("k")
+        clock.now += 2
+        return first, await cache.get("k")
+
+    assert asyncio.run(scenario()) == ("v", None)
+    assert cache.stats["expired"] == 1 and cache.stats["misses"] == 1
+    assert cache.snapshot()["memory_entries"] == 0
+
+
+def test_lru_evicts_the_least_recently_used(memory_only):
+    cache = ResultCache(max_entries=2)
+
+    async def scenario():
+        await cache.set("a", "1")
+        await cache.set("b", "2")
+        await cache.get("a")  # "b" passa a ser o mais antigo
+        await cache.set("c", "3")
+        return [await cache.get(k) for k in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == ["1", None, "3"]
+    assert cache.stats["evictions"] == 1
+
+
+def test_disk_tier_serves_another_instance(tmp_path):
+    writer, reader = ResultCache(disk_path=tmp_path), ResultCache(disk_path=tmp_path)
+
+    async def scenario():
+        await writer.set("ab12", "stored")
+        return await reader.get("ab12"), await reader.get("ab12")
+
+    assert asyncio.run(scenario()) == ("stored", "stored")
+    assert (tmp_path / "ab" / "ab12.json").exists()
+    # a primeira leitura veio do disco e ficou na memória
+    assert (reader.stats["disk_hits"], reader.stats["memory_hits"]) == (1, 1)
+
+
+def test_expired_disk_entry_is_removed(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(result_cache_module, "time", clock)
+
+    async def scenario():
+        await ResultCache(ttl=60, disk_path=tmp_path).set("cd34", "old")
+        clock.now += 61
+        return await ResultCache(ttl=60, disk_path=tmp_path).get("cd34")
+
+    assert asyncio.run(scenario()) is None
+    assert not (tmp_path / "cd" / "cd34.json").exists()
+
+
+def test_disk_is_pruned_every_100_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "result_cache_max_disk_entries", 30)
+    cache = ResultCache(disk_path=tmp_path)
+
+    async def scenario():
+        for i in range(99):
+            await cache.set(f"{i:04x}", "v")
+        before = len(list(tmp_path.glob("*/*.json")))
+        await cache.set("ffff", "v")
+        return before
+
+    assert asyncio.run(scenario()) == 99
+    assert len(list(tmp_path.glob("*/*.json"))) == 30
+    assert cache.stats["disk_evictions"] == 70
+
+
+def test_flight_followers_replay_then_wait():
+    flight = Flight()
+
+    async def scenario():
+        flight.push("a")
+        late = []
+
+        async def follow():
+            async for piece in flight.follow():
+                late.append(piece)
+
+        follower = asyncio.create_task(follow())
+        await asyncio.sleep(0)
+        flight.push("b")
+        await asyncio.sleep(0)
+        flight.finish("completed", "ab")
+        await asyncio.wait_for(follower, 1)
+        return late
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+    assert (flight.status, flight.result) == ("completed", "ab")
+
+
+class CountingRouter:
+    """Provider router stand-in: counts upstream calls and streams a few tokens slowly."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def stream(self, user_input):
+        self.calls += 1
+
+        class Stream:
+            provider = None
+            attempts = []
+
+            async def __aiter__(self):
+                for token in ("one ", "two"):
+                    await asyncio.sleep(0.02)
+                    yield StreamEvent("text", token)
+
+        return Stream()
+
+
+def test_identical_concurrent_executions_share_one_upstream_call(db, run, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "result_cache_enabled", True)
+    router = CountingRouter()
+    monkeypatch.setattr(executor_async, "provider_router", router)
+    monkeypatch.setattr(executor_async, "result_cache", ResultCache(disk_path=tmp_path))
+    with SessionLocal() as session:
+        rows = [models.Execution(agent_id=1, user_id=1, status="queued", input=text)
+                for text in ("same  question", "same question", "same question")]
+        session.add_all(rows)
+        session.commit()
+        leader, follower, later = (row.id for row in rows)
+
+    async def scenario():
+        await asyncio.gather(executor_async.process_execution(leader), executor_async.process_execution(follower))
+        # terminada a primeira: a terceira vem do cache
+        await executor_async.process_execution(later)
+
+    try:
+        run(scenario())
+    finally:
+        for execution_id in (leader, follower, later):
+            channels._remove(execution_id)
+    assert router.calls == 1
+    assert executor_async.result_cache.stats["coalesced"] == 1
+    assert executor_async.result_cache.stats["hits"] == 1
+    with SessionLocal() as session:
+        results = [session.get(models.Execution, i) for i in (leader, follower, later)]
+        assert [(r.status, r.result) for r in results] == [("completed", "one two")] * 3
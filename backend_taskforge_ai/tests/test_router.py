@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.providers.base import Provider, ProviderError
+from app.services.providers.router import ProviderRouter
+from app.services.stream_decoder import StreamEvent
+
+
+class FakeProvider(Provider):
+    """Scripted provider: waits `delay`, then raises `error` or streams `tokens` (`gap` apart)."""
+
+    def __init__(self, name: str, delay: float = 0.0, tokens=("ok",), error: ProviderError | None = None,
+                 streams: bool = True, gap: float = 0.0):
+        super().__init__("m")
+        self.name = name
+        self.delay = delay
+        self.tokens = tokens
+        self.error = error
+        self.streams = streams
+        self.gap = gap
+        self.calls = 0
+        self.cancelled = 0
+
+    async def stream(self, user_input: str):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            for token in self.tokens:
+                yield StreamEvent("text", f"{self.name}:{token}")
+                await asyncio.sleep(self.gap)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+class FakeRouter(ProviderRouter):
+    def __init__(self, *providers):
+        super().__init__()
+        self.providers = list(providers)
+
+    def configured(self):
+        return list(self.providers)
+
+
+@pytest.fixture(autouse=True)
+def fast_router(monkeypatch):
+    monkeypatch.setattr(settings, "router_hedge_enabled", True)
+    monkeypatch.setattr(settings, "router_hedge_default_ms", 20)
+    monkeypatch.setattr(settings, "router_ttft_timeout", 5.0)
+    monkeypatch.setattr(settings, "router_max_attempts", 3)
+
+
+def run(router: ProviderRouter):
+    async def consume():
+        stream = router.stream("hi")
+        texts = [ev.value async for ev in stream]
+        # dá ao perdedor cancelado a chance de terminar
+        await asyncio.sleep(0.01)
+        return stream, texts
+
+    return asyncio.run(consume())
+
+
+def test_hedge_fires_and_the_loser_is_cancelled():
+    slow, fast = FakeProvider("slow", delay=1.0), FakeProvider("fast")
+    stream, texts = run(FakeRouter(slow, fast))
+    assert texts == ["fast:ok"]
+    assert stream.provider is fast
+    assert [(a["provider"], a["hedge"], a["won"]) for a in stream.attempts] == [
+        ("slow:m", False, False), ("fast:m", True, True),
+    ]
+    assert slow.cancelled == 1
+
+
+def test_no_hedge_when_the_primary_answers_in_time():
+    first, spare = FakeProvider("first", delay=0.001), FakeProvider("spare")
+    stream, texts = run(FakeRouter(first, spare))
+    assert texts == ["first:ok"] and spare.calls == 0
+
+
+def test_no_hedge_to_the_same_provider():
+    only = FakeProvider("only", delay=0.1)
+    stream, texts = run(FakeRouter(only))
+    assert texts == ["only:ok"]
+    assert only.calls == 1 and len(stream.attempts) == 1
+
+
+def test_non_streaming_provider_is_not_hedged():
+    batchy, spare = FakeProvider("hf", delay=0.1, streams=False), FakeProvider("spare")
+    stream, texts = run(FakeRouter(batchy, spare))
+    assert texts == ["hf:ok"] and spare.calls == 0
+
+
+def test_failover_on_retryable_error():
+    broken = FakeProvider("broken", error=ProviderError("boom", status=503, retryable=True))
+    backup = FakeProvider("backup")
+    stream, texts = run(FakeRouter(broken, backup))
+    assert texts == ["backup:ok"]
+    assert [(a["provider"], a["error"]) for a in stream.attempts] == [("broken:m", "boom"), ("backup:m", None)]
+
+
+def test_non_retryable_error_is_final():
+    broken = FakeProvider("broken", error=ProviderError("bad request", status=400))
+    backup = FakeProvider("backup")
+    with pytest.raises(ProviderError, match="bad request"):
+        run(FakeRouter(broken, backup))
+    assert backup.calls == 0
+
+
+def test_consumer_stopping_early_cancels_the_request():
+    long = FakeProvider("long", tokens=range(1000), gap=0.005)
+
+    async def scenario():
+        iterator = FakeRouter(long).stream("hi").__aiter__()
+        first = await iterator.__anext__()
+        await iterator.aclose()
+        await asyncio.sleep(0.01)
+        return first
+
+    assert asyncio.run(scenario()).value == "long:0"
+    assert long.cancelled == 1
@@ -0,0 +1,141 @@
+import asyncio
+import importlib
+import time
+
+from sqlalchemy import select
+
+from app.db import models
+from app.db.session import SessionLocal
+
+scheduler_module = importlib.import_module("app.services.scheduler")
+
+
+def add_executions(*user_ids):
+    with SessionLocal() as db:
+        rows = [models.Execution(agent_id=1, user_id=u, status="queued", input=f"hi {u}") for u in user_ids]
+        db.add_all(rows)
+        db.commit()
+        return [row.id for row in rows]
+
+
+def statuses():
+    with SessionLocal() as db:
+        return dict(db.execute(select(models.Execution.id, models.Execution.status)).all())
+
+
+def test_concurrent_claims_never_share_a_row(db, run):
+    ids = add_executions(1, 1, 2)
+
+    async def claim_all():
+        return await asyncio.gather(*(scheduler_module._claim_next(worker_id=f"w{n}") for n in range(5)))
+
+    claimed = run(claim_all())
+    assert sorted(i for i in claimed if i is not None) == ids
+    assert claimed.count(None) == 2
+    with SessionLocal() as db_:
+        rows = db_.execute(select(models.Execution)).scalars().all()
+        assert {row.status for row in rows} == {"running"}
+        assert all(row.claimed_by and row.heartbeat_at and row.version == 2 for row in rows)
+
+
+def test_claim_skips_a_row_taken_in_between(db, run, monkeypatch):
+    first, second = add_executions(1, 1)
+    real_session = scheduler_module.AsyncSessionLocal
+
+    # outro worker reivindica a primeira linha entre o SELECT e o UPDATE condicional
+    def racing_session():
+        session = real_session()
+        execute = session.execute
+        raced = []
+
+        async def execute_with_race(stmt, *args, **kwargs):
+            result = await execute(stmt, *args, **kwargs)
+            if not raced and stmt.is_select:
+                raced.append(True)
+                with SessionLocal() as other:
+                    other.get(models.Execution, first).status = "running"
+                    other.commit()
+            return result
+
+        session.execute = execute_with_race
+        return session
+
+    monkeypatch.setattr(scheduler_module, "AsyncSessionLocal", racing_session)
+    assert run(scheduler_module._claim_next()) == second
+
+
+def test_fair_claims_alternate_between_users(db, run):
+    add_executions(1, 1, 1, 2)
+    fair = scheduler_module.FairQueue()
+
+    async def claim(n):
+        return [await scheduler_module._claim_next(fair) for _ in range(n)]
+
+    claimed = run(claim(4))
+    with SessionLocal() as db_:
+        users = [db_.get(models.Execution, i).user_id for i in claimed]
+    # empate no tag virtual: a linha mais antiga (usuário 1) vai primeiro
+    assert users == [1, 2, 1, 1]
+
+
+class FakeBroker:
+    def __init__(self):
+        self.closed = []
+
+    async def close(self, execution_id):
+        self.closed.append(execution_id)
+
+
+def test_crashed_execution_is_failed_closed_and_worker_survives(db, run, monkeypatch):
+    first, second = add_executions(1, 1)
+    broker = FakeBroker()
+    writes = []
+
+    async def crash(execution_id):
+        raise RuntimeError("boom")
+
+    real_write = scheduler_module.execution_writer.write
+
+    async def flaky_write(execution_id, **fields):
+        writes.append(execution_id)
+        if len(writes) == 1:
+            raise RuntimeError("database is gone")
+        await real_write(execution_id, **fields)
+
+    monkeypatch.setattr(scheduler_module.executor_async, "process_execution", crash)
+    monkeypatch.setattr(scheduler_module, "get_broker", lambda: broker)
+    monkeypatch.setattr(scheduler_module.execution_writer, "write", flaky_write)
+
+    async def scenario():
+        scheduler = scheduler_module.ExecutionScheduler(workers=1, poll_interval=0.05)
+        await scheduler.start()
+        try:
+            deadline = time.monotonic() + 5
+            while len(broker.closed) < 2 and time.monotonic() < deadline:
+                await asyncio.sleep(0.02)
+            return statuses()
+        finally:
+            await scheduler.stop()
+
+    during = run(scenario())
+    # o primeiro write falhou, mas o stream foi fechado e o worker seguiu para a próxima linha
+    assert broker.closed == [first, second]
+    assert writes == [first, second]
+    assert during == {first: "running", second: "failed"}
+    # ao parar, a linha que ficou `running` volta para a fila
+    assert statuses() == {first: "queued", second: "failed"}
+
+
+def test_recover_orphans_requeues_only_expired_leases(db, run):
+    live, stale = add_executions(1, 1)
+
+    async def scenario():
+        await scheduler_module._claim_next(worker_id="alive")
+        await scheduler_module._claim_next(worker_id="dead")
+        await scheduler_module._renew_leases("alive")
+        await asyncio.sleep(0.2)
+        await scheduler_module._renew_leases("alive")
+        return await scheduler_module._recover_orphans(lease_seconds=0.1)
+
+    assert run(scenario()) == 1
+    assert statuses() == {live: "running", stale: "queued"}
@@ -0,0 +1,120 @@
+import pytest
+
+from app.core.config import settings
+from app.db import models
+from app.db.session import AsyncSessionLocal, SessionLocal, engine
+from app.services import search
+from app.services.persistence import ExecutionWriter
+
+
+@pytest.fixture
+def fts(db, monkeypatch):
+    """SQLite FTS5 index created by the test, empty at the start (it is not in the ORM metadata).
+
+    Other tests index executions through the app; their ids come back once the tables are recreated.
+    """
+
+    def drop():
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {search.FTS_TABLE}")
+
+    monkeypatch.setitem(search._index, "kind", search._index["kind"])
+    monkeypatch.setitem(search._index, "replace", search._index["replace"])
+    drop()
+    with engine.begin() as conn:
+        search.create_search_index(conn)
+    yield
+    drop()
+
+
+def add(*rows) -> list[int]:
+    """(status, input, result) rows -> execution ids, in insertion order."""
+    with SessionLocal() as session:
+        executions = [models.Execution(agent_id=1, user_id=1, status=s, input=i, result=r) for s, i, r in rows]
+        session.add_all(executions)
+        session.commit()
+        return [exe.id for exe in executions]
+
+
+async def hits(q, limit=50, after=None, **filters):
+    async with AsyncSessionLocal() as db:
+        return await search.search(db, q, limit, after, **filters)
+
+
+def test_fts5_query_quotes_terms_and_keeps_phrases_and_prefixes():
+    assert search.fts5_query('deploy "blue green" rollb* NOT x') == '"deploy" "blue green" "rollb"* "NOT" "x"'
+    assert search.fts5_query("  !!  ") is None
+
+
+def test_reindex_indexes_finished_executions_input_first(fts, run):
+    best, second, queued, other = add(
+        ("completed", "kangaroo facts", "they hop"),
+        ("failed", "animals", "a kangaroo was mentioned"),
+        ("queued", "kangaroo", None),
+        ("completed", "café com leite", "bebida"),
+    )
+    assert run(search.reindex()) == 3
+    found = run(hits("kangaroo"))
+    # input pesa 2x: o match no input vem antes; a execução pendente não foi indexada
+    assert [id for id, _ in found] == [best, second]
+    assert found[0][1] < found[1][1]
+    assert [id for id, _ in run(hits("kangaroo", status="failed"))] == [second]
+    # diacríticos removidos e prefixos
+    assert [id for id, _ in run(hits("cafe"))] == [other]
+    assert [id for id, _ in run(hits("kang*"))] == [best, second]
+    # rodar de novo não duplica (substitui ou pula, conforme a versão do SQLite)
+    assert run(search.reindex()) == (3 if search._index["replace"] else 0)
+    assert [id for id, _ in run(hits("kangaroo"))] == [best, second]
+
+
+def test_writer_indexes_with_the_final_update(fts, run):
+    run(search.reindex())
+    (execution_id,) = add(("running", "platypus question", None))
+    writer = ExecutionWriter()
+
+    async def finish():
+        writer.stage_search(execution_id, "platypus question", "the platypus lays eggs")
+        await writer.write(execution_id, status="completed", result="the platypus lays eggs")
+
+    run(finish())
+    assert [id for id, _ in run(hits("eggs"))] == [execution_id]
+
+
+def test_score_cursor_walks_ties_by_id(fts, run):
+    ids = add(*[("completed", "same words here", "same") for _ in range(5)], ("completed", "same", "x"))
+    run(search.reindex())
+    seen, after = [], None
+    while True:
+        page = run(hits("same", limit=2, after=after))
+        if not page:
+            break
+        seen += page
+        after = (page[-1][1], page[-1][0])
+    assert sorted(id for id, _ in seen) == ids
+    assert seen == sorted(seen, key=lambda hit: (hit[1], hit[0]))
+    # os cinco textos iguais empatam no score e saem em ordem de id, atravessando páginas
+    tied = [(id, score) for id, score in seen if id in ids[:5]]
+    assert [id for id, _ in tied] == ids[:5] and len({score for _, score in tied}) == 1
+
+
+def test_only_the_newest_candidates_are_ranked(fts, run, monkeypatch):
+    oldest, *rest = add(("completed", "wombat wombat wombat", "wombat"),
+                        *[("completed", "misc", f"wombat {i}") for i in range(4)])
+    run(search.reindex())
+    assert oldest in [id for id, _ in run(hits("wombat"))]
+    monkeypatch.setattr(settings, "search_max_candidates", 3)
+    # o melhor match é o mais antigo e fica de fora do ranking
+    assert sorted(id for id, _ in run(hits("wombat"))) == rest[-3:]
+
+
+def test_search_endpoint_pages_with_a_score_cursor(api, fts):
+    ids = add(*[("completed", f"gecko note {i}", "gecko") for i in range(3)])
+    api.portal.call(search.reindex)
+    first = api.get("/api/v1/executions/search", params={"q": "gecko", "limit": 2, "fields": "id"})
+    assert first.status_code == 200 and len(first.json()) == 2
+    assert all(set(item) == {"id", "score"} for item in first.json())
+    cursor = first.headers["x-next-cursor"]
+    second = api.get("/api/v1/executions/search", params={"q": "gecko", "limit": 2, "fields": "id", "cursor": cursor})
+    assert "x-next-cursor" not in second.headers
+    assert sorted(item["id"] for item in first.json() + second.json()) == ids
+    assert api.get("/api/v1/executions/search", params={"q": "!!"}).status_code == 422
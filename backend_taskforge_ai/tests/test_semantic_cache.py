@@ -0,0 +1,103 @@
+import asyncio
+import importlib
+
+import pytest
+
+from app.core.config import settings
+
+np = pytest.importorskip("numpy")
+
+# o pacote reexporta o singleton `semantic_cache` com o nome do módulo
+semantic = importlib.import_module("app.services.semantic_cache")
+
+QUESTION = "How do I reset my password on the mobile app?"
+NEAR = "how do I reset my password on the mobile app"
+OTHER = "What is the weather forecast for Lisbon tomorrow?"
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "semantic_cache_enabled", True)
+    monkeypatch.setattr(settings, "semantic_cache_threshold", 0.9)
+    monkeypatch.setattr(settings, "semantic_cache_save_interval", 3600)
+    cache = semantic.SemanticCache()
+    cache.path = tmp_path
+    return cache
+
+
+def remember(cache, agent_id, variant, text, result):
+    probe = asyncio.run(cache.lookup(agent_id, variant, text))
+    cache.add(probe, result)
+
+
+def test_featurize_is_normalized_and_deterministic():
+    a = semantic.featurize(QUESTION, 256)
+    assert a.dtype == np.float32 and a.shape == (256,)
+    assert float(np.linalg.norm(a)) == pytest.approx(1.0, abs=1e-5)
+    assert np.array_equal(a, semantic.featurize(QUESTION, 256))
+    assert not semantic.featurize("  !! ", 256).any()
+
+
+def test_threshold_decides_between_hit_and_miss(cache, monkeypatch):
+    remember(cache, 1, "v", QUESTION, "answer")
+    near = asyncio.run(cache.lookup(1, "v", NEAR))
+    other = asyncio.run(cache.lookup(1, "v", OTHER))
+    assert near.result == "answer" and near.similarity >= 0.9
+    assert other.result is None and other.similarity < 0.5
+    # o mesmo par logo acima da similaridade medida deixa de servir
+    monkeypatch.setattr(settings, "semantic_cache_threshold", near.similarity + 1e-3)
+    assert asyncio.run(cache.lookup(1, "v", NEAR)).result is None
+    assert (cache.stats["hits"], cache.stats["misses"]) == (1, 3)
+
+
+def test_indexes_are_isolated_per_agent_and_variant(cache):
+    remember(cache, 1, "gemini", QUESTION, "agent 1")
+    remember(cache, 2, "gemini", QUESTION, "agent 2")
+    assert asyncio.run(cache.lookup(1, "gemini", QUESTION)).result == "agent 1"
+    assert asyncio.run(cache.lookup(2, "gemini", QUESTION)).result == "agent 2"
+    assert asyncio.run(cache.lookup(3, "gemini", QUESTION)).result is None
+    assert asyncio.run(cache.lookup(1, "huggingface", QUESTION)).result is None
+
+
+def test_full_index_replaces_its_least_recently_used_row(cache, monkeypatch):
+    monkeypatch.setattr(settings, "semantic_cache_max_entries_per_agent", 2)
+    remember(cache, 1, "v", "first question about invoices", "r1")
+    remember(cache, 1, "v", "second question about shipping", "r2")
+    asyncio.run(cache.lookup(1, "v", "first question about invoices"))  # r1 volta a ser usado
+    remember(cache, 1, "v", "third question about refunds", "r3")
+    assert cache.entries() == 2 and cache.stats["evictions"] == 1
+    assert asyncio.run(cache.lookup(1, "v", "second question about shipping")).result is None
+    assert asyncio.run(cache.lookup(1, "v", "first question about invoices")).result == "r1"
+
+
+def test_npz_round_trip(cache, tmp_path):
+    remember(cache, 1, "v", QUESTION, "answer")
+    remember(cache, 1, "v", OTHER, "sunny")
+    remember(cache, 2, "v", QUESTION, "agent 2 answer")
+    assert asyncio.run(cache.save()) == 2
+    assert sorted(p.name for p in tmp_path.glob("*.npz")) == ["1-v.npz", "2-v.npz"]
+    # nada mudou: o próximo save não regrava
+    assert asyncio.run(cache.save()) == 0
+
+    restored = semantic.SemanticCache()
+    restored.path = tmp_path
+
+    async def scenario():
+        await restored.start()
+        try:
+            return [(await restored.lookup(a, "v", text)).result for a, text in ((1, NEAR), (1, OTHER), (2, QUESTION))]
+        finally:
+            await restored.stop()
+
+    assert asyncio.run(scenario()) == ["answer", "sunny", "agent 2 answer"]
+    assert restored.entries() == 3
+
+
+def test_index_from_another_dimension_is_discarded(cache, tmp_path, monkeypatch):
+    remember(cache, 1, "v", QUESTION, "answer")
+    asyncio.run(cache.save())
+    monkeypatch.setattr(settings, "semantic_cache_dim", settings.semantic_cache_dim * 2)
+    restored = semantic.SemanticCache()
+    restored.path = tmp_path
+    assert restored._load_sync() == {}
+    assert not list(tmp_path.glob("*.npz"))
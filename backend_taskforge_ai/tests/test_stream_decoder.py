@@ -0,0 +1,123 @@
+import itertools
+import json
+import random
+
+import pytest
+
+from app.services import stream_decoder
+from app.services.stream_decoder import (
+    JSONArrayDecoder, NDJSONDecoder, SSEDecoder, decoder_for, gemini_events, payload_events,
+)
+
+# strings com colchetes, aspas escapadas, barra invertida no fim e caracteres de 2, 3 e 4 bytes
+OBJECTS = [
+    {"text": "olá [mundo] {x}", "n": 1},
+    {"text": 'aspas \\"dentro\\" e \\\\', "nested": [[1, 2], {"k": "]"}]},
+    {"text": "😀 日本語 ünï", "ok": True},
+    "só texto",
+    42,
+    None,
+]
+
+
+def decode(decoder, chunks):
+    out = []
+    for chunk in chunks:
+        out += decoder.feed(chunk)
+    return out + decoder.close()
+
+
+def split_at(data: bytes, *cuts):
+    bounds = [0, *cuts, len(data)]
+    return [data[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def sse_body():
+    frames = [f"data: {json.dumps(obj, ensure_ascii=False)}\r\n\r\n" for obj in OBJECTS]
+    return (": keep-alive\n\n" + "event: message\nid: 7\n" + "".join(frames) + "data: [DONE]\n\n").encode()
+
+
+def ndjson_body():
+    return ("\n".join(json.dumps(obj, ensure_ascii=False) for obj in OBJECTS) + "\n\n").encode()
+
+
+def array_body():
+    return ("[" + ",\r\n".join(json.dumps(obj, ensure_ascii=False) for obj in OBJECTS) + "]").encode()
+
+
+CASES = [
+    (SSEDecoder, sse_body(), [*OBJECTS, "[DONE]"]),
+    (NDJSONDecoder, ndjson_body(), OBJECTS),
+    (JSONArrayDecoder, array_body(), OBJECTS),
+]
+
+
+def loads(payloads):
+    # o decoder de array já devolve objetos; os de linha devolvem bytes
+    return [
+        payload if not isinstance(payload, bytes) else payload.decode() if payload == b"[DONE]" else json.loads(payload)
+        for payload in payloads
+    ]
+
+
+@pytest.mark.parametrize("decoder_cls, body, expected", CASES)
+def test_whole_body(decoder_cls, body, expected):
+    payloads = decode(decoder_cls(), [body])
+    assert all(isinstance(p, bytes) for p in payloads) or decoder_cls is JSONArrayDecoder
+    assert loads(payloads) == expected
+
+
+@pytest.mark.parametrize("decoder_cls, body, expected", CASES)
+def test_every_two_cut_split(decoder_cls, body, expected):
+    # todos os pares de cortes: inclui cada posição dentro de caracteres multibyte e de escapes
+    for a, b in itertools.combinations_with_replacement(range(len(body) + 1), 2):
+        assert loads(decode(decoder_cls(), split_at(body, a, b))) == expected, (a, b)
+
+
+@pytest.mark.parametrize("decoder_cls, body, expected", CASES)
+def test_byte_at_a_time_and_random_chunks(decoder_cls, body, expected):
+    assert loads(decode(decoder_cls(), [body[i:i + 1] for i in range(len(body))])) == expected
+    rng = random.Random(7)
+    for _ in range(200):
+        cuts = sorted(rng.sample(range(1, len(body)), rng.randint(1, 12)))
+        assert loads(decode(decoder_cls(), split_at(body, *cuts))) == expected
+
+
+def test_tracked_elements_across_every_split(monkeypatch):
+    # sem re-tentativas: todo elemento cortado passa pelo scanner de colchetes
+    monkeypatch.setattr(stream_decoder, "_RETRY_CHARS", 1)
+    body = array_body()
+    for a, b in itertools.combinations_with_replacement(range(len(body) + 1), 2):
+        assert loads(decode(JSONArrayDecoder(), split_at(body, a, b))) == OBJECTS, (a, b)
+    assert loads(decode(JSONArrayDecoder(), [body[i:i + 1] for i in range(len(body))])) == OBJECTS
+
+
+def test_large_element_split_inside_multibyte_characters():
+    text = "ação 😀 " * 20000
+    body = json.dumps([{"text": text}, {"text": "fim"}], ensure_ascii=False).encode()
+    decoder = JSONArrayDecoder()
+    chunks = [body[i:i + 4093] for i in range(0, len(body), 4093)]
+    assert [p["text"] for p in decode(decoder, chunks)] == [text, "fim"]
+    assert decoder._parts is None
+
+
+def test_decoder_is_reusable_after_close():
+    decoder = JSONArrayDecoder()
+    assert decode(decoder, [b'[{"a": 1}, "x\\']) == [{"a": 1}, b'"x\\']
+    assert decode(decoder, [b'[{"c": "]"}]']) == [{"c": "]"}]
+
+
+def test_truncated_array_element_is_returned_as_is():
+    payloads = decode(JSONArrayDecoder(), [b'[{"a": 1}, {"text": "cort'])
+    assert payloads == [{"a": 1}, b'{"text": "cort']
+    assert [ev.kind for ev in payload_events(payloads[1], gemini_events)] == ["text"]
+
+
+def test_sse_multiline_data_and_unterminated_event():
+    assert decode(SSEDecoder(), [b"data: a\ndata: b\n\ndata:c"]) == [b"a\nb", b"c"]
+
+
+def test_decoder_for_content_type():
+    assert isinstance(decoder_for("text/event-stream; charset=utf-8"), SSEDecoder)
+    assert isinstance(decoder_for("application/json"), JSONArrayDecoder)
+    assert isinstance(decoder_for(None), NDJSONDecoder)